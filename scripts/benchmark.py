@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+"""
+Urban Mobility Bus Agent - Benchmark Suite
+
+Measures the ML service in-process through an ASGI client, and the wall
+time of each training stage. Results are written as JSON; pass a previous
+result as --baseline to flag regressions (the exit code is 1 if any).
+
+Usage:
+    python scripts/benchmark.py --output bench.json
+    python scripts/benchmark.py --baseline bench.json --output bench-new.json
+    python scripts/benchmark.py --skip-training --models-dir models
+"""
+
+from datetime import datetime
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import logging
+
+import numpy as np
+
+try:
+    from . import train_models
+except ImportError:
+    import train_models
+
+logger = logging.getLogger(__name__)
+
+ETA_FIELDS = (
+    'latitude', 'longitude', 'hour', 'minute', 'day_of_week', 'is_weekend', 'weather_condition',
+    'traffic_level', 'route_id', 'distance_km', 'avg_speed', 'occupancy_percentage'
+)
+OCCUPANCY_FIELDS = ('hour', 'minute', 'day_of_week', 'is_weekend', 'weather_condition', 'traffic_level', 'route_id')
+
+# Metrics compared against the baseline, and whether higher is better
+COMPARED_METRICS = {
+    'p50_ms': False,
+    'p95_ms': False,
+    'p99_ms': False,
+    'requests_per_second': True,
+    'seconds': False,
+    'wall_seconds': False,
+    'fit_seconds': False,
+    'cv_seconds': False,
+    'intervals_ms': False
+}
+
+def fleet_requests(num_requests: int, seed: int = 0):
+    """Synthetic ETA and occupancy request bodies drawn like the training data"""
+    columns = train_models.BusAgentMLTrainer.synthetic_columns(np.random.default_rng(seed), num_requests)
+    rows = [
+        {
+            field: (bool(columns[field][i]) if field == 'is_weekend' else
+                    str(columns[field][i]) if field in ('weather_condition', 'traffic_level', 'route_id') else
+                    columns[field][i].item())
+            for field in ETA_FIELDS
+        }
+        for i in range(num_requests)
+    ]
+    occupancy_rows = [{field: row[field] for field in OCCUPANCY_FIELDS} for row in rows]
+    return rows, occupancy_rows
+
+def latency_stats(latencies, elapsed: float, errors: int, rows_per_request: int = 1) -> dict:
+    latencies_ms = np.asarray(latencies) * 1000.0
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'seconds': elapsed,
+        'requests_per_second': len(latencies) / elapsed if elapsed else 0.0,
+        'rows_per_second': len(latencies) * rows_per_request / elapsed if elapsed else 0.0,
+        'mean_ms': float(latencies_ms.mean()) if len(latencies_ms) else 0.0,
+        'p50_ms': float(np.percentile(latencies_ms, 50)) if len(latencies_ms) else 0.0,
+        'p95_ms': float(np.percentile(latencies_ms, 95)) if len(latencies_ms) else 0.0,
+        'p99_ms': float(np.percentile(latencies_ms, 99)) if len(latencies_ms) else 0.0
+    }
+
+async def drive(client, path: str, bodies: list, concurrency: int, num_requests: int, rows_per_request: int = 1) -> dict:
+    """Send num_requests POSTs from `concurrency` concurrent workers"""
+    latencies = []
+    errors = 0
+    next_index = 0
+
+    async def worker():
+        nonlocal errors, next_index
+        while next_index < num_requests:
+            body = bodies[next_index % len(bodies)]
+            next_index += 1
+            started = time.perf_counter()
+            response = await client.post(path, json=body)
+            latencies.append(time.perf_counter() - started)
+            if response.status_code != 200:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latency_stats(latencies, time.perf_counter() - started, errors, rows_per_request)
+
+async def bench_service(models_dir: str, concurrency_levels, num_requests: int, batch_size: int,
+                        eta_cache: bool, warmup: int = 50) -> dict:
+    """Latency and throughput of the prediction endpoints at each concurrency level"""
+    import httpx
+    try:
+        from . import ml_service
+    except ImportError:
+        import ml_service
+
+    # httpx logs every request at INFO, which would be measured too
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    service = ml_service.ml_service
+    service.models_dir = models_dir
+    service.load_models()
+    if not service.ready:
+        raise RuntimeError(f"No models found in {models_dir}")
+    if not eta_cache:
+        service.eta_cache = None
+
+    eta_rows, occupancy_rows = fleet_requests(max(num_requests, batch_size * 4))
+    endpoints = {
+        '/predict/eta': (eta_rows, 1),
+        '/predict/occupancy': (occupancy_rows, 1),
+        '/predict/eta/batch': (
+            [{'requests': eta_rows[i:i + batch_size]} for i in range(0, len(eta_rows) - batch_size + 1, batch_size)],
+            batch_size
+        ),
+        '/predict/occupancy/batch': (
+            [{'requests': occupancy_rows[i:i + batch_size]} for i in range(0, len(occupancy_rows) - batch_size + 1, batch_size)],
+            batch_size
+        )
+    }
+
+    results = {}
+    transport = httpx.ASGITransport(app=ml_service.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+        for path, (bodies, rows_per_request) in endpoints.items():
+            # Batch endpoints carry batch_size rows per request; send fewer of them
+            requests = num_requests if rows_per_request == 1 else max(1, num_requests // rows_per_request * 4)
+            await drive(client, path, bodies, 1, min(warmup, requests), rows_per_request)
+            results[path] = {}
+            for concurrency in concurrency_levels:
+                stats = await drive(client, path, bodies, concurrency, requests, rows_per_request)
+                results[path][str(concurrency)] = stats
+                logger.info(
+                    f"{path} c={concurrency}: p50 {stats['p50_ms']:.2f} ms, p95 {stats['p95_ms']:.2f} ms, "
+                    f"p99 {stats['p99_ms']:.2f} ms, {stats['requests_per_second']:.0f} req/s"
+                    + (f" (errors: {stats['errors']})" if stats['errors'] else "")
+                )
+
+    results['model_version'] = service.eta_model_version
+    results['eta_cache'] = service.eta_cache.stats() if service.eta_cache is not None else {'backend': 'off'}
+    results['intervals'] = bench_intervals(service.bundle)
+    return results
+
+def median_ms(fn, repeats: int) -> float:
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return float(np.median(timings)) * 1000.0
+
+def bench_intervals(bundle, batch_sizes=(1, 64, 1024), repeats: int = 20) -> dict:
+    """Prediction rows with calibrated intervals against plain predictions, per batch size
+
+    per_tree_loop_ms is the naive alternative: every tree's own predict call.
+    """
+    import pandas as pd
+
+    eta_rows, occupancy_rows = fleet_requests(max(batch_sizes), seed=1)
+    models = {
+        'eta': (bundle.eta_ready, bundle.eta_pipeline, eta_rows, bundle.predict_eta_matrix,
+                bundle.predict_eta_rows, bundle.eta_model, bundle.eta_scaler, bundle.eta_calibration),
+        'occupancy': (bundle.occupancy_ready, bundle.occupancy_pipeline, occupancy_rows, bundle.predict_occupancy_matrix,
+                      bundle.predict_occupancy_rows, bundle.occupancy_model, bundle.occupancy_scaler,
+                      bundle.occupancy_calibration)
+    }
+
+    results = {}
+    for name, (ready, pipeline, rows, plain, intervals, model, scaler, calibration) in models.items():
+        if not ready:
+            continue
+        results[name] = {'calibration': calibration.kind if calibration is not None else None}
+        for size in batch_sizes:
+            columns = {field: np.array([row[field] for row in rows[:size]]) for field in rows[0]}
+            features = pipeline.transform(columns)
+            stats = {
+                'plain_ms': median_ms(lambda: plain(features), repeats),
+                'intervals_ms': median_ms(lambda: intervals(features), repeats)
+            }
+            stats['overhead'] = stats['intervals_ms'] / stats['plain_ms'] - 1 if stats['plain_ms'] else 0.0
+            if hasattr(model, 'estimators_') and np.ndim(model.estimators_) == 1:
+                # Named columns, as the scaler was fitted, so sklearn does not warn
+                scaled = scaler.transform(pd.DataFrame(features, columns=pipeline.features))
+                stats['per_tree_loop_ms'] = median_ms(lambda: [tree.predict(scaled) for tree in model.estimators_], repeats)
+            results[name][str(size)] = stats
+            logger.info(
+                f"{name} intervals, {size} rows: {stats['intervals_ms']:.3f} ms vs {stats['plain_ms']:.3f} ms plain "
+                f"({stats['overhead']:+.0%})"
+                + (f", per-tree loop {stats['per_tree_loop_ms']:.3f} ms" if 'per_tree_loop_ms' in stats else "")
+            )
+    return results
+
+def bench_training(num_samples: int, models_dir: str) -> dict:
+    """Wall time of each train_models.train_all stage, plus per-candidate fit and CV"""
+    trainer = train_models.BusAgentMLTrainer(models_dir=models_dir)
+    stages = {}
+    started = time.perf_counter()
+    train_models.train_all(trainer, num_samples=num_samples, timings=stages)
+    total = time.perf_counter() - started
+
+    with open(os.path.join(trainer.version_dir, 'eta_model_timing.json')) as f:
+        selection = json.load(f)
+
+    candidates = {}
+    for name, entry in selection['candidates'].items():
+        holdout = entry['holdout'] or {}
+        candidates[name] = {
+            'status': entry['status'],
+            'fit_seconds': holdout.get('fit_seconds'),
+            'predict_seconds': holdout.get('predict_seconds'),
+            'cv_fold_seconds': [fold['seconds'] for fold in entry['cv_folds']],
+            'cv_seconds': sum(fold['seconds'] for fold in entry['cv_folds'])
+        }
+
+    for stage, seconds in stages.items():
+        logger.info(f"train stage {stage}: {seconds:.2f}s")
+    return {
+        'samples': num_samples,
+        'total': {'seconds': total},
+        'stages': {stage: {'seconds': seconds} for stage, seconds in stages.items()},
+        'eta_selection': {
+            'n_jobs': selection['n_jobs'],
+            'wall_seconds': selection['wall_seconds'],
+            'best_model': selection['best_model'],
+            'candidates': candidates
+        }
+    }
+
+def compare(current: dict, baseline: dict, tolerance: float, path: str = ''):
+    """Yield (metric path, baseline, current, relative change, regressed) for shared metrics"""
+    for key, value in current.items():
+        if key not in baseline:
+            continue
+        here = f"{path}.{key}" if path else key
+        if isinstance(value, dict) and isinstance(baseline[key], dict):
+            yield from compare(value, baseline[key], tolerance, here)
+        elif key in COMPARED_METRICS and isinstance(value, (int, float)) and baseline[key]:
+            change = (value - baseline[key]) / baseline[key]
+            regressed = -change > tolerance if COMPARED_METRICS[key] else change > tolerance
+            yield here, baseline[key], value, change, regressed
+
+def environment() -> dict:
+    import sklearn
+    return {
+        'timestamp': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'sklearn': sklearn.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count()
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the ML service and model training")
+    parser.add_argument('--output', default='benchmark.json', help="Where to write the JSON results")
+    parser.add_argument('--baseline', help="Previous results to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.10, help="Allowed relative slowdown before flagging")
+    parser.add_argument('--models-dir', help="Serve these models instead of the ones trained by the benchmark")
+    parser.add_argument('--concurrency', default='1,8,32,128', help="Comma-separated concurrency levels")
+    parser.add_argument('--requests', type=int, default=2000, help="Requests per endpoint and concurrency level")
+    parser.add_argument('--batch-size', type=int, default=100, help="Rows per batch endpoint request")
+    parser.add_argument('--train-samples', type=int, default=50000, help="Synthetic rows for the training benchmark")
+    parser.add_argument('--skip-training', action='store_true', help="Only benchmark the service")
+    parser.add_argument('--skip-service', action='store_true', help="Only benchmark training")
+    parser.add_argument('--eta-cache', action='store_true', help="Leave the ETA result cache on while measuring")
+    args = parser.parse_args(argv)
+
+    results = {'environment': environment()}
+    with tempfile.TemporaryDirectory(prefix='benchmark-models-') as scratch_dir:
+        models_dir = args.models_dir or scratch_dir
+        if not args.skip_training:
+            results['training'] = bench_training(args.train_samples, scratch_dir)
+        elif not args.models_dir:
+            parser.error("--skip-training needs --models-dir")
+
+        if not args.skip_service:
+            levels = [int(level) for level in args.concurrency.split(',')]
+            results['service'] = asyncio.run(
+                bench_service(models_dir, levels, args.requests, args.batch_size, args.eta_cache)
+            )
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    logger.info(f"Benchmark results written to {args.output}")
+
+    if not args.baseline:
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = 0
+    for metric, before, after, change, regressed in compare(results, baseline, args.tolerance):
+        # Only report changes beyond the noise tolerance
+        if abs(change) <= args.tolerance:
+            continue
+        regressions += regressed
+        print(f"{'REGRESSION' if regressed else 'improved'} {metric}: {before:.3f} -> {after:.3f} ({change:+.1%})")
+    print(f"{regressions} regression(s) beyond {args.tolerance:.0%}")
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+"""
+Urban Mobility Bus Agent - Bulk Scoring
+
+Re-scores historical trips with the published model and reports accuracy.
+Input files are cut into tasks (byte ranges of CSV/JSONL files, row groups
+of Parquet files) that pool workers read, score and write themselves, so
+throughput scales with the number of workers rather than with the parent's
+parsing speed. Each worker loads the model once, memory-mapped.
+
+Outputs, in --output-dir:
+- part-NNNNN.<format>: the input rows plus predicted_<target> (and error,
+  when the label column is present), one part per task
+- summary.json: MAE, RMSE and bias overall, by route, by hour and by
+  route x hour; rewritten as tasks finish
+
+CSV and JSONL files are split on newlines, so quoted fields must not
+contain line breaks.
+
+Usage:
+    python scripts/bulk_score.py trips/*.csv --output-dir scored/
+    python scripts/bulk_score.py trips.parquet --target occupancy --workers 8
+"""
+
+import argparse
+import csv
+import io
+import glob
+import math
+import os
+import sys
+import time
+import logging
+
+import numpy as np
+
+try:
+    from . import model_store
+    from . import stream_training
+    from .feature_pipeline import load_pipeline
+except ImportError:
+    import model_store
+    import stream_training
+    from feature_pipeline import load_pipeline
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+LABELS = {'eta': 'eta_minutes', 'occupancy': 'occupancy_percentage'}
+OUTPUT_FORMATS = ('csv', 'jsonl', 'parquet')
+
+def plan_tasks(paths, chunk_bytes: int):
+    """Split input files into (path, format, start, end) tasks
+
+    For CSV/JSONL, start/end are byte offsets and a task owns the lines that
+    begin inside its range. For Parquet they are a row group index and None.
+    """
+    tasks = []
+    for path in paths:
+        fmt = stream_training.shard_format(path)
+        if fmt == 'parquet':
+            import pyarrow.parquet as pq
+            tasks.extend((path, fmt, group, None) for group in range(pq.ParquetFile(path).num_row_groups))
+            continue
+        size = os.path.getsize(path)
+        for start in range(0, size, chunk_bytes):
+            tasks.append((path, fmt, start, min(start + chunk_bytes, size)))
+    return tasks
+
+def read_line_range(path: str, start: int, end: int, skip_header: bool) -> bytes:
+    """Bytes of the lines that begin in [start, end)"""
+    with open(path, 'rb') as f:
+        if start:
+            # Finish the line that crosses start; it belongs to the previous range
+            f.seek(start - 1)
+            f.readline()
+        elif skip_header:
+            f.readline()
+        position = f.tell()
+        if position >= end:
+            return b""
+        data = f.read(end - position)
+        if not data.endswith(b"\n"):
+            data += f.readline()
+        return data
+
+def read_task(task, csv_header):
+    import pandas as pd
+
+    path, fmt, start, end = task
+    if fmt == 'parquet':
+        import pyarrow.parquet as pq
+        return pq.ParquetFile(path).read_row_group(start).to_pandas()
+    data = read_line_range(path, start, end, skip_header=(fmt == 'csv'))
+    if not data.strip():
+        return pd.DataFrame()
+    if fmt == 'csv':
+        return pd.read_csv(io.BytesIO(data), header=None, names=csv_header[path])
+    return pd.read_json(io.BytesIO(data), lines=True)
+
+def write_part(df, path: str, fmt: str):
+    if fmt == 'csv':
+        df.to_csv(path, index=False)
+    elif fmt == 'jsonl':
+        df.to_json(path, orient='records', lines=True)
+    else:
+        df.to_parquet(path, index=False)
+
+# Per-worker state, set once by _init_worker
+_worker = {}
+
+def _init_worker(version_dir: str, target: str, output_dir: str, output_format: str, csv_header: dict):
+    from threadpoolctl import threadpool_limits
+
+    # One process per core; keep BLAS/OpenMP inside each worker single-threaded
+    _worker['limits'] = threadpool_limits(1)
+    model = model_store.load_artifact(os.path.join(version_dir, f'{target}_model.pkl'), mmap=True)
+    if 'n_jobs' in getattr(model, 'get_params', dict)():
+        model.set_params(n_jobs=1)
+    _worker.update(
+        model=model,
+        scaler=model_store.load_artifact(os.path.join(version_dir, f'{target}_scaler.pkl'), mmap=True),
+        pipeline=load_pipeline(version_dir, target),
+        target=target,
+        output_dir=output_dir,
+        output_format=output_format,
+        csv_header=csv_header
+    )
+
+def predict(model, scaler, pipeline, target: str, df) -> np.ndarray:
+    """Predictions for a DataFrame of raw inputs, as the trainer's predict helpers make them"""
+    import pandas as pd
+
+    features = pipeline.transform(df)
+    if type(scaler).__name__ == 'StandardScaler' and scaler.with_mean and scaler.with_std:
+        scaled = (features - scaler.mean_) / scaler.scale_
+    else:
+        scaled = scaler.transform(pd.DataFrame(features, columns=pipeline.features))
+    values = model.predict(scaled)
+    return np.maximum(1, values) if target == 'eta' else np.clip(values, 0, 100)
+
+def aggregate(df, prediction: np.ndarray, label: str) -> dict:
+    """(route_id, hour) -> [rows, labelled rows, sum |error|, sum error^2, sum error]"""
+    import pandas as pd
+
+    if label in df:
+        error = prediction - df[label].to_numpy(dtype=np.float64)
+    else:
+        error = np.full(len(df), np.nan)
+    labelled = ~np.isnan(error)
+    error = np.where(labelled, error, 0.0)
+    frame = pd.DataFrame({
+        'route_id': df['route_id'].astype(str).to_numpy(),
+        'hour': df['hour'].to_numpy(dtype=np.int64),
+        'rows': 1,
+        'labelled': labelled.astype(np.int64),
+        'abs': np.abs(error),
+        'sq': error * error,
+        'err': error
+    })
+    sums = frame.groupby(['route_id', 'hour'], sort=False).sum()
+    return {(route, int(hour)): values.tolist() for (route, hour), values in zip(sums.index, sums.to_numpy())}
+
+def _score_task(indexed_task):
+    index, task = indexed_task
+    started = time.perf_counter()
+    state = _worker
+    df = read_task(task, state['csv_header'])
+    if df.empty:
+        return index, 0, {}, time.perf_counter() - started
+
+    target, label = state['target'], LABELS[state['target']]
+    prediction = predict(state['model'], state['scaler'], state['pipeline'], target, df)
+    groups = aggregate(df, prediction, label)
+
+    df[f'predicted_{target}'] = prediction
+    if label in df:
+        df['error'] = prediction - df[label]
+    fmt = state['output_format']
+    write_part(df, os.path.join(state['output_dir'], f'part-{index:05d}.{fmt}'), fmt)
+    return index, len(df), groups, time.perf_counter() - started
+
+class AccuracySummary:
+    """Running totals per (route_id, hour), merged from worker results"""
+
+    def __init__(self):
+        self.groups = {}
+
+    def add(self, groups: dict):
+        for key, values in groups.items():
+            totals = self.groups.setdefault(key, [0.0] * 5)
+            for position, value in enumerate(values):
+                totals[position] += value
+
+    @staticmethod
+    def _metrics(totals) -> dict:
+        rows, labelled, abs_sum, sq_sum, err_sum = totals
+        metrics = {'rows': int(rows), 'labelled_rows': int(labelled)}
+        if labelled:
+            metrics.update(mae=abs_sum / labelled, rmse=math.sqrt(sq_sum / labelled), bias=err_sum / labelled)
+        return metrics
+
+    def _rollup(self, key_fn) -> dict:
+        totals = {}
+        for key, values in self.groups.items():
+            merged = totals.setdefault(key_fn(key), [0.0] * 5)
+            for position, value in enumerate(values):
+                merged[position] += value
+        return totals
+
+    def to_dict(self) -> dict:
+        overall = self._rollup(lambda key: 'all').get('all', [0.0] * 5)
+        by_route = self._rollup(lambda key: key[0])
+        by_hour = self._rollup(lambda key: key[1])
+        return {
+            'overall': self._metrics(overall),
+            'by_route': {route: self._metrics(by_route[route]) for route in sorted(by_route)},
+            'by_hour': {str(hour): self._metrics(by_hour[hour]) for hour in sorted(by_hour)},
+            'by_route_hour': [
+                dict(route_id=route, hour=hour, **self._metrics(self.groups[route, hour]))
+                for route, hour in sorted(self.groups)
+            ]
+        }
+
+def bulk_score(paths, output_dir: str, models_dir: str = 'models', target: str = 'eta', workers=None,
+               chunk_mb: float = 32.0, output_format: str = 'csv', summary_every: int = 10) -> dict:
+    """Score every row of the input files and return the accuracy summary"""
+    from multiprocessing import Pool
+
+    version, version_dir = model_store.resolve(models_dir)
+    if not os.path.exists(os.path.join(version_dir, f'{target}_model.pkl')):
+        raise FileNotFoundError(f"{target.capitalize()} model not found in {models_dir}. Please train the model first.")
+
+    os.makedirs(output_dir, exist_ok=True)
+    csv_header = {}
+    for path in paths:
+        if stream_training.shard_format(path) == 'csv':
+            # csv.reader, so quoted column names with commas stay whole
+            with open(path, newline='') as f:
+                csv_header[path] = next(csv.reader(f), [])
+    tasks = plan_tasks(paths, max(1, int(chunk_mb * 1024 * 1024)))
+    workers = workers or os.cpu_count() or 1
+    logger.info(f"Scoring {len(paths)} file(s) as {len(tasks)} task(s) on {workers} worker(s) with model {version}")
+
+    summary = AccuracySummary()
+    summary_path = os.path.join(output_dir, 'summary.json')
+    rows = 0
+    started = time.perf_counter()
+
+    def report(done: int) -> dict:
+        elapsed = time.perf_counter() - started
+        result = {
+            'model_version': version,
+            'target': target,
+            'inputs': list(paths),
+            'tasks_done': done,
+            'tasks_total': len(tasks),
+            'rows': rows,
+            'seconds': elapsed,
+            'rows_per_second': rows / elapsed if elapsed else 0.0,
+            'workers': workers,
+            **summary.to_dict()
+        }
+        model_store.write_json_atomic(summary_path, result)
+        return result
+
+    initargs = (version_dir, target, output_dir, output_format, csv_header)
+    with Pool(workers, initializer=_init_worker, initargs=initargs) as pool:
+        for done, (index, task_rows, groups, seconds) in enumerate(
+                pool.imap_unordered(_score_task, enumerate(tasks)), start=1):
+            rows += task_rows
+            summary.add(groups)
+            logger.info(f"Task {index} scored {task_rows} rows in {seconds:.2f}s ({done}/{len(tasks)})")
+            if done % summary_every == 0:
+                report(done)
+
+    result = report(len(tasks))
+    overall = result['overall']
+    logger.info(
+        f"Scored {rows} rows in {result['seconds']:.1f}s ({result['rows_per_second']:.0f} rows/s)"
+        + (f"; MAE {overall['mae']:.3f}, RMSE {overall['rmse']:.3f}" if 'mae' in overall else "")
+    )
+    return result
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score historical trips in bulk and summarize accuracy")
+    parser.add_argument('inputs', nargs='+', help="CSV, JSONL or Parquet files (globs allowed)")
+    parser.add_argument('--output-dir', default='scored', help="Where to write prediction parts and summary.json")
+    parser.add_argument('--models-dir', default='models', help="Model directory to score with")
+    parser.add_argument('--target', choices=sorted(LABELS), default='eta', help="Model to score")
+    parser.add_argument('--workers', type=int, help="Worker processes (default: CPU count)")
+    parser.add_argument('--chunk-mb', type=float, default=32.0, help="Size of each CSV/JSONL task")
+    parser.add_argument('--output-format', choices=OUTPUT_FORMATS, default='csv', help="Format of the prediction parts")
+    parser.add_argument('--summary-every', type=int, default=10, help="Rewrite summary.json every N tasks")
+    args = parser.parse_args(argv)
+
+    paths = []
+    for pattern in args.inputs:
+        matches = sorted(glob.glob(pattern))
+        if not matches:
+            parser.error(f"No files match {pattern}")
+        paths.extend(matches)
+
+    bulk_score(paths, args.output_dir, args.models_dir, args.target, args.workers,
+               args.chunk_mb, args.output_format, args.summary_every)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
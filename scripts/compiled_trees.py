@@ -0,0 +1,374 @@
+#!/usr/bin/env python3
+"""
+Urban Mobility Bus Agent - Compiled Tree Ensembles
+
+Flattens fitted scikit-learn tree ensembles (random forests, extra trees,
+gradient boosting, single decision trees) into contiguous float32/int32
+arrays and evaluates them with a few vectorized NumPy gathers per tree level.
+This skips sklearn's per-call validation and joblib dispatch, which dominate
+single-row prediction latency.
+
+The same arrays are the compact export format: ``prune`` keeps fewer or
+shallower trees, ``prune_to_tolerance`` picks the smallest cut that stays
+within a holdout accuracy tolerance, and ``save_compressed`` writes one
+compressed .npz file.
+"""
+
+import numpy as np
+import json
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+ARRAYS = ('feature', 'threshold', 'children', 'value', 'roots')
+
+# Rows evaluated per traversal block; keeps the node index matrix cache-sized
+BLOCK_ROWS = 4096
+
+class CompiledTreeEnsemble:
+    """Tree ensemble stored as flat node arrays
+
+    Prediction is ``base + scale * sum(leaf value of each tree)``, which covers
+    both averaging (forests) and additive (boosting) ensembles.
+    """
+
+    def __init__(self, feature, threshold, children, value, roots, max_depth, base, scale, n_features,
+                 averaging=False):
+        self.feature = feature        # int32[n_nodes], split feature (0 for leaves)
+        self.threshold = threshold    # float32[n_nodes], go left when x <= threshold
+        self.children = children      # int32[2 * n_nodes], [right, left] per node; leaves point to themselves
+        self.value = value            # float32[n_nodes], leaf value
+        self.roots = roots            # int32[n_trees], root node of each tree
+        self.max_depth = max_depth
+        self.base = float(base)
+        self.scale = float(scale)
+        self.n_features = n_features
+        self.averaging = bool(averaging)  # scale is 1 / n_trees (forests)
+
+    @property
+    def n_trees(self) -> int:
+        return len(self.roots)
+
+    @property
+    def n_nodes(self) -> int:
+        return len(self.feature)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(array.nbytes for array in (self.feature, self.threshold, self.children, self.value, self.roots))
+
+    @classmethod
+    def from_model(cls, model) -> "CompiledTreeEnsemble":
+        """Compile a fitted sklearn regressor, raising TypeError if unsupported"""
+        trees, base, scale, averaging = _ensemble_trees(model)
+
+        features, thresholds, children, values, roots = [], [], [], [], []
+        offset = 0
+        max_depth = 0
+        for tree in trees:
+            tree_ = tree.tree_
+            n_nodes = tree_.node_count
+            nodes = np.arange(n_nodes)
+            is_leaf = tree_.children_left == -1
+
+            # Leaves loop back to themselves so every row can run max_depth steps
+            left = np.where(is_leaf, nodes, tree_.children_left) + offset
+            right = np.where(is_leaf, nodes, tree_.children_right) + offset
+
+            features.append(np.where(is_leaf, 0, tree_.feature))
+            thresholds.append(_round_down_float32(np.where(is_leaf, np.inf, tree_.threshold)))
+            children.append(np.stack([right, left], axis=1).ravel())
+            values.append(tree_.value[:, 0, 0])
+            roots.append(offset)
+
+            offset += n_nodes
+            max_depth = max(max_depth, tree_.max_depth)
+
+        return cls(
+            feature=np.ascontiguousarray(np.concatenate(features), dtype=np.int32),
+            threshold=np.ascontiguousarray(np.concatenate(thresholds), dtype=np.float32),
+            children=np.ascontiguousarray(np.concatenate(children), dtype=np.int32),
+            value=np.ascontiguousarray(np.concatenate(values), dtype=np.float32),
+            roots=np.asarray(roots, dtype=np.int32),
+            max_depth=max_depth,
+            base=base,
+            scale=scale,
+            n_features=model.n_features_in_,
+            averaging=averaging
+        )
+
+    def prune(self, n_trees: int = None, max_depth: int = None) -> "CompiledTreeEnsemble":
+        """Copy keeping the first ``n_trees`` trees, each cut to ``max_depth`` levels
+
+        Nodes at the depth limit become leaves predicting their own value,
+        which for internal nodes is the mean target of their training rows.
+        Averaging ensembles are rescaled to the trees kept.
+        """
+        n_trees = self.n_trees if n_trees is None else max(1, min(n_trees, self.n_trees))
+        depth_limit = self.max_depth if max_depth is None else max(0, min(max_depth, self.max_depth))
+        end = int(self.roots[n_trees]) if n_trees < self.n_trees else self.n_nodes
+        roots = self.roots[:n_trees]
+
+        # Level of every node reachable within the depth limit, -1 for the rest
+        depth = np.full(end, -1, dtype=np.int32)
+        frontier = roots
+        for level in range(depth_limit + 1):
+            depth[frontier] = level
+            internal = frontier[np.isfinite(self.threshold[frontier])]
+            if level == depth_limit or not len(internal):
+                break
+            frontier = np.concatenate([self.children[2 * internal], self.children[2 * internal + 1]])
+
+        kept = np.flatnonzero(depth >= 0)
+        remap = np.full(end, -1, dtype=np.int64)
+        remap[kept] = np.arange(len(kept))
+        leaf = ~np.isfinite(self.threshold[kept]) | (depth[kept] == depth_limit)
+        children = remap[self.children[:2 * end].reshape(-1, 2)[kept]]
+        children[leaf] = np.arange(len(kept))[leaf, None]
+
+        return CompiledTreeEnsemble(
+            feature=np.ascontiguousarray(np.where(leaf, 0, self.feature[kept]), dtype=np.int32),
+            threshold=np.ascontiguousarray(np.where(leaf, np.float32(np.inf), self.threshold[kept]), dtype=np.float32),
+            children=np.ascontiguousarray(children.ravel(), dtype=np.int32),
+            value=np.ascontiguousarray(self.value[kept], dtype=np.float32),
+            roots=np.asarray(remap[roots], dtype=np.int32),
+            max_depth=int(depth[kept].max()) if len(kept) else 0,
+            base=self.base,
+            scale=1.0 / n_trees if self.averaging else self.scale,
+            n_features=self.n_features,
+            averaging=self.averaging
+        )
+
+    def _meta(self) -> dict:
+        return {
+            'max_depth': self.max_depth,
+            'base': self.base,
+            'scale': self.scale,
+            'n_features': self.n_features,
+            'averaging': self.averaging
+        }
+
+    def save(self, directory: str):
+        """Write the arrays as .npy files so they can be memory-mapped on load"""
+        os.makedirs(directory, exist_ok=True)
+        for name in ARRAYS:
+            np.save(os.path.join(directory, f"{name}.npy"), getattr(self, name))
+        with open(os.path.join(directory, 'engine.json'), 'w') as f:
+            json.dump(self._meta(), f, indent=2)
+
+    def save_compressed(self, path: str):
+        """Write the arrays and metadata to one compressed .npz file
+
+        Compressed files cannot be memory-mapped; they trade a decompression
+        on load for a much smaller artifact.
+        """
+        tmp_path = f"{path}.tmp.{os.getpid()}.npz"
+        np.savez_compressed(tmp_path, meta=np.array(json.dumps(self._meta())),
+                            **{name: getattr(self, name) for name in ARRAYS})
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load_compressed(cls, path: str) -> "CompiledTreeEnsemble":
+        """Load a file written by save_compressed()"""
+        with np.load(path) as data:
+            meta = json.loads(str(data['meta']))
+            return cls(**{name: data[name] for name in ARRAYS}, **meta)
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = True) -> "CompiledTreeEnsemble":
+        """Load arrays written by save(), memory-mapped read-only by default"""
+        with open(os.path.join(directory, 'engine.json')) as f:
+            meta = json.load(f)
+        # asarray drops the memmap subclass but keeps the shared mapping
+        arrays = {
+            name: np.asarray(np.load(os.path.join(directory, f"{name}.npy"), mmap_mode='r' if mmap else None))
+            for name in ARRAYS
+        }
+        return cls(**arrays, **meta)
+
+    def leaf_values(self, X) -> np.ndarray:
+        """Leaf value reached in every tree, shape (n_rows, n_trees)"""
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+
+        out = np.empty((X.shape[0], self.n_trees), dtype=np.float32)
+        for start in range(0, X.shape[0], BLOCK_ROWS):
+            block = X[start:start + BLOCK_ROWS]
+            rows = np.arange(block.shape[0])[:, None]
+            node = np.repeat(self.roots[None, :], block.shape[0], axis=0)
+            for _ in range(self.max_depth):
+                go_left = block[rows, self.feature[node]] <= self.threshold[node]
+                node = self.children[2 * node + go_left]
+            out[start:start + BLOCK_ROWS] = self.value[node]
+        return out
+
+    def predict(self, X) -> np.ndarray:
+        """Predict a batch of rows"""
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1 or X.shape[0] == 1:
+            return np.array([self.predict_one(X)])
+        return self.base + self.scale * self.leaf_values(X).sum(axis=1, dtype=np.float64)
+
+    def predict_one(self, x) -> float:
+        """Predict a single row without building a 2-D node matrix"""
+        x = np.asarray(x, dtype=np.float32).ravel()
+        node = self.roots
+        for _ in range(self.max_depth):
+            node = self.children[2 * node + (x[self.feature[node]] <= self.threshold[node])]
+        return self.base + self.scale * float(self.value[node].sum(dtype=np.float64))
+
+    def predict_spread(self, X):
+        """Mean and standard deviation of the per-tree predictions, from one traversal
+
+        Only averaging ensembles have per-tree predictions; in boosting each
+        tree predicts a correction, so ValueError is raised.
+        """
+        if not self.averaging:
+            raise ValueError("Per-tree spread needs an averaging ensemble (random forest, extra trees)")
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1 or X.shape[0] == 1:
+            # Same gathers as predict_one, keeping the leaf value of every tree
+            x = X.ravel()
+            node = self.roots
+            for _ in range(self.max_depth):
+                node = self.children[2 * node + (x[self.feature[node]] <= self.threshold[node])]
+            leaves = self.value[node][None, :]
+        else:
+            leaves = self.leaf_values(X)
+        mean = leaves.mean(axis=1, dtype=np.float64)
+        std = leaves.std(axis=1, dtype=np.float64)
+        return self.base + mean, std
+
+    def check_parity(self, model, X, atol: float = 1e-3) -> float:
+        """Compare against ``model.predict`` and return the max absolute difference
+
+        Raises ValueError when the difference exceeds ``atol``.
+        """
+        expected = model.predict(X)
+        actual = self.predict(X)
+        max_diff = float(np.max(np.abs(expected - actual))) if len(expected) else 0.0
+        if not max_diff <= atol:
+            raise ValueError(f"Compiled ensemble differs from model.predict by {max_diff:.6f}")
+        return max_diff
+
+def _ensemble_trees(model):
+    """Return (trees, base, scale, averaging) for a supported sklearn regressor"""
+    from sklearn.ensemble import ExtraTreesRegressor, GradientBoostingRegressor, RandomForestRegressor
+    from sklearn.tree import DecisionTreeRegressor
+
+    if isinstance(model, (RandomForestRegressor, ExtraTreesRegressor)):
+        _check_single_output(model)
+        return list(model.estimators_), 0.0, 1.0 / len(model.estimators_), True
+
+    if isinstance(model, GradientBoostingRegressor):
+        _check_single_output(model)
+        init = model.init_
+        if init == 'zero':
+            base = 0.0
+        elif type(init).__name__ == 'DummyRegressor':
+            base = float(np.ravel(init.constant_)[0])
+        else:
+            raise TypeError(f"Unsupported gradient boosting init estimator: {type(init).__name__}")
+        return list(model.estimators_[:, 0]), base, model.learning_rate, False
+
+    if isinstance(model, DecisionTreeRegressor):
+        _check_single_output(model)
+        return [model], 0.0, 1.0, False
+
+    raise TypeError(f"Cannot compile model of type {type(model).__name__}")
+
+def _check_single_output(model):
+    if getattr(model, 'n_outputs_', 1) != 1:
+        raise TypeError("Only single-output regressors can be compiled")
+
+def _round_down_float32(threshold: np.ndarray) -> np.ndarray:
+    """Largest float32 not above each float64 threshold
+
+    sklearn compares float32 features against float64 thresholds, so rounding
+    down keeps ``x <= threshold`` decisions identical for every float32 x.
+    """
+    rounded = threshold.astype(np.float32)
+    too_high = rounded.astype(np.float64) > threshold
+    rounded[too_high] = np.nextafter(rounded[too_high], np.float32(-np.inf))
+    return rounded
+
+# Depth limits and tree-count fractions tried by prune_to_tolerance
+PRUNE_DEPTHS = (32, 24, 20, 16, 14, 12, 10, 8, 6)
+PRUNE_TREE_FRACTIONS = (1.0, 0.75, 0.5, 0.35, 0.25, 0.15, 0.1)
+
+def prune_to_tolerance(engine: CompiledTreeEnsemble, X, y, tolerance: float = 0.01,
+                       depths=PRUNE_DEPTHS, tree_fractions=PRUNE_TREE_FRACTIONS):
+    """Smallest pruned copy whose MAE on (X, y) is within ``tolerance`` of the full ensemble's
+
+    ``tolerance`` is relative, e.g. 0.01 allows a 1% higher MAE. Each depth
+    limit is traversed once; tree counts are then scored from running sums
+    of the per-tree leaf values. Returns (engine, search report).
+    """
+    X = np.asarray(X, dtype=np.float32)
+    y = np.asarray(y, dtype=np.float64)
+    baseline_mae = float(np.mean(np.abs(engine.predict(X) - y)))
+    limit = baseline_mae * (1 + tolerance)
+
+    depth_limits = sorted({depth for depth in depths if depth < engine.max_depth} | {engine.max_depth}, reverse=True)
+    tree_counts = sorted({max(1, int(round(engine.n_trees * fraction))) for fraction in tree_fractions}, reverse=True)
+
+    best = {'max_depth': engine.max_depth, 'n_trees': engine.n_trees, 'n_nodes': engine.n_nodes, 'mae': baseline_mae}
+    candidates = []
+    for depth in depth_limits:
+        pruned = engine.prune(max_depth=depth)
+        running = np.cumsum(pruned.leaf_values(X), axis=1, dtype=np.float64)
+        nodes = np.cumsum(np.diff(np.append(pruned.roots, pruned.n_nodes)))
+        for n_trees in tree_counts:
+            scale = 1.0 / n_trees if engine.averaging else engine.scale
+            mae = float(np.mean(np.abs(engine.base + scale * running[:, n_trees - 1] - y)))
+            candidate = {'max_depth': depth, 'n_trees': n_trees, 'n_nodes': int(nodes[n_trees - 1]), 'mae': mae}
+            candidates.append(candidate)
+            if mae <= limit and candidate['n_nodes'] < best['n_nodes']:
+                best = candidate
+
+    report = {
+        'tolerance': tolerance,
+        'baseline_mae': baseline_mae,
+        'selected': best,
+        'candidates': candidates
+    }
+    return engine.prune(n_trees=best['n_trees'], max_depth=best['max_depth']), report
+
+def compile_model(model, probe_rows: int = 256, seed: int = 0, engine_dir: str = None):
+    """Compile a model and verify it against sklearn, or return None
+
+    When ``engine_dir`` holds arrays exported at training time they are
+    memory-mapped instead of recompiled. Parity is checked on random rows
+    drawn around the standardized feature space the service feeds to the model.
+    """
+    if model is None:
+        return None
+
+    engine = None
+    if engine_dir and os.path.isdir(engine_dir):
+        try:
+            engine = CompiledTreeEnsemble.load(engine_dir)
+        except (OSError, ValueError, TypeError) as e:
+            logger.warning(f"Could not load compiled arrays from {engine_dir}, recompiling: {e}")
+
+    try:
+        if engine is None:
+            engine = CompiledTreeEnsemble.from_model(model)
+    except TypeError as e:
+        logger.info(f"Using sklearn predict: {e}")
+        return None
+
+    probe = np.random.default_rng(seed).normal(0, 1.5, size=(probe_rows, engine.n_features))
+    try:
+        max_diff = engine.check_parity(model, probe)
+    except ValueError as e:
+        logger.warning(f"Compiled model failed parity check, using sklearn predict: {e}")
+        return None
+
+    logger.info(
+        f"Compiled {type(model).__name__}: {engine.n_trees} trees, {engine.n_nodes} nodes, "
+        f"{engine.nbytes / 1024:.0f} KiB, max parity diff {max_diff:.2e}"
+    )
+    return engine
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Urban Mobility Bus Agent - Training Data Cache
+
+Generated datasets and prepared feature matrices, stored under a content
+key: the sha256 of everything that determines them (generator source and
+parameters, row count, seed, feature schema). A rerun with unchanged inputs
+memory-maps the stored arrays instead of rebuilding them.
+
+    .cache/datasets/
+    └── 3f2a9c.../              # sha256 of the key parameters
+        ├── entry.json          # columns, dtypes, categories, bytes
+        ├── latitude.npy        # one memory-mappable array per column
+        ├── route_id.npy        # categorical codes; categories in entry.json
+        └── ...
+
+Entries are written to a temp directory and renamed into place, so readers
+never see a partial entry. Past the size limit, the least recently used
+entries are removed.
+"""
+
+from typing import Dict, Optional
+import hashlib
+import inspect
+import json
+import os
+import shutil
+import time
+import numpy as np
+import logging
+
+try:
+    from .model_store import write_json_atomic
+except ImportError:
+    from model_store import write_json_atomic
+
+logger = logging.getLogger(__name__)
+
+ENTRY = 'entry.json'
+
+def cache_key(**parameters) -> str:
+    """sha256 of the parameters, serialized as sorted JSON"""
+    payload = json.dumps(parameters, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+def source_digest(fn) -> str:
+    """Digest of a function's source, so editing a generator invalidates its entries"""
+    try:
+        source = inspect.getsource(fn)
+    except (OSError, TypeError):
+        source = getattr(fn, '__qualname__', repr(fn))
+    return hashlib.sha256(source.encode()).hexdigest()
+
+class DatasetCache:
+    """Directory of content-addressed array entries with LRU eviction by total size"""
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = int(max_bytes)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+    def get(self, key: str) -> Optional[Dict[str, np.ndarray]]:
+        """Arrays stored under key, memory-mapped read-only, or None"""
+        path = self._path(key)
+        try:
+            with open(os.path.join(path, ENTRY)) as f:
+                entry = json.load(f)
+            arrays = {
+                name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode='r')
+                for name in entry['arrays']
+            }
+        except (FileNotFoundError, ValueError, KeyError):
+            self.misses += 1
+            return None
+
+        # The entry file's mtime is the last use, for eviction
+        os.utime(os.path.join(path, ENTRY))
+        self.hits += 1
+        return arrays
+
+    def put(self, key: str, arrays: Dict[str, np.ndarray], meta: Optional[dict] = None) -> bool:
+        """Store arrays under key; returns False when the entry is over the size limit or cannot be written"""
+        nbytes = sum(np.asarray(array).nbytes for array in arrays.values())
+        if nbytes > self.max_bytes:
+            logger.info(f"Not caching {key[:12]}: {nbytes / 1e6:.1f} MB is over the {self.max_bytes / 1e6:.0f} MB limit")
+            return False
+
+        tmp_path = f"{self._path(key)}.tmp.{os.getpid()}"
+        try:
+            os.makedirs(tmp_path, exist_ok=True)
+            for name, array in arrays.items():
+                np.save(os.path.join(tmp_path, f"{name}.npy"), np.asarray(array))
+            write_json_atomic(os.path.join(tmp_path, ENTRY), {
+                'arrays': list(arrays),
+                'bytes': nbytes,
+                'created_at': time.time(),
+                'meta': meta or {}
+            })
+        except (OSError, ValueError) as e:
+            # Disk full, permissions, arrays np.save cannot store: run uncached
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            logger.warning(f"Could not cache {key[:12]}: {e}")
+            return False
+
+        try:
+            os.rename(tmp_path, self._path(key))
+        except OSError as e:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            if not os.path.isdir(self._path(key)):
+                logger.warning(f"Could not cache {key[:12]}: {e}")
+                return False
+            # Another process stored the same key first; its entry is identical
+        self.evict()
+        return True
+
+    def get_frame(self, key: str):
+        """DataFrame stored by put_frame, its columns backed by the memory-mapped arrays"""
+        import pandas as pd
+
+        arrays = self.get(key)
+        if arrays is None:
+            return None
+        with open(os.path.join(self._path(key), ENTRY)) as f:
+            categories = json.load(f)['meta'].get('categories', {})
+        columns = {
+            name: pd.Categorical.from_codes(array, categories[name]) if name in categories else array
+            for name, array in arrays.items()
+        }
+        logger.info(f"Loaded {len(next(iter(arrays.values()), []))} cached rows ({key[:12]})")
+        return pd.DataFrame(columns, copy=False)
+
+    def put_frame(self, key: str, df) -> bool:
+        """Store a DataFrame, categoricals as codes plus categories"""
+        arrays, categories = {}, {}
+        for column in df.columns:
+            values = df[column]
+            if hasattr(values, 'cat'):
+                arrays[column] = values.cat.codes.to_numpy()
+                categories[column] = [str(category) for category in values.cat.categories]
+            else:
+                arrays[column] = values.to_numpy()
+        return self.put(key, arrays, {'categories': categories})
+
+    def entries(self):
+        """(last used, bytes, key) for every complete entry, oldest first"""
+        entries = []
+        for key in os.listdir(self.directory):
+            entry_path = os.path.join(self.directory, key, ENTRY)
+            if '.tmp.' in key or not os.path.exists(entry_path):
+                continue
+            with open(entry_path) as f:
+                nbytes = json.load(f)['bytes']
+            entries.append((os.path.getmtime(entry_path), nbytes, key))
+        return sorted(entries)
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits its size limit"""
+        entries = self.entries()
+        total = sum(nbytes for _, nbytes, _ in entries)
+        for _, nbytes, key in entries:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(self._path(key), ignore_errors=True)
+            total -= nbytes
+            self.evictions += 1
+            logger.info(f"Evicted cached data {key[:12]} ({nbytes / 1e6:.1f} MB)")
+
+    def stats(self) -> dict:
+        entries = self.entries()
+        return {
+            'directory': self.directory,
+            'entries': len(entries),
+            'bytes': sum(nbytes for _, nbytes, _ in entries),
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions
+        }
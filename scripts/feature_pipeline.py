@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+Urban Mobility Bus Agent - Feature Pipeline
+
+One definition of the model inputs, shared by training and serving:
+- categorical vocabularies are fixed up front and frozen into a schema
+  (``<model>_schema.json``) saved next to each model
+- transforms are NumPy-only and columnar; ``transform`` turns a mapping of
+  raw columns (a dict of arrays or a DataFrame) into a float64 matrix,
+  taking categorical columns either as raw values or as vocabulary codes, and
+  ``transform_record`` builds one row from an object's attributes without
+  intermediate arrays
+
+Derived features:
+- time_of_day = hour + minute / 60 (minute defaults to 0)
+- is_rush_hour = hour in the schema's rush hours
+"""
+
+from typing import Dict, List
+import numpy as np
+import json
+import os
+
+SCHEMA_VERSION = 1
+
+RUSH_HOURS = [7, 8, 9, 17, 18, 19]
+
+WEATHER_CONDITIONS = ['SUNNY', 'CLOUDY', 'RAINY', 'SNOWY']
+TRAFFIC_LEVELS = ['LOW', 'MEDIUM', 'HIGH']
+ROUTE_IDS = [f"ROUTE_{i}" for i in range(1, 10)]
+DAY_TYPES = ['WEEKDAY', 'SATURDAY', 'SUNDAY']
+
+# Encoded feature -> (raw column, vocabulary, value used for unknown inputs)
+CATEGORICAL = {
+    'weather_encoded': ('weather_condition', WEATHER_CONDITIONS, 'SUNNY'),
+    'traffic_encoded': ('traffic_level', TRAFFIC_LEVELS, 'MEDIUM'),
+    'route_encoded': ('route_id', ROUTE_IDS, 'ROUTE_1'),
+    'day_type_encoded': ('day_type', DAY_TYPES, 'WEEKDAY')
+}
+
+# Model inputs, in column order
+ETA_FEATURES = [
+    'latitude', 'longitude', 'hour', 'day_of_week', 'is_weekend',
+    'weather_encoded', 'traffic_encoded', 'route_encoded',
+    'distance_km', 'avg_speed', 'occupancy_percentage',
+    'time_of_day', 'is_rush_hour'
+]
+OCCUPANCY_FEATURES = [
+    'hour', 'day_of_week', 'is_weekend', 'weather_encoded',
+    'traffic_encoded', 'route_encoded', 'time_of_day', 'is_rush_hour'
+]
+DEMAND_FEATURES = [
+    'route_encoded', 'hour', 'day_type_encoded', 'weather_encoded', 'is_rush_hour'
+]
+MODEL_FEATURES = {'eta': ETA_FEATURES, 'occupancy': OCCUPANCY_FEATURES, 'demand': DEMAND_FEATURES}
+
+# Raw inputs that may be omitted, with the value assumed
+OPTIONAL_INPUTS = {'minute': 0}
+
+def day_type(day_of_week) -> np.ndarray:
+    """WEEKDAY, SATURDAY or SUNDAY for day_of_week values (0 = Monday)"""
+    day_of_week = np.asarray(day_of_week)
+    return np.where(day_of_week == 5, 'SATURDAY', np.where(day_of_week == 6, 'SUNDAY', 'WEEKDAY'))
+
+class FeaturePipeline:
+    """Frozen mapping from raw request/telemetry columns to a model's feature matrix"""
+
+    def __init__(self, features: List[str], categorical: Dict[str, dict], rush_hours: List[int]):
+        self.features = list(features)
+        self.categorical = {
+            name: {'source': spec['source'], 'vocabulary': list(spec['vocabulary']), 'default': spec['default']}
+            for name, spec in categorical.items()
+        }
+        self.rush_hours = list(rush_hours)
+
+        # Precompiled lookups: dict codes for single records, sorted arrays for columns
+        self._codes = {}
+        self._sorted = {}
+        for name, spec in self.categorical.items():
+            vocabulary = spec['vocabulary']
+            if spec['default'] not in vocabulary:
+                raise ValueError(f"Default {spec['default']!r} for {name} is not in its vocabulary")
+            codes = {value: code for code, value in enumerate(vocabulary)}
+            order = np.argsort(np.array(vocabulary, dtype=str), kind='stable')
+            self._codes[name] = (codes, codes[spec['default']])
+            self._sorted[name] = (np.array(vocabulary, dtype=str)[order], order, codes[spec['default']])
+        self._rush_set = frozenset(self.rush_hours)
+        self._rush_array = np.array(self.rush_hours)
+
+    @classmethod
+    def for_model(cls, model: str) -> "FeaturePipeline":
+        """Pipeline for 'eta', 'occupancy' or 'demand' with the current vocabularies"""
+        features = MODEL_FEATURES[model]
+        categorical = {
+            name: {'source': source, 'vocabulary': vocabulary, 'default': default}
+            for name, (source, vocabulary, default) in CATEGORICAL.items()
+            if name in features
+        }
+        return cls(features, categorical, RUSH_HOURS)
+
+    @classmethod
+    def legacy(cls, model: str) -> "FeaturePipeline":
+        """Schema implied by models trained before schemas were saved
+
+        Those models were fitted with LabelEncoder, which numbers categories
+        in sorted order.
+        """
+        pipeline = cls.for_model(model)
+        for spec in pipeline.categorical.values():
+            spec['vocabulary'] = sorted(spec['vocabulary'])
+        return cls(pipeline.features, pipeline.categorical, pipeline.rush_hours)
+
+    def to_dict(self) -> dict:
+        return {
+            'schema_version': SCHEMA_VERSION,
+            'features': self.features,
+            'categorical': self.categorical,
+            'rush_hours': self.rush_hours
+        }
+
+    @classmethod
+    def from_dict(cls, schema: dict) -> "FeaturePipeline":
+        if schema.get('schema_version') != SCHEMA_VERSION:
+            raise ValueError(f"Unsupported feature schema version: {schema.get('schema_version')}")
+        return cls(schema['features'], schema['categorical'], schema['rush_hours'])
+
+    def save(self, path: str):
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    @classmethod
+    def load(cls, path: str) -> "FeaturePipeline":
+        with open(path) as f:
+            return cls.from_dict(json.load(f))
+
+    @property
+    def n_features(self) -> int:
+        return len(self.features)
+
+    @property
+    def inputs(self) -> List[str]:
+        """Raw columns read by transform()"""
+        inputs = []
+        for name in self.features:
+            if name == 'time_of_day':
+                needed = ['hour', 'minute']
+            elif name == 'is_rush_hour':
+                needed = ['hour']
+            elif name in self.categorical:
+                needed = [self.categorical[name]['source']]
+            else:
+                needed = [name]
+            inputs.extend(column for column in needed if column not in inputs)
+        return inputs
+
+    def missing_inputs(self, columns) -> List[str]:
+        """Required raw columns absent from a mapping; codes stand in for categorical sources"""
+        return [
+            name for name in self.inputs
+            if name not in columns and name not in OPTIONAL_INPUTS
+            and not any(spec['source'] == name and feature in columns for feature, spec in self.categorical.items())
+        ]
+
+    def vocabulary(self, feature: str) -> List[str]:
+        return self.categorical[feature]['vocabulary']
+
+    def encode(self, feature: str, values) -> np.ndarray:
+        """Vocabulary codes for a column of raw values; unknowns get the default code"""
+        sorted_vocabulary, order, default = self._sorted[feature]
+        values = np.asarray(values).astype(str)
+        position = np.searchsorted(sorted_vocabulary, values)
+        position = np.minimum(position, len(sorted_vocabulary) - 1)
+        found = sorted_vocabulary[position] == values
+        return np.where(found, order[position], default)
+
+    def check_codes(self, feature: str, codes) -> np.ndarray:
+        """Vocabulary codes sent by a client; out-of-range codes get the default code"""
+        codes = np.asarray(codes)
+        if not np.issubdtype(codes.dtype, np.integer):
+            raise ValueError(f"Codes for {feature} must be integers, got {codes.dtype}")
+        return np.where((codes >= 0) & (codes < len(self.vocabulary(feature))), codes, self._codes[feature][1])
+
+    def transform(self, columns) -> np.ndarray:
+        """Feature matrix for a mapping of raw columns (dict of arrays or DataFrame)
+
+        A categorical feature is read from its encoded name (e.g. route_encoded)
+        as vocabulary codes when that column is present, else from its source
+        column as raw values.
+        """
+        hour = np.asarray(columns['hour'], dtype=np.float64)
+        out = np.empty((len(hour), len(self.features)), dtype=np.float64)
+
+        for position, name in enumerate(self.features):
+            if name == 'time_of_day':
+                minute = columns['minute'] if 'minute' in columns else OPTIONAL_INPUTS['minute']
+                out[:, position] = hour + np.asarray(minute, dtype=np.float64) / 60
+            elif name == 'is_rush_hour':
+                out[:, position] = np.isin(hour, self._rush_array)
+            elif name in self.categorical and name in columns:
+                out[:, position] = self.check_codes(name, columns[name])
+            elif name in self.categorical:
+                out[:, position] = self.encode(name, columns[self.categorical[name]['source']])
+            else:
+                out[:, position] = np.asarray(columns[name], dtype=np.float64)
+        return out
+
+    def transform_record(self, record) -> List[float]:
+        """Feature row for one object with the raw fields as attributes"""
+        row = []
+        for name in self.features:
+            if name == 'time_of_day':
+                row.append(record.hour + getattr(record, 'minute', OPTIONAL_INPUTS['minute']) / 60)
+            elif name == 'is_rush_hour':
+                row.append(1.0 if record.hour in self._rush_set else 0.0)
+            elif name in self.categorical:
+                codes, default = self._codes[name]
+                row.append(float(codes.get(getattr(record, self.categorical[name]['source']), default)))
+            else:
+                row.append(float(getattr(record, name)))
+        return row
+
+    def transform_records(self, records) -> np.ndarray:
+        """Feature matrix for a sequence of objects with the raw fields as attributes"""
+        columns = {}
+        for name in self.inputs:
+            if name in OPTIONAL_INPUTS:
+                columns[name] = [getattr(record, name, OPTIONAL_INPUTS[name]) for record in records]
+            else:
+                columns[name] = [getattr(record, name) for record in records]
+        return self.transform(columns)
+
+def schema_path(directory: str, model: str) -> str:
+    return os.path.join(directory, f'{model}_schema.json')
+
+def load_pipeline(directory: str, model: str) -> FeaturePipeline:
+    """Schema saved with a model, or the legacy schema when there is none"""
+    path = schema_path(directory, model)
+    if os.path.exists(path):
+        return FeaturePipeline.load(path)
+    return FeaturePipeline.legacy(model)
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+Urban Mobility Bus Agent - Route Geometry Index
+
+Stop and route geometry for computing distances in the ML service, for a
+whole fleet at once. Each route is a polyline (its shape points, or its stops
+in order) with cumulative along-route distances, and each stop sits at an
+along-route offset. Bus positions are snapped to their route and the
+remaining distance to every downstream stop is the stop's offset minus the
+bus's position, so a fleet x stops matrix is one subtraction.
+
+Snapping projects a position onto candidate segments in a local
+equirectangular frame (accurate to well under a metre over the short
+segments kept here). Candidates come from a KD-tree over the polyline
+vertices on the unit sphere, where chord order matches great-circle order:
+one tree per route, plus one over every route for buses with no route.
+
+Geometry file (JSON); a route's path is optional and defaults to its stops:
+    {"stops": [{"id": "STOP_001", "latitude": 40.7128, "longitude": -74.006}],
+     "routes": [{"id": "ROUTE_1", "stops": ["STOP_001", "STOP_002"],
+                 "path": [[40.7128, -74.006], [40.7589, -73.9851]]}]}
+"""
+
+from typing import List, Optional
+import json
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0088
+
+# Long segments are split so a nearby vertex always bounds the nearest segment
+MAX_SEGMENT_KM = 0.25
+# Vertices looked up per bus; their adjacent segments are the snap candidates
+CANDIDATE_VERTICES = 8
+# A stop this far behind the bus still counts as downstream (at distance 0)
+STOP_TOLERANCE_KM = 0.02
+
+# Demo network, as initialized in server/routes/routes.ts
+DEMO_GEOMETRY = {
+    "stops": [
+        {"id": "STOP_001", "name": "Central Station", "latitude": 40.7128, "longitude": -74.0060},
+        {"id": "STOP_002", "name": "Downtown Terminal", "latitude": 40.7589, "longitude": -73.9851},
+        {"id": "STOP_003", "name": "University Campus", "latitude": 40.7505, "longitude": -73.9934},
+        {"id": "STOP_004", "name": "Shopping Center", "latitude": 40.7614, "longitude": -73.9776}
+    ],
+    "routes": [
+        {"id": "ROUTE_1", "stops": ["STOP_001", "STOP_002"]},
+        {"id": "ROUTE_2", "stops": ["STOP_002", "STOP_003"]},
+        {"id": "ROUTE_3", "stops": ["STOP_002", "STOP_004"]}
+    ]
+}
+
+def haversine_km(lat1, lon1, lat2, lon2) -> np.ndarray:
+    """Great-circle distance in km between positions in degrees; broadcasts"""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(value, dtype=np.float64)) for value in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+def unit_vectors(lat, lon) -> np.ndarray:
+    """(n, 3) points on the unit sphere for positions in degrees"""
+    lat, lon = np.radians(np.asarray(lat, dtype=np.float64)), np.radians(np.asarray(lon, dtype=np.float64))
+    return np.column_stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+
+def densify(points: np.ndarray, max_segment_km: float) -> np.ndarray:
+    """Polyline with points added so no segment is longer than max_segment_km"""
+    parts = [points[:1]]
+    for start, end in zip(points[:-1], points[1:]):
+        pieces = max(1, int(np.ceil(haversine_km(*start, *end) / max_segment_km)))
+        steps = np.arange(1, pieces + 1)[:, None] / pieces
+        parts.append(start + steps * (end - start))
+    return np.concatenate(parts)
+
+class Snap:
+    """Bus positions snapped to routes; every attribute is an array over the buses
+
+    ``route`` is the route code (-1 where no route was found), ``along_km`` the
+    distance from the route's start, ``off_route_km`` the distance from the
+    bus to the snapped point at ``latitude``/``longitude``.
+    """
+
+    def __init__(self, route, along_km, off_route_km, latitude, longitude):
+        self.route = route
+        self.along_km = along_km
+        self.off_route_km = off_route_km
+        self.latitude = latitude
+        self.longitude = longitude
+
+class RouteGeometryIndex:
+    """Routes as densified polylines with along-route stop offsets"""
+
+    def __init__(self, stops: List[dict], routes: List[dict], max_segment_km: float = MAX_SEGMENT_KM):
+        from scipy.spatial import cKDTree
+
+        stop_positions = {stop['id']: (float(stop['latitude']), float(stop['longitude'])) for stop in stops}
+        self.stops = {stop['id']: stop for stop in stops}
+        self.route_ids = [route['id'] for route in routes]
+        self.route_codes = {route_id: code for code, route_id in enumerate(self.route_ids)}
+        if len(self.route_codes) != len(self.route_ids):
+            raise ValueError("Duplicate route ids in geometry")
+
+        # Vertices of every route back to back; a segment runs from each vertex to the next on its route
+        vertices, vertex_route, cumulative, bounds = [], [], [], []
+        for code, route in enumerate(routes):
+            missing = [stop_id for stop_id in route['stops'] if stop_id not in stop_positions]
+            if missing:
+                raise ValueError(f"Route {route['id']} references unknown stops: {', '.join(missing)}")
+            path = route.get('path') or [stop_positions[stop_id] for stop_id in route['stops']]
+            if not path:
+                raise ValueError(f"Route {route['id']} has neither stops nor a path")
+            points = densify(np.asarray(path, dtype=np.float64).reshape(-1, 2), max_segment_km)
+            if len(points) == 1:
+                points = np.repeat(points, 2, axis=0)
+            lengths = haversine_km(points[:-1, 0], points[:-1, 1], points[1:, 0], points[1:, 1])
+            start = sum(len(part) for part in vertices)
+            bounds.append((start, start + len(points)))
+            vertices.append(points)
+            vertex_route.append(np.full(len(points), code))
+            cumulative.append(np.concatenate([[0.0], np.cumsum(lengths)]))
+
+        self.vertices = np.concatenate(vertices)
+        self.vertex_route = np.concatenate(vertex_route)
+        self.cumulative_km = np.concatenate(cumulative)
+        self.route_bounds = np.asarray(bounds, dtype=np.int64)
+        self.route_length_km = np.array([self.cumulative_km[end - 1] for _, end in bounds])
+        # Segment i runs from vertex i to vertex i + 1; the last vertex of a route starts none
+        self.segment_valid = np.ones(len(self.vertices), dtype=bool)
+        self.segment_valid[self.route_bounds[:, 1] - 1] = False
+
+        points = unit_vectors(self.vertices[:, 0], self.vertices[:, 1])
+        self.tree = cKDTree(points)
+        self.route_trees = [cKDTree(points[start:end]) for start, end in bounds]
+
+        # Stops per route, padded to the longest route: along-route offsets and ids
+        width = max((len(route['stops']) for route in routes), default=0)
+        self.stop_offsets_km = np.full((len(routes), width), np.nan)
+        self.stop_ids = np.full((len(routes), width), None, dtype=object)
+        self.stop_counts = np.array([len(route['stops']) for route in routes], dtype=np.int64)
+        for code, route in enumerate(routes):
+            if not route['stops']:
+                continue
+            positions = np.array([stop_positions[stop_id] for stop_id in route['stops']])
+            snapped = self.snap(positions[:, 0], positions[:, 1], np.full(len(positions), code))
+            self.stop_offsets_km[code, :len(positions)] = snapped.along_km
+            self.stop_ids[code, :len(positions)] = route['stops']
+
+    @classmethod
+    def from_dict(cls, geometry: dict, **kwargs) -> "RouteGeometryIndex":
+        return cls(geometry['stops'], geometry['routes'], **kwargs)
+
+    @classmethod
+    def load(cls, path: Optional[str] = None, **kwargs) -> "RouteGeometryIndex":
+        """Index a geometry file, or the demo network when no path is given"""
+        if not path:
+            return cls.from_dict(DEMO_GEOMETRY, **kwargs)
+        with open(path) as f:
+            return cls.from_dict(json.load(f), **kwargs)
+
+    def route_code(self, route_id) -> int:
+        """Code of a route id, or -1 if unknown"""
+        return self.route_codes.get(route_id, -1)
+
+    def _candidates(self, points: np.ndarray, route: int) -> np.ndarray:
+        """(n, 2k) segment indexes near each point, -1 where there is none"""
+        if route < 0:
+            tree, offset = self.tree, 0
+        else:
+            tree, offset = self.route_trees[route], self.route_bounds[route, 0]
+        k = min(CANDIDATE_VERTICES, tree.n)
+        _, nearest = tree.query(points, k=k)
+        nearest = nearest.reshape(len(points), k) + offset
+        # Segments starting and ending at each nearby vertex
+        candidates = np.concatenate([nearest, nearest - 1], axis=1)
+        inside = (candidates >= 0) & self.segment_valid[np.maximum(candidates, 0)]
+        return np.where(inside, candidates, -1)
+
+    def _project(self, lat: np.ndarray, lon: np.ndarray, candidates: np.ndarray):
+        """Nearest point on each row's candidate segments: (segment, t, off-route km)"""
+        valid = candidates >= 0
+        segment = np.maximum(candidates, 0)
+        lat_a, lon_a = self.vertices[segment, 0], self.vertices[segment, 1]
+        lat_b, lon_b = self.vertices[segment + 1, 0], self.vertices[segment + 1, 1]
+
+        # Local equirectangular frame at the segment, in km
+        km_per_degree = np.radians(1.0) * EARTH_RADIUS_KM
+        x_scale = km_per_degree * np.cos(np.radians((lat_a + lat_b) / 2))
+        bx, by = (lon_b - lon_a) * x_scale, (lat_b - lat_a) * km_per_degree
+        px, py = (lon[:, None] - lon_a) * x_scale, (lat[:, None] - lat_a) * km_per_degree
+        length2 = bx * bx + by * by
+        t = np.clip(np.divide(px * bx + py * by, length2, out=np.zeros_like(length2), where=length2 > 0), 0.0, 1.0)
+        off = np.where(valid, np.hypot(px - t * bx, py - t * by), np.inf)
+
+        best = off.argmin(axis=1)
+        rows = np.arange(len(lat))
+        return candidates[rows, best], t[rows, best], off[rows, best]
+
+    def snap(self, lat, lon, routes=None) -> Snap:
+        """Snap positions (degrees) to the given route codes, or to the nearest route where -1 or None"""
+        lat, lon = np.asarray(lat, dtype=np.float64), np.asarray(lon, dtype=np.float64)
+        routes = np.full(len(lat), -1, dtype=np.int64) if routes is None else np.asarray(routes, dtype=np.int64)
+        segment = np.full(len(lat), -1, dtype=np.int64)
+        t = np.zeros(len(lat))
+        off = np.full(len(lat), np.inf)
+
+        # One vectorized KD-tree query and projection per route present in the batch
+        points = unit_vectors(lat, lon)
+        for route in np.unique(routes):
+            rows = np.flatnonzero(routes == route)
+            if route >= len(self.route_ids) or not len(self.vertices):
+                continue
+            segment[rows], t[rows], off[rows] = self._project(lat[rows], lon[rows], self._candidates(points[rows], route))
+
+        found = segment >= 0
+        segment = np.maximum(segment, 0)
+        start, end = self.vertices[segment], self.vertices[segment + found]
+        along = self.cumulative_km[segment] + t * (self.cumulative_km[segment + found] - self.cumulative_km[segment])
+        return Snap(
+            route=np.where(found, self.vertex_route[segment], -1),
+            along_km=np.where(found, along, np.nan),
+            off_route_km=np.where(found, off, np.nan),
+            latitude=np.where(found, start[:, 0] + t * (end[:, 0] - start[:, 0]), np.nan),
+            longitude=np.where(found, start[:, 1] + t * (end[:, 1] - start[:, 1]), np.nan)
+        )
+
+    def downstream(self, snap: Snap) -> np.ndarray:
+        """(buses, stops) remaining along-route km to each stop of the bus's route
+
+        Columns follow ``stop_ids[snap.route]``; passed stops, padding and
+        buses without a route are NaN.
+        """
+        route = np.maximum(snap.route, 0)
+        remaining = self.stop_offsets_km[route] - snap.along_km[:, None]
+        remaining[snap.route < 0] = np.nan
+        with np.errstate(invalid='ignore'):
+            remaining[remaining < -STOP_TOLERANCE_KM] = np.nan
+        return np.maximum(remaining, 0.0)
+
+    def stats(self) -> dict:
+        """Index size"""
+        return {
+            "routes": len(self.route_ids),
+            "stops": len(self.stops),
+            "vertices": int(len(self.vertices)),
+            "route_length_km": {route_id: float(length) for route_id, length in zip(self.route_ids, self.route_length_km)}
+        }
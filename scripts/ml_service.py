@@ -8,30 +8,158 @@ FastAPI service for ML model predictions including:
 - Demand forecasting
 """
 
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from typing import List, Optional
-import joblib
+import time
+
+# Startup timings are measured from here, so they include the imports below
+STARTUP_STARTED = time.perf_counter()
+
+from fastapi import FastAPI, Header, HTTPException, Request
+from fastapi.exceptions import RequestValidationError
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from pydantic import BaseModel, ConfigDict, ValidationError
+from starlette.requests import ClientDisconnect
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional
+from collections import OrderedDict
+from concurrent.futures import Executor, ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager
+import asyncio
+import hmac
+import json
 import numpy as np
 import os
+import threading
 import logging
-from datetime import datetime
+from datetime import datetime, timedelta
+
+try:
+    from . import geo_index
+    from . import model_store
+    from . import profiler
+    from . import service_metrics
+    from . import wire_format
+    from .compiled_trees import CompiledTreeEnsemble, compile_model
+    from .feature_pipeline import FeaturePipeline, OPTIONAL_INPUTS, RUSH_HOURS, day_type, load_pipeline
+    from .result_cache import ETACacheKeyer, make_cache, parse_buckets
+    from .uncertainty import IntervalCalibration, calibration_path
+except ImportError:
+    import geo_index
+    import model_store
+    import profiler
+    import service_metrics
+    import wire_format
+    from compiled_trees import CompiledTreeEnsemble, compile_model
+    from feature_pipeline import FeaturePipeline, OPTIONAL_INPUTS, RUSH_HOURS, day_type, load_pipeline
+    from result_cache import ETACacheKeyer, make_cache, parse_buckets
+    from uncertainty import IntervalCalibration, calibration_path
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Upper bound on items accepted by the batch endpoints
+MAX_BATCH_SIZE = int(os.environ.get("ML_MAX_BATCH_SIZE", "10000"))
+
+# Upper bound on rows in one columnar (binary) batch
+MAX_COLUMNAR_ROWS = int(os.environ.get("ML_MAX_COLUMNAR_ROWS", "1000000"))
+
+# Streaming endpoints score NDJSON input this many records at a time;
+# longer lines are rejected so one record cannot grow the buffer unbounded
+STREAM_CHUNK_SIZE = int(os.environ.get("ML_STREAM_CHUNK_SIZE", "500"))
+STREAM_MAX_LINE_BYTES = int(os.environ.get("ML_STREAM_MAX_LINE_BYTES", "65536"))
+
+# Micro-batching: concurrent single predictions wait at most BATCH_WINDOW_MS
+# (or until BATCH_MAX_SIZE rows are queued) and run as one vectorized predict
+BATCH_WINDOW_MS = float(os.environ.get("ML_BATCH_WINDOW_MS", "2"))
+BATCH_MAX_SIZE = int(os.environ.get("ML_BATCH_MAX_SIZE", "64"))
+INFERENCE_WORKERS = int(os.environ.get("ML_INFERENCE_WORKERS", "2"))
+
+# Memory-map model arrays so workers share them through the page cache
+MMAP_MODELS = os.environ.get("ML_MMAP_MODELS", "1") == "1"
+
+# Evaluate tree ensembles with the flat-array engine instead of sklearn
+COMPILED_TREES = os.environ.get("ML_COMPILED_TREES", "1") == "1"
+# Above this many rows sklearn's Cython traversal is faster than NumPy gathers
+COMPILED_MAX_ROWS = int(os.environ.get("ML_COMPILED_MAX_ROWS", "128"))
+# Serve the pruned <name>_compact.npz exports instead of the full .pkl models
+COMPACT_MODELS = os.environ.get("ML_COMPACT_MODELS", "0") == "1"
+
+# ETA result cache: backend is memory, redis, fakeredis or off; numeric
+# request fields are snapped to ML_ETA_CACHE_BUCKETS widths before keying
+ETA_CACHE_BACKEND = os.environ.get("ML_ETA_CACHE", "memory")
+ETA_CACHE_TTL = float(os.environ.get("ML_ETA_CACHE_TTL", "30"))
+ETA_CACHE_SIZE = int(os.environ.get("ML_ETA_CACHE_SIZE", "100000"))
+ETA_CACHE_BUCKETS = os.environ.get("ML_ETA_CACHE_BUCKETS", "")
+REDIS_URL = os.environ.get("ML_REDIS_URL", "redis://localhost:6379/0")
+
+# Concurrent requests with the same feature row share one model computation
+SINGLE_FLIGHT = os.environ.get("ML_SINGLE_FLIGHT", "1") == "1"
+
+# Serve p10/p90 bounds and confidence calibrated at training time
+# (<name>_calibration.json); without a calibration, responses carry no
+# bounds and the fixed DEFAULT_CONFIDENCE
+PREDICTION_INTERVALS = os.environ.get("ML_PREDICTION_INTERVALS", "1") == "1"
+DEFAULT_CONFIDENCE = {'eta': 0.85, 'occupancy': 0.80}
+
+# Precompute every occupancy prediction into a dense lookup table on load
+OCCUPANCY_TABLE = os.environ.get("ML_OCCUPANCY_TABLE", "1") == "1"
+
+# Route/stop geometry JSON for /routes/distances (see geo_index.py); empty
+# indexes the demo network from server/routes/routes.ts
+ROUTE_GEOMETRY = os.environ.get("ML_ROUTE_GEOMETRY", "")
+
+# ETA board: buses not pinged for this many seconds drop off (0 keeps them)
+ETA_BOARD_TTL = float(os.environ.get("ML_ETA_BOARD_TTL", "300"))
+
+# /debug/profile is only served when an admin token is configured; callers
+# send it in the X-Admin-Token header
+ADMIN_TOKEN = os.environ.get("ML_ADMIN_TOKEN", "")
+PROFILE_MAX_SECONDS = float(os.environ.get("ML_PROFILE_MAX_SECONDS", "120"))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start listening immediately and load models in the background"""
+    ml_service.startup_phases['import_to_startup_ms'] = (time.perf_counter() - STARTUP_STARTED) * 1000.0
+    loader = asyncio.create_task(ml_service.load_models_in_background())
+    yield
+    loader.cancel()
+    ml_service.executor.shutdown(wait=False)
+
 app = FastAPI(
     title="Urban Mobility Bus Agent ML Service",
     description="ML service for bus ETA prediction and occupancy estimation",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
+app.add_middleware(service_metrics.MetricsMiddleware)
+
+request_profiler = profiler.Profiler()
+# Without a token the profiler middleware is not installed at all
+if ADMIN_TOKEN:
+    app.add_middleware(profiler.ProfilingMiddleware, profiler=request_profiler, exclude_paths=["/debug/profile"])
+
+@app.exception_handler(RequestValidationError)
+async def request_validation_error(request: Request, exc: RequestValidationError):
+    """FastAPI's 422 response, with rejected NaN/Infinity inputs echoed as strings
+    
+    JSON has no NaN or Infinity, so the default handler fails to render them.
+    """
+    errors = [
+        dict(err, input=str(err['input'])) if isinstance(err.get('input'), float) and not np.isfinite(err['input']) else err
+        for err in exc.errors()
+    ]
+    return JSONResponse(status_code=422, content={"detail": jsonable_encoder(errors)})
 
 # Pydantic models for API requests/responses
 class ETAPredictionRequest(BaseModel):
+    # NaN and +-Infinity are valid JSON floats to Python but not valid positions or speeds
+    model_config = ConfigDict(allow_inf_nan=False)
+    
     latitude: float
     longitude: float
     hour: int
+    minute: int = 0
     day_of_week: int
     is_weekend: bool
     weather_condition: str
@@ -44,11 +172,14 @@ class ETAPredictionRequest(BaseModel):
 class ETAPredictionResponse(BaseModel):
     eta_minutes: float
     confidence: float
+    eta_p10_minutes: Optional[float] = None
+    eta_p90_minutes: Optional[float] = None
     factors: List[dict]
     timestamp: datetime
 
 class OccupancyPredictionRequest(BaseModel):
     hour: int
+    minute: int = 0
     day_of_week: int
     is_weekend: bool
     weather_condition: str
@@ -58,6 +189,175 @@ class OccupancyPredictionRequest(BaseModel):
 class OccupancyPredictionResponse(BaseModel):
     occupancy_percentage: float
     confidence: float
+    occupancy_p10: Optional[float] = None
+    occupancy_p90: Optional[float] = None
+    timestamp: datetime
+
+class ETABatchPredictionRequest(BaseModel):
+    # Items are validated one by one so a bad item does not reject the batch
+    requests: List[dict]
+
+class ETABatchPredictionItem(BaseModel):
+    index: int
+    eta_minutes: Optional[float] = None
+    confidence: Optional[float] = None
+    eta_p10_minutes: Optional[float] = None
+    eta_p90_minutes: Optional[float] = None
+    factors: List[dict] = []
+    error: Optional[str] = None
+
+class ETABatchPredictionResponse(BaseModel):
+    predictions: List[ETABatchPredictionItem]
+    succeeded: int
+    failed: int
+    timestamp: datetime
+
+class OccupancyBatchPredictionRequest(BaseModel):
+    requests: List[dict]
+
+class OccupancyBatchPredictionItem(BaseModel):
+    index: int
+    occupancy_percentage: Optional[float] = None
+    confidence: Optional[float] = None
+    occupancy_p10: Optional[float] = None
+    occupancy_p90: Optional[float] = None
+    error: Optional[str] = None
+
+class OccupancyBatchPredictionResponse(BaseModel):
+    predictions: List[OccupancyBatchPredictionItem]
+    succeeded: int
+    failed: int
+    timestamp: datetime
+
+class DemandPredictionRequest(BaseModel):
+    route_id: str
+    hour: int
+    # Either the day type (WEEKDAY, SATURDAY, SUNDAY) or a day of week to derive it from
+    day_of_week: Optional[int] = None
+    day_type: Optional[str] = None
+    weather_condition: str
+
+class DemandPredictionResponse(BaseModel):
+    route_id: str
+    hour: int
+    day_type: str
+    weather_condition: str
+    passengers_per_hour: float
+    model_version: Optional[str] = None
+    timestamp: datetime
+
+class DemandRouteDayResponse(BaseModel):
+    route_id: str
+    day_type: str
+    weather_condition: str
+    hourly: List[float]
+    total: float
+    peak_hour: int
+    model_version: Optional[str] = None
+    timestamp: datetime
+
+class DemandForecastResponse(BaseModel):
+    start: datetime
+    hours: List[datetime]
+    weather_condition: str
+    routes: Dict[str, List[float]]
+    model_version: Optional[str] = None
+    timestamp: datetime
+
+class BusPosition(BaseModel):
+    bus_id: Optional[str] = None
+    latitude: float
+    longitude: float
+    # Without a route the bus is snapped to the nearest one
+    route_id: Optional[str] = None
+
+class RouteDistanceRequest(BaseModel):
+    buses: List[BusPosition]
+
+class StopDistance(BaseModel):
+    stop_id: str
+    distance_km: float
+
+class BusRouteDistances(BaseModel):
+    index: int
+    bus_id: Optional[str] = None
+    route_id: Optional[str] = None
+    along_km: Optional[float] = None
+    off_route_km: Optional[float] = None
+    stops: List[StopDistance] = []
+    error: Optional[str] = None
+
+class RouteDistanceResponse(BaseModel):
+    buses: List[BusRouteDistances]
+    timestamp: datetime
+
+class BusPing(BaseModel):
+    bus_id: str
+    latitude: float
+    longitude: float
+    # Without a route the bus is snapped to the nearest one
+    route_id: Optional[str] = None
+    avg_speed: float
+    occupancy_percentage: float
+    weather_condition: str = 'SUNNY'
+    traffic_level: str = 'MEDIUM'
+    # Time of the GPS fix; defaults to when the ping is received
+    timestamp: Optional[datetime] = None
+
+class BoardUpdateRequest(BaseModel):
+    pings: List[BusPing]
+
+class BoardUpdateItem(BaseModel):
+    index: int
+    bus_id: str
+    route_id: Optional[str] = None
+    stops: int = 0
+    error: Optional[str] = None
+
+class BoardUpdateResponse(BaseModel):
+    updated: List[BoardUpdateItem]
+    succeeded: int
+    failed: int
+    model_version: Optional[str] = None
+    timestamp: datetime
+
+class StopETA(BaseModel):
+    stop_id: str
+    distance_km: float
+    # Minutes from now to the arrival predicted at the bus's last ping
+    eta_minutes: float
+    predicted_arrival: datetime
+    confidence: float
+    eta_p10_minutes: Optional[float] = None
+    eta_p90_minutes: Optional[float] = None
+
+class BusBoard(BaseModel):
+    bus_id: str
+    along_km: float
+    updated_at: datetime
+    model_version: Optional[str] = None
+    stops: List[StopETA]
+
+class RouteBoardResponse(BaseModel):
+    route_id: str
+    buses: List[BusBoard]
+    timestamp: datetime
+
+class StopArrival(BaseModel):
+    bus_id: str
+    route_id: str
+    distance_km: float
+    eta_minutes: float
+    predicted_arrival: datetime
+    confidence: float
+    eta_p10_minutes: Optional[float] = None
+    eta_p90_minutes: Optional[float] = None
+    updated_at: datetime
+
+class StopBoardResponse(BaseModel):
+    stop_id: str
+    # Soonest first
+    arrivals: List[StopArrival]
     timestamp: datetime
 
 class HealthResponse(BaseModel):
@@ -65,120 +365,986 @@ class HealthResponse(BaseModel):
     models_loaded: bool
     timestamp: datetime
 
-class MLService:
-    def __init__(self, models_dir="models"):
-        self.models_dir = models_dir
+class ReadinessResponse(BaseModel):
+    ready: bool
+    version: Optional[str] = None
+    startup_phases: dict
+    error: Optional[str] = None
+    timestamp: datetime
+
+class MicroBatcher:
+    """Coalesce concurrent single-row predictions into vectorized batches
+    
+    Each row is queued with the model bundle its features were encoded by,
+    and predicted by that bundle as predict_fn(bundle, features), so rows
+    queued across a model reload never reach the other bundle's model.
+    """
+    
+    def __init__(self, predict_fn: Callable[['ModelBundle', np.ndarray], np.ndarray], executor: Executor, model: str,
+                 window_ms: float = BATCH_WINDOW_MS, max_batch_size: int = BATCH_MAX_SIZE,
+                 max_in_flight: int = INFERENCE_WORKERS):
+        self.predict_fn = predict_fn
+        self.executor = executor
+        self.model = model
+        self.window = window_ms / 1000.0
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_in_flight = max(1, max_in_flight)
+        self.batches_run = 0
+        self.rows_run = 0
+        self._loop = None
+        self._queue = None
+        self._slots = None
+        self._collector = None
+    
+    def _ensure_started(self):
+        """Start the collector task on the running event loop"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._collector is None or self._collector.done():
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._slots = asyncio.Semaphore(self.max_in_flight)
+            self._collector = loop.create_task(self._collect())
+    
+    async def submit(self, bundle: 'ModelBundle', features: list):
+        """Queue one feature row and wait for its prediction (a row of predict_fn's output)"""
+        self._ensure_started()
+        future = self._loop.create_future()
+        self._queue.put_nowait((bundle, features, future))
+        return await future
+    
+    async def _collect(self):
+        """Gather queued rows into batches until the window or size limit is hit"""
+        while True:
+            batch = [await self._queue.get()]
+            deadline = self._loop.time() + self.window
+            while len(batch) < self.max_batch_size:
+                if not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                    continue
+                timeout = deadline - self._loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            
+            # One batch per bundle; there is only more than one around a reload
+            groups = {}
+            for bundle, features, future in batch:
+                groups.setdefault(bundle, []).append((features, future))
+            for bundle, rows in groups.items():
+                # Bound the number of batches running on the executor at once
+                await self._slots.acquire()
+                self._loop.create_task(self._dispatch(bundle, rows))
+    
+    async def _dispatch(self, bundle: 'ModelBundle', batch):
+        """Run one batch on the executor and resolve its waiters"""
+        try:
+            with service_metrics.stage(self.model, 'feature_build'):
+                features = np.array([features for features, _ in batch], dtype=np.float64)
+            predictions = await self._loop.run_in_executor(self.executor, self.predict_fn, bundle, features)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            self._slots.release()
+        
+        self.batches_run += 1
+        self.rows_run += len(batch)
+        for (_, future), prediction in zip(batch, predictions.tolist()):
+            if not future.done():
+                future.set_result(prediction)
+    
+    def stats(self) -> dict:
+        """Batching configuration and counters"""
+        return {
+            "window_ms": self.window * 1000.0,
+            "max_batch_size": self.max_batch_size,
+            "batches_run": self.batches_run,
+            "rows_run": self.rows_run,
+            "avg_batch_size": self.rows_run / self.batches_run if self.batches_run else 0.0
+        }
+
+class SingleFlight:
+    """Share one in-flight computation between concurrent calls with the same key
+    
+    Unlike a cache, a result is only shared while it is being computed; the
+    entry is dropped as soon as the computation finishes. The computation runs
+    as its own task so a caller that disconnects does not cancel it for the
+    others.
+    """
+    
+    def __init__(self, model: str):
+        self.model = model
+        self.computations = 0
+        self.coalesced = 0
+        self._in_flight = {}
+        self._coalesced_metric = service_metrics.COALESCED.labels(model)
+    
+    async def run(self, key, compute: Callable[[], Awaitable[float]]) -> float:
+        """Result of compute(), or of the identical computation already running"""
+        task = self._in_flight.get(key)
+        if task is not None:
+            self.coalesced += 1
+            self._coalesced_metric.inc()
+        else:
+            task = asyncio.get_running_loop().create_task(compute())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+            self.computations += 1
+        return await asyncio.shield(task)
+    
+    def _finish(self, key, task):
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        # Mark the exception retrieved in case every waiter went away
+        if not task.cancelled():
+            task.exception()
+    
+    def stats(self) -> dict:
+        return {
+            "computations": self.computations,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._in_flight)
+        }
+
+class OccupancyTable:
+    """Occupancy predictions for every encodable input at minute 0, as one dense array
+    
+    Axes are hour, day_of_week, is_weekend, weather, traffic and route code,
+    then the prediction row (occupancy, p10, p90, confidence). ``positions``
+    locates the six inputs in the occupancy feature row.
+    """
+    
+    AXES = ('hour', 'day_of_week', 'is_weekend', 'weather_encoded', 'traffic_encoded', 'route_encoded')
+    
+    def __init__(self, values: np.ndarray, positions: tuple, time_position: Optional[int], build_seconds: float):
+        self.values = values
+        self.positions = list(positions)
+        self.time_position = time_position
+        self.build_seconds = build_seconds
+    
+    @classmethod
+    def build(cls, predict_rows: Callable[[np.ndarray], np.ndarray], pipeline: FeaturePipeline) -> "OccupancyTable":
+        """Evaluate the model over the whole grid in one vectorized call"""
+        started = time.perf_counter()
+        shape = (24, 7, 2) + tuple(len(pipeline.vocabulary(name)) for name in cls.AXES[3:])
+        grid = np.indices(shape).reshape(len(shape), -1)
+        
+        # Raw columns for every cell; categorical axes index the vocabularies
+        columns = {'hour': grid[0], 'day_of_week': grid[1], 'is_weekend': grid[2], 'minute': 0}
+        for axis, name in zip(grid[3:], cls.AXES[3:]):
+            columns[pipeline.categorical[name]['source']] = np.array(pipeline.vocabulary(name))[axis]
+        
+        features = pipeline.transform(columns)
+        rows = predict_rows(features)
+        values = rows.astype(np.float32).reshape(shape + rows.shape[1:])
+        positions = tuple(pipeline.features.index(name) for name in cls.AXES)
+        time_position = pipeline.features.index('time_of_day') if 'time_of_day' in pipeline.features else None
+        return cls(values, positions, time_position, time.perf_counter() - started)
+    
+    @property
+    def grid_shape(self) -> tuple:
+        return self.values.shape[:len(self.positions)]
+    
+    def lookup(self, features: np.ndarray):
+        """Look up occupancy feature rows, returning (prediction rows, found mask)"""
+        keys = features[:, self.positions]
+        index = keys.astype(np.int64)
+        found = (
+            (keys == index).all(axis=1)
+            & (index >= 0).all(axis=1)
+            & (index < self.grid_shape).all(axis=1)
+        )
+        if self.time_position is not None:
+            found &= features[:, self.time_position] == keys[:, 0]  # minute 0
+        values = np.zeros((len(features),) + self.values.shape[len(self.positions):], dtype=np.float64)
+        values[found] = self.values[tuple(index[found].T)]
+        return values, found
+    
+    def lookup_one(self, features: list) -> Optional[list]:
+        """Look up a single occupancy feature row's prediction row, or None if off the grid"""
+        keys = [features[position] for position in self.positions]
+        if self.time_position is not None and features[self.time_position] != keys[0]:
+            return None
+        if all(key == int(key) and 0 <= key < size for key, size in zip(keys, self.grid_shape)):
+            return self.values[tuple(int(key) for key in keys)].tolist()
+        return None
+    
+    def stats(self) -> dict:
+        """Table size and build cost"""
+        return {
+            "cells": int(np.prod(self.grid_shape)),
+            "nbytes": int(self.values.nbytes),
+            "build_ms": self.build_seconds * 1000.0
+        }
+
+class DemandGrid:
+    """Demand forecasts for every route, hour, day type and weather, as one dense array
+    
+    Axes follow AXES; ``labels`` holds the raw value of each position on the
+    categorical axes. Single cells, a route's day and the whole network are
+    all slices of ``values``, and the full grid's JSON body is rendered once.
+    """
+    
+    AXES = ('route_encoded', 'hour', 'day_type_encoded', 'weather_encoded')
+    
+    def __init__(self, values: np.ndarray, labels: dict, version: Optional[str], build_seconds: float):
+        self.values = values
+        self.labels = labels
+        self.version = version
+        self.build_seconds = build_seconds
+        self._codes = {axis: {value: code for code, value in enumerate(vocabulary)} for axis, vocabulary in labels.items()}
+        self._body = None
+    
+    @classmethod
+    def build(cls, predict_matrix: Callable[[np.ndarray], np.ndarray], pipeline: FeaturePipeline,
+              version: Optional[str] = None) -> "DemandGrid":
+        """Evaluate the model over the whole grid in one vectorized call"""
+        started = time.perf_counter()
+        labels = {
+            'route_id': pipeline.vocabulary('route_encoded'),
+            'day_type': pipeline.vocabulary('day_type_encoded'),
+            'weather_condition': pipeline.vocabulary('weather_encoded')
+        }
+        shape = (len(labels['route_id']), 24, len(labels['day_type']), len(labels['weather_condition']))
+        grid = np.indices(shape).reshape(len(shape), -1)
+        
+        # Categorical axes are passed as vocabulary codes under their encoded names
+        features = pipeline.transform(dict(zip(cls.AXES, grid)))
+        values = np.maximum(0, predict_matrix(features)).astype(np.float32).reshape(shape)
+        return cls(values, labels, version, time.perf_counter() - started)
+    
+    def code(self, axis: str, value) -> Optional[int]:
+        """Position of a raw value on a categorical axis, or None if unknown"""
+        return self._codes[axis].get(value)
+    
+    def forecast(self, hours: np.ndarray, day_types: np.ndarray, weather: int, routes=slice(None)) -> np.ndarray:
+        """(route, step) forecasts for a sequence of (hour, day type code) steps"""
+        return self.values[routes, hours, day_types, weather]
+    
+    def body(self) -> bytes:
+        """JSON body of the full grid, rendered on first use"""
+        if self._body is None:
+            self._body = json.dumps({
+                "model_version": self.version,
+                "axes": {
+                    "route_id": self.labels['route_id'],
+                    "hour": list(range(24)),
+                    "day_type": self.labels['day_type'],
+                    "weather_condition": self.labels['weather_condition']
+                },
+                "unit": "passengers_per_hour",
+                "values": np.round(self.values.astype(np.float64), 2).tolist()
+            }, separators=(',', ':')).encode()
+        return self._body
+    
+    def stats(self) -> dict:
+        """Grid size and build cost"""
+        return {
+            "cells": int(self.values.size),
+            "shape": list(self.values.shape),
+            "nbytes": int(self.values.nbytes),
+            "build_ms": self.build_seconds * 1000.0
+        }
+
+async def iter_ndjson_lines(chunks: AsyncIterator[bytes], max_line_bytes: int) -> AsyncIterator[Optional[bytes]]:
+    """Split a byte stream into lines without holding more than one partial line
+
+    Lines longer than max_line_bytes are yielded as None so the caller can
+    report them in place.
+    """
+    pending = b""
+    oversized = False
+    async for chunk in chunks:
+        lines = (pending + chunk).split(b"\n")
+        pending = lines.pop()
+        for line in lines:
+            if oversized or len(line) > max_line_bytes:
+                oversized = False
+                yield None
+            else:
+                yield line
+        if len(pending) > max_line_bytes:
+            # Drop the partial line and skip the rest of it
+            pending = b""
+            oversized = True
+    if oversized:
+        yield None
+    elif pending:
+        yield pending
+
+class BoardEntry:
+    """One bus's predicted arrivals at its downstream stops, as of its last ping
+    
+    Predictions are stored as arrival times (ping time + ETA, and the same for
+    p10/p90), so reads report the minutes left from the moment they are made.
+    """
+    
+    __slots__ = ('bus_id', 'route_id', 'along_km', 'stop_ids', 'distances_km', 'arrivals', 'confidence',
+                 'updated_at', 'version', 'received')
+    
+    def __init__(self, bus_id: str, route_id: str, along_km: float, stop_ids: List[str], distances_km: List[float],
+                 rows: np.ndarray, updated_at: datetime, version: Optional[str]):
+        self.bus_id = bus_id
+        self.route_id = route_id
+        self.along_km = along_km
+        self.stop_ids = stop_ids
+        self.distances_km = distances_km
+        # Epoch seconds of the predicted arrival, p10 and p90 per stop (NaN bounds without a calibration)
+        self.arrivals = (updated_at.timestamp() + 60.0 * rows[:, :3]).tolist()
+        self.confidence = rows[:, 3].tolist()
+        self.updated_at = updated_at
+        self.version = version
+        self.received = time.monotonic()
+    
+    def eta(self, column: int, now: float) -> dict:
+        """Minutes from now (epoch seconds) to the predicted arrival at one stop; overdue arrivals read 0"""
+        arrival, p10, p90 = self.arrivals[column]
+        return {
+            "eta_minutes": max(0.0, (arrival - now) / 60.0),
+            "predicted_arrival": datetime.fromtimestamp(arrival, self.updated_at.tzinfo),
+            "confidence": self.confidence[column],
+            "eta_p10_minutes": max(0.0, (p10 - now) / 60.0) if np.isfinite(p10) else None,
+            "eta_p90_minutes": max(0.0, (p90 - now) / 60.0) if np.isfinite(p90) else None
+        }
+
+class ETABoard:
+    """Current ETA rows for every bus x downstream stop, replaced one bus at a time
+    
+    A ping recomputes only that bus's entry; route and stop boards are read
+    from the stored entries. Buses not pinged within ttl_seconds are left
+    out of boards and dropped.
+    """
+    
+    def __init__(self, ttl_seconds: float = ETA_BOARD_TTL):
+        self.ttl_seconds = ttl_seconds
+        self.updates = 0
+        self.expired = 0
+        # bus id -> BoardEntry, oldest ping first: each update moves its bus to the end
+        self._entries = OrderedDict()
+        self._route_buses = {}  # route id -> bus ids
+        self._lock = threading.Lock()
+    
+    def update(self, entries: List[BoardEntry]):
+        with self._lock:
+            for entry in entries:
+                self._discard(entry.bus_id)
+                self._entries[entry.bus_id] = entry
+                self._route_buses.setdefault(entry.route_id, set()).add(entry.bus_id)
+            self.updates += len(entries)
+            self._sweep()
+    
+    def _sweep(self):
+        """Drop buses past their TTL, including ones on routes nobody reads
+        
+        Entries are in ping order, so only the expired ones at the front are visited.
+        """
+        if self.ttl_seconds <= 0:
+            return
+        cutoff = time.monotonic() - self.ttl_seconds
+        while self._entries:
+            entry = next(iter(self._entries.values()))
+            if entry.received >= cutoff:
+                break
+            self._discard(entry.bus_id)
+            self.expired += 1
+    
+    def remove(self, bus_id: str) -> bool:
+        with self._lock:
+            return self._discard(bus_id)
+    
+    def _discard(self, bus_id: str) -> bool:
+        entry = self._entries.pop(bus_id, None)
+        if entry is None:
+            return False
+        buses = self._route_buses[entry.route_id]
+        buses.discard(bus_id)
+        if not buses:
+            del self._route_buses[entry.route_id]
+        return True
+    
+    def _live(self, bus_ids) -> List[BoardEntry]:
+        """Entries of the given buses, dropping the ones past their TTL"""
+        entries = [self._entries[bus_id] for bus_id in bus_ids]
+        if self.ttl_seconds <= 0:
+            return entries
+        cutoff = time.monotonic() - self.ttl_seconds
+        stale = [entry for entry in entries if entry.received < cutoff]
+        for entry in stale:
+            self._discard(entry.bus_id)
+        self.expired += len(stale)
+        return [entry for entry in entries if entry.received >= cutoff]
+    
+    def routes(self, route_ids) -> List[BoardEntry]:
+        """Live entries of the buses on any of the routes"""
+        with self._lock:
+            return self._live([bus_id for route_id in route_ids for bus_id in self._route_buses.get(route_id, ())])
+    
+    def stats(self) -> dict:
+        with self._lock:
+            live = self._live(list(self._entries))
+            return {
+                "buses": len(live),
+                "routes": len(self._route_buses),
+                "rows": sum(len(entry.stop_ids) for entry in live),
+                "updates": self.updates,
+                "expired": self.expired,
+                "ttl_seconds": self.ttl_seconds
+            }
+
+class NDJSONStreamingResponse(StreamingResponse):
+    """StreamingResponse for bodies generated while the request is still being read
+    
+    Starlette's StreamingResponse listens for disconnects by calling receive()
+    concurrently on servers older than ASGI spec 2.4, which would swallow
+    request body messages. Here the request stream reports disconnects instead.
+    """
+    media_type = "application/x-ndjson"
+    
+    async def __call__(self, scope, receive, send):
+        try:
+            await self.stream_response(send)
+        except OSError:
+            raise ClientDisconnect()
+        if self.background is not None:
+            await self.background()
+
+@contextmanager
+def _untimed(model: str, name: str):
+    """Stand-in for service_metrics.stage during load-time work"""
+    yield
+
+def scale_features(scaler, features: np.ndarray) -> np.ndarray:
+    """Apply a fitted scaler, skipping sklearn validation for a plain StandardScaler"""
+    if (COMPILED_TREES and type(scaler).__name__ == 'StandardScaler'
+            and scaler.with_mean and scaler.with_std):
+        return (features - scaler.mean_) / scaler.scale_
+    return scaler.transform(features)
+
+def _check_schema(name: str, pipeline: FeaturePipeline, scaler):
+    """Refuse a feature schema that does not match what the scaler was fitted on"""
+    expected = getattr(scaler, 'n_features_in_', pipeline.n_features)
+    if expected != pipeline.n_features:
+        raise ValueError(f"{name} feature schema has {pipeline.n_features} features, scaler expects {expected}")
+
+class ModelBundle:
+    """One consistent set of models, scalers and derived structures
+    
+    The service swaps whole bundles, so a request never pairs a model from
+    one version with a scaler or lookup table from another.
+    """
+    
+    def __init__(self, version: Optional[str] = None, directory: Optional[str] = None):
+        self.version = version
+        self.directory = directory
+        self.manifest = {}
         self.eta_model = None
         self.eta_scaler = None
+        self.eta_engine = None
+        self.eta_calibration = None
+        self.eta_pipeline = FeaturePipeline.for_model('eta')
         self.occupancy_model = None
         self.occupancy_scaler = None
-        self.label_encoder = None
-        
-        # Load models
-        self.load_models()
+        self.occupancy_engine = None
+        self.occupancy_calibration = None
+        self.occupancy_pipeline = FeaturePipeline.for_model('occupancy')
+        self.occupancy_table = None
+        self.demand_model = None
+        self.demand_scaler = None
+        self.demand_engine = None
+        self.demand_pipeline = FeaturePipeline.for_model('demand')
+        self.demand_grid = None
+        self.route_index = None
+        self.compact = {}
+        self.load_seconds = 0.0
+        self.phases = {}
     
-    def load_models(self):
-        """Load trained ML models"""
-        try:
-            # Load ETA model
-            eta_model_path = os.path.join(self.models_dir, 'eta_model.pkl')
-            eta_scaler_path = os.path.join(self.models_dir, 'eta_scaler.pkl')
-            
-            if os.path.exists(eta_model_path) and os.path.exists(eta_scaler_path):
-                self.eta_model = joblib.load(eta_model_path)
-                self.eta_scaler = joblib.load(eta_scaler_path)
-                logger.info("ETA model loaded successfully")
-            else:
-                logger.warning("ETA model files not found")
+    @classmethod
+    def load(cls, models_dir: str) -> "ModelBundle":
+        """Load the published model version (or the flat legacy layout)"""
+        started = time.perf_counter()
+        version, directory = model_store.resolve(models_dir)
+        bundle = cls(version, directory)
+        
+        manifest_path = os.path.join(directory, model_store.MANIFEST)
+        if os.path.exists(manifest_path):
+            bundle.manifest = model_store.read_manifest(directory)
+        
+        # Load ETA model
+        eta_model_path = bundle.model_path('eta')
+        eta_scaler_path = os.path.join(directory, 'eta_scaler.pkl')
+        
+        if os.path.exists(eta_model_path) and os.path.exists(eta_scaler_path):
+            with bundle.phase('eta_load'):
+                bundle.eta_model = bundle.load_model('eta', eta_model_path)
+                bundle.eta_scaler = model_store.load_artifact(eta_scaler_path, mmap=MMAP_MODELS)
+                bundle.eta_pipeline = load_pipeline(directory, 'eta')
+                _check_schema('ETA', bundle.eta_pipeline, bundle.eta_scaler)
+            if bundle.compact['eta']:
+                bundle.eta_engine = bundle.eta_model
+            elif COMPILED_TREES:
+                with bundle.phase('eta_compile'):
+                    bundle.eta_engine = compile_model(bundle.eta_model, engine_dir=os.path.join(directory, 'eta_engine'))
+            bundle.eta_calibration = bundle.load_calibration('eta')
+            logger.info(f"ETA model loaded successfully (version {version})")
+        else:
+            logger.warning("ETA model files not found")
+        
+        # Load occupancy model
+        occupancy_model_path = bundle.model_path('occupancy')
+        occupancy_scaler_path = os.path.join(directory, 'occupancy_scaler.pkl')
+        
+        if os.path.exists(occupancy_model_path) and os.path.exists(occupancy_scaler_path):
+            with bundle.phase('occupancy_load'):
+                bundle.occupancy_model = bundle.load_model('occupancy', occupancy_model_path)
+                bundle.occupancy_scaler = model_store.load_artifact(occupancy_scaler_path, mmap=MMAP_MODELS)
+                bundle.occupancy_pipeline = load_pipeline(directory, 'occupancy')
+                _check_schema('Occupancy', bundle.occupancy_pipeline, bundle.occupancy_scaler)
+            if bundle.compact['occupancy']:
+                bundle.occupancy_engine = bundle.occupancy_model
+            elif COMPILED_TREES:
+                with bundle.phase('occupancy_compile'):
+                    bundle.occupancy_engine = compile_model(
+                        bundle.occupancy_model, engine_dir=os.path.join(directory, 'occupancy_engine')
+                    )
+            bundle.occupancy_calibration = bundle.load_calibration('occupancy')
+            logger.info(f"Occupancy model loaded successfully (version {version})")
             
-            # Load occupancy model
-            occupancy_model_path = os.path.join(self.models_dir, 'occupancy_model.pkl')
-            occupancy_scaler_path = os.path.join(self.models_dir, 'occupancy_scaler.pkl')
+            if OCCUPANCY_TABLE:
+                with bundle.phase('occupancy_table'):
+                    bundle.occupancy_table = bundle.build_occupancy_table()
+        else:
+            logger.warning("Occupancy model files not found")
+        
+        # Load demand model; it is served from a grid precomputed here
+        demand_model_path = bundle.model_path('demand')
+        demand_scaler_path = os.path.join(directory, 'demand_scaler.pkl')
+        
+        if os.path.exists(demand_model_path) and os.path.exists(demand_scaler_path):
+            with bundle.phase('demand_load'):
+                bundle.demand_model = bundle.load_model('demand', demand_model_path)
+                bundle.demand_scaler = model_store.load_artifact(demand_scaler_path, mmap=MMAP_MODELS)
+                bundle.demand_pipeline = load_pipeline(directory, 'demand')
+                _check_schema('Demand', bundle.demand_pipeline, bundle.demand_scaler)
+            if bundle.compact['demand']:
+                bundle.demand_engine = bundle.demand_model
+            logger.info(f"Demand model loaded successfully (version {version})")
             
-            if os.path.exists(occupancy_model_path) and os.path.exists(occupancy_scaler_path):
-                self.occupancy_model = joblib.load(occupancy_model_path)
-                self.occupancy_scaler = joblib.load(occupancy_scaler_path)
-                logger.info("Occupancy model loaded successfully")
-            else:
-                logger.warning("Occupancy model files not found")
-                
+            with bundle.phase('demand_grid'):
+                bundle.demand_grid = bundle.build_demand_grid()
+        else:
+            logger.warning("Demand model files not found")
+        
+        with bundle.phase('route_index'):
+            bundle.route_index = bundle.load_route_index()
+        
+        bundle.load_seconds = time.perf_counter() - started
+        return bundle
+    
+    def model_path(self, name: str) -> str:
+        """Artifact to load for a model: the compact export when enabled and present"""
+        compact_path = os.path.join(self.directory, f'{name}_compact.npz')
+        self.compact[name] = COMPACT_MODELS and os.path.exists(compact_path)
+        return compact_path if self.compact[name] else os.path.join(self.directory, f'{name}_model.pkl')
+    
+    def load_model(self, name: str, path: str):
+        if self.compact[name]:
+            return CompiledTreeEnsemble.load_compressed(path)
+        return model_store.load_artifact(path, mmap=MMAP_MODELS)
+    
+    def load_calibration(self, name: str) -> Optional[IntervalCalibration]:
+        """Interval calibration for the loaded artifact, or None when disabled or missing"""
+        path = calibration_path(self.directory, name, self.compact[name])
+        if not PREDICTION_INTERVALS or not os.path.exists(path):
+            return None
+        try:
+            return IntervalCalibration.load(path)
+        except (OSError, ValueError, KeyError) as e:
+            logger.error(f"Error loading {name} interval calibration: {e}")
+            return None
+    
+    @contextmanager
+    def phase(self, name: str):
+        """Record how long a load step takes, in milliseconds"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[f"{name}_ms"] = (time.perf_counter() - started) * 1000.0
+    
+    @property
+    def eta_ready(self) -> bool:
+        return self.eta_model is not None and self.eta_scaler is not None
+    
+    @property
+    def occupancy_ready(self) -> bool:
+        return self.occupancy_model is not None and self.occupancy_scaler is not None
+    
+    @property
+    def demand_ready(self) -> bool:
+        return self.demand_grid is not None
+    
+    def build_occupancy_table(self) -> Optional[OccupancyTable]:
+        """Precompute occupancy over the finite input domain"""
+        try:
+            table = OccupancyTable.build(
+                lambda features: self._predict_rows('occupancy', features, timed=False), self.occupancy_pipeline
+            )
         except Exception as e:
-            logger.error(f"Error loading models: {e}")
+            logger.error(f"Error building occupancy table: {e}")
+            return None
+        
+        stats = table.stats()
+        logger.info(f"Occupancy table built: {stats['cells']} cells, {stats['nbytes']} bytes in {stats['build_ms']:.1f} ms")
+        return table
     
-    def encode_categorical(self, weather_condition: str, traffic_level: str, route_id: str):
-        """Encode categorical variables"""
-        # Simple encoding for demo (in production, use proper label encoders)
-        weather_encoding = {
-            'SUNNY': 0,
-            'CLOUDY': 1,
-            'RAINY': 2,
-            'SNOWY': 3
-        }
+    def build_demand_grid(self) -> Optional[DemandGrid]:
+        """Precompute demand for every route, hour, day type and weather"""
+        try:
+            grid = DemandGrid.build(
+                lambda features: self._predict_untimed('demand', features), self.demand_pipeline, self.version
+            )
+        except Exception as e:
+            logger.error(f"Error building demand grid: {e}")
+            return None
         
-        traffic_encoding = {
-            'LOW': 0,
-            'MEDIUM': 1,
-            'HIGH': 2
-        }
+        stats = grid.stats()
+        logger.info(f"Demand grid built: {stats['cells']} cells, {stats['nbytes']} bytes in {stats['build_ms']:.1f} ms")
+        return grid
+    
+    def load_route_index(self) -> Optional[geo_index.RouteGeometryIndex]:
+        """Index the route/stop geometry used to compute distances"""
+        try:
+            index = geo_index.RouteGeometryIndex.load(ROUTE_GEOMETRY or None)
+        except Exception as e:
+            logger.error(f"Error loading route geometry: {e}")
+            return None
+        
+        stats = index.stats()
+        logger.info(f"Route index built: {stats['routes']} routes, {stats['stops']} stops, {stats['vertices']} vertices")
+        return index
+    
+    def predict_eta_matrix(self, features: np.ndarray) -> np.ndarray:
+        """Scale and predict ETAs for a 2-D feature matrix"""
+        with service_metrics.stage('eta', 'scale'):
+            features_scaled = scale_features(self.eta_scaler, features)
+        with service_metrics.stage('eta', 'predict'):
+            predictions = self._predict(self.eta_model, self.eta_engine, features_scaled)
+        return np.maximum(1, predictions)  # Minimum 1 minute
+    
+    def predict_occupancy_matrix(self, features: np.ndarray) -> np.ndarray:
+        """Scale and predict occupancy for a 2-D feature matrix"""
+        with service_metrics.stage('occupancy', 'scale'):
+            features_scaled = scale_features(self.occupancy_scaler, features)
+        with service_metrics.stage('occupancy', 'predict'):
+            predictions = self._predict(self.occupancy_model, self.occupancy_engine, features_scaled)
+        return np.clip(predictions, 0, 100)  # Clamp between 0-100
+    
+    def predict_eta_rows(self, features: np.ndarray) -> np.ndarray:
+        """(n, 4) ETA, p10, p90 and confidence for a 2-D feature matrix"""
+        return self._predict_rows('eta', features)
+    
+    def predict_occupancy_rows(self, features: np.ndarray) -> np.ndarray:
+        """(n, 4) occupancy, p10, p90 and confidence for a 2-D feature matrix"""
+        return self._predict_rows('occupancy', features)
+    
+    def _predict_rows(self, model: str, features: np.ndarray, timed: bool = True) -> np.ndarray:
+        """Prediction rows, with the bounds and confidence from one pass over the ensemble"""
+        scaler, estimator, engine, calibration = (
+            getattr(self, f'{model}_{part}') for part in ('scaler', 'model', 'engine', 'calibration')
+        )
+        stage = service_metrics.stage if timed else _untimed
+        with stage(model, 'scale'):
+            features_scaled = scale_features(scaler, features)
+        with stage(model, 'predict'):
+            if calibration is not None and calibration.uses_spread:
+                predictions, spread = self._predict_spread(estimator, engine, features_scaled)
+            else:
+                predictions, spread = self._predict(estimator, engine, features_scaled), None
         
-        route_encoding = {
-            'ROUTE_1': 0,
-            'ROUTE_2': 1,
-            'ROUTE_3': 2
+        if calibration is None:
+            rows = np.empty((len(predictions), 4))
+            rows[:, 0] = predictions
+            rows[:, 1:3] = np.nan
+            rows[:, 3] = DEFAULT_CONFIDENCE[model]
+        else:
+            with stage(model, 'interval'):
+                rows = calibration.apply(predictions, spread)
+        # Same limits as the point predictions: ETA at least 1 minute, occupancy 0-100
+        rows[:, :3] = np.maximum(1, rows[:, :3]) if model == 'eta' else np.clip(rows[:, :3], 0, 100)
+        return rows
+    
+    @staticmethod
+    def _predict_spread(model, engine, features_scaled: np.ndarray):
+        """Forest mean and per-tree standard deviation"""
+        if isinstance(model, CompiledTreeEnsemble):
+            return model.predict_spread(features_scaled)
+        # Engines compiled before the averaging flag was saved fall back to the forest
+        if engine is not None and engine.averaging and len(features_scaled) <= COMPILED_MAX_ROWS:
+            return engine.predict_spread(features_scaled)
+        # Large batches: the same per-tree loop sklearn's forest predict runs
+        X = np.ascontiguousarray(features_scaled, dtype=np.float32)
+        per_tree = np.stack([tree.predict(X, check_input=False) for tree in model.estimators_], axis=1)
+        return per_tree.mean(axis=1), per_tree.std(axis=1)
+    
+    def _predict_untimed(self, model: str, features: np.ndarray) -> np.ndarray:
+        """Scale and predict without stage metrics, for load-time work"""
+        scaler, estimator, engine = (getattr(self, f'{model}_{part}') for part in ('scaler', 'model', 'engine'))
+        return self._predict(estimator, engine, scale_features(scaler, features))
+    
+    @staticmethod
+    def _predict(model, engine, features_scaled: np.ndarray) -> np.ndarray:
+        if engine is not None and len(features_scaled) <= COMPILED_MAX_ROWS:
+            return engine.predict(features_scaled)
+        return model.predict(features_scaled)
+    
+    def warm_up(self):
+        """Run one prediction per model so the first request pays no setup cost"""
+        if self.eta_ready:
+            eta = self._predict_untimed('eta', np.zeros((1, self.eta_scaler.n_features_in_)))
+            if not np.all(np.isfinite(eta)):
+                raise ValueError("ETA model warm-up returned a non-finite prediction")
+        if self.occupancy_ready:
+            occupancy = self._predict_untimed('occupancy', np.zeros((1, self.occupancy_scaler.n_features_in_)))
+            if not np.all(np.isfinite(occupancy)):
+                raise ValueError("Occupancy model warm-up returned a non-finite prediction")
+    
+    def component_bytes(self) -> dict:
+        """Size of each loaded component: artifact files, compiled arrays, lookup table"""
+        sizes = {}
+        if self.directory:
+            for name in ('eta_model', 'eta_scaler', 'occupancy_model', 'occupancy_scaler', 'demand_model', 'demand_scaler'):
+                model = name.split('_')[0]
+                if name.endswith('_model') and self.compact.get(model):
+                    path = os.path.join(self.directory, f'{model}_compact.npz')
+                else:
+                    path = os.path.join(self.directory, f'{name}.pkl')
+                if getattr(self, name) is not None and os.path.exists(path):
+                    sizes[name] = os.path.getsize(path)
+        if self.eta_engine is not None:
+            sizes['eta_engine'] = self.eta_engine.nbytes
+        if self.occupancy_engine is not None:
+            sizes['occupancy_engine'] = self.occupancy_engine.nbytes
+        if self.occupancy_table is not None:
+            sizes['occupancy_table'] = int(self.occupancy_table.values.nbytes)
+        if self.demand_grid is not None:
+            sizes['demand_grid'] = int(self.demand_grid.values.nbytes)
+        return sizes
+    
+    def status(self) -> dict:
+        """Version and load information"""
+        return {
+            "version": self.version,
+            "directory": self.directory,
+            "created_at": self.manifest.get('created_at'),
+            "load_ms": self.load_seconds * 1000.0,
+            "load_phases": self.phases,
+            "mmap": MMAP_MODELS,
+            "compact": self.compact,
+            "intervals": {
+                name: calibration.kind if calibration is not None else None
+                for name, calibration in (('eta', self.eta_calibration), ('occupancy', self.occupancy_calibration))
+            },
+            "feature_schemas": {
+                "eta": self.eta_pipeline.to_dict(),
+                "occupancy": self.occupancy_pipeline.to_dict(),
+                "demand": self.demand_pipeline.to_dict()
+            }
         }
+
+class MLService:
+    def __init__(self, models_dir="models", load=True):
+        self.models_dir = models_dir
+        self.bundle = ModelBundle()
+        
+        # Readiness: set once a bundle has been loaded and warmed up
+        self.ready = False
+        self.load_error = None
+        self.startup_phases = {}
         
-        return (
-            weather_encoding.get(weather_condition, 0),
-            traffic_encoding.get(traffic_level, 1),
-            route_encoding.get(route_id, 0)
+        # Quantized ETA result cache in front of the model
+        self.eta_cache = make_cache(ETA_CACHE_BACKEND, ETA_CACHE_TTL, ETA_CACHE_SIZE, REDIS_URL)
+        self.eta_cache_keyer = ETACacheKeyer(parse_buckets(ETA_CACHE_BUCKETS))
+        
+        # Inference runs off the event loop, coalesced by the micro-batchers
+        self.executor = ThreadPoolExecutor(max_workers=INFERENCE_WORKERS, thread_name_prefix="inference")
+        self.eta_batcher = MicroBatcher(ModelBundle.predict_eta_rows, self.executor, 'eta')
+        self.occupancy_batcher = MicroBatcher(ModelBundle.predict_occupancy_rows, self.executor, 'occupancy')
+        
+        # Identical concurrent requests join one prediction instead of each queueing a row
+        self.eta_flights = SingleFlight('eta') if SINGLE_FLIGHT else None
+        self.occupancy_flights = SingleFlight('occupancy') if SINGLE_FLIGHT else None
+        
+        # ETAs from each bus's last ping to its downstream stops; kept across model reloads
+        self.eta_board = ETABoard()
+        
+        # Load models (the API loads them in the background instead)
+        if load:
+            try:
+                self.load_models()
+            except Exception as e:
+                logger.error(f"Error loading models: {e}")
+    
+    # Read-only views of the current bundle
+    eta_model = property(lambda self: self.bundle.eta_model)
+    eta_scaler = property(lambda self: self.bundle.eta_scaler)
+    eta_engine = property(lambda self: self.bundle.eta_engine)
+    occupancy_model = property(lambda self: self.bundle.occupancy_model)
+    occupancy_scaler = property(lambda self: self.bundle.occupancy_scaler)
+    occupancy_engine = property(lambda self: self.bundle.occupancy_engine)
+    occupancy_table = property(lambda self: self.bundle.occupancy_table)
+    demand_model = property(lambda self: self.bundle.demand_model)
+    demand_grid = property(lambda self: self.bundle.demand_grid)
+    eta_model_version = property(lambda self: self.bundle.version)
+    
+    def load_models(self, force: bool = True, trigger: str = 'reload') -> bool:
+        """Load the published models and swap them in as one bundle
+        
+        Returns False when the published version is already being served and
+        ``force`` is not set. Errors leave the current bundle in place.
+        """
+        version, _ = model_store.resolve(self.models_dir)
+        if not force and version == self.bundle.version:
+            return False
+        
+        started = time.perf_counter()
+        try:
+            bundle = ModelBundle.load(self.models_dir)
+            with bundle.phase('warm_up'):
+                bundle.warm_up()
+        except Exception as e:
+            self.load_error = str(e)
+            raise
+        
+        # Single reference assignment: requests see the old or the new bundle, never a mix
+        self.bundle = bundle
+        self.ready = bundle.eta_ready or bundle.occupancy_ready or bundle.demand_ready
+        self.load_error = None if self.ready else "No model files found"
+        if self.eta_cache is not None:
+            self.eta_cache.clear()
+        service_metrics.record_model_load(
+            trigger, time.perf_counter() - started, bundle.phases, bundle.version, bundle.component_bytes()
         )
+        logger.info(f"Serving model version {bundle.version} (loaded in {bundle.load_seconds * 1000:.0f} ms)")
+        return True
+    
+    async def load_models_in_background(self):
+        """Load models off the event loop and record startup timings"""
+        started = time.perf_counter()
+        try:
+            await run_in_threadpool(self.load_models, True, 'startup')
+        except Exception as e:
+            logger.error(f"Error loading models: {e}")
+        finally:
+            self.startup_phases['model_load_ms'] = (time.perf_counter() - started) * 1000.0
+            self.startup_phases['import_to_ready_ms'] = (time.perf_counter() - STARTUP_STARTED) * 1000.0
+            logger.info(f"Startup phases: {self.startup_phases}")
+    
+    def eta_cache_key(self, request: ETAPredictionRequest, bundle: ModelBundle) -> Optional[str]:
+        """Quantized cache key for a request under the bundle's model, None when it is not cacheable"""
+        if self.eta_cache is None:
+            return None
+        return self.eta_cache_keyer.key(request, bundle.version)
+    
+    @staticmethod
+    def eta_features(request: ETAPredictionRequest, bundle: ModelBundle) -> list:
+        """Build the ETA feature row for a request"""
+        with service_metrics.stage('eta', 'encode'):
+            return bundle.eta_pipeline.transform_record(request)
+    
+    @staticmethod
+    def occupancy_features(request: OccupancyPredictionRequest, bundle: ModelBundle) -> list:
+        """Build the occupancy feature row for a request"""
+        with service_metrics.stage('occupancy', 'encode'):
+            return bundle.occupancy_pipeline.transform_record(request)
+    
+    def eta_factors(self, request: ETAPredictionRequest) -> List[dict]:
+        """Identify factors affecting ETA"""
+        factors = []
+        if request.traffic_level == 'HIGH':
+            factors.append({"type": "TRAFFIC", "impact": -0.3, "description": "High traffic conditions"})
+        if request.weather_condition in ['RAINY', 'SNOWY']:
+            factors.append({"type": "WEATHER", "impact": -0.2, "description": f"{request.weather_condition.lower()} weather"})
+        if request.hour in RUSH_HOURS:
+            factors.append({"type": "TIME", "impact": -0.1, "description": "Rush hour"})
+        return factors
+    
+    @staticmethod
+    async def predict_row(flights: Optional[SingleFlight], batcher: MicroBatcher, bundle: ModelBundle,
+                          features: list) -> list:
+        """Predict one feature row with the bundle that encoded it, joining identical in-flight rows"""
+        if flights is None:
+            return await batcher.submit(bundle, features)
+        # The version keeps rows from before and after a reload apart
+        key = (bundle.version, tuple(features))
+        return await flights.run(key, lambda: batcher.submit(bundle, features))
+    
+    @staticmethod
+    def interval_fields(row: list) -> dict:
+        """Confidence and bounds of a prediction row; bounds are None without a calibration"""
+        _, p10, p90, confidence = row
+        return {
+            "confidence": confidence,
+            "p10": p10 if np.isfinite(p10) else None,
+            "p90": p90 if np.isfinite(p90) else None
+        }
+    
+    def build_eta_response(self, request: ETAPredictionRequest, row: list) -> ETAPredictionResponse:
+        """Wrap an ETA prediction row in the API response"""
+        interval = self.interval_fields(row)
+        with service_metrics.stage('eta', 'response'):
+            return ETAPredictionResponse(
+                eta_minutes=row[0],
+                confidence=interval['confidence'],
+                eta_p10_minutes=interval['p10'],
+                eta_p90_minutes=interval['p90'],
+                factors=self.eta_factors(request),
+                timestamp=datetime.now()
+            )
+    
+    def build_occupancy_response(self, row: list) -> OccupancyPredictionResponse:
+        """Wrap an occupancy prediction row in the API response"""
+        interval = self.interval_fields(row)
+        with service_metrics.stage('occupancy', 'response'):
+            return OccupancyPredictionResponse(
+                occupancy_percentage=row[0],
+                confidence=interval['confidence'],
+                occupancy_p10=interval['p10'],
+                occupancy_p90=interval['p90'],
+                timestamp=datetime.now()
+            )
+    
+    @staticmethod
+    def lookup_occupancy(table: Optional[OccupancyTable], features: list) -> Optional[list]:
+        """Occupancy from the precomputed table, or None when the row is off the grid"""
+        if table is None:
+            return None
+        with service_metrics.stage('occupancy', 'lookup'):
+            return table.lookup_one(features)
     
     def predict_eta(self, request: ETAPredictionRequest) -> ETAPredictionResponse:
         """Predict ETA for a bus"""
-        if self.eta_model is None or self.eta_scaler is None:
+        # One bundle for the whole request, whatever a concurrent reload swaps in
+        bundle = self.bundle
+        if not bundle.eta_ready:
             raise HTTPException(status_code=503, detail="ETA model not available")
         
         try:
-            # Encode categorical variables
-            weather_encoded, traffic_encoded, route_encoded = self.encode_categorical(
-                request.weather_condition, request.traffic_level, request.route_id
-            )
-            
-            # Prepare features
-            features = [
-                request.latitude, request.longitude,
-                request.hour, request.day_of_week, int(request.is_weekend),
-                weather_encoded, traffic_encoded, route_encoded,
-                request.distance_km, request.avg_speed, request.occupancy_percentage,
-                request.hour + 0,  # time_of_day (simplified)
-                1 if request.hour in [7, 8, 9, 17, 18, 19] else 0  # is_rush_hour
-            ]
-            
-            # Scale features
-            features_scaled = self.eta_scaler.transform([features])
-            
-            # Make prediction
-            eta_minutes = self.eta_model.predict(features_scaled)[0]
-            eta_minutes = max(1, eta_minutes)  # Minimum 1 minute
-            
-            # Calculate confidence based on model performance
-            confidence = 0.85  # In production, calculate based on model uncertainty
-            
-            # Identify factors affecting ETA
-            factors = []
-            if request.traffic_level == 'HIGH':
-                factors.append({"type": "TRAFFIC", "impact": -0.3, "description": "High traffic conditions"})
-            if request.weather_condition in ['RAINY', 'SNOWY']:
-                factors.append({"type": "WEATHER", "impact": -0.2, "description": f"{request.weather_condition.lower()} weather"})
-            if request.hour in [7, 8, 9, 17, 18, 19]:
-                factors.append({"type": "TIME", "impact": -0.1, "description": "Rush hour"})
-            
-            return ETAPredictionResponse(
-                eta_minutes=eta_minutes,
-                confidence=confidence,
-                factors=factors,
-                timestamp=datetime.now()
-            )
+            key = self.eta_cache_key(request, bundle)
+            cache = self.eta_cache if key is not None else None
+            prediction = cache.get(key) if cache is not None else None
+            if prediction is None:
+                row = self.eta_features(request, bundle)
+                with service_metrics.stage('eta', 'feature_build'):
+                    features = np.array([row], dtype=np.float64)
+                prediction = bundle.predict_eta_rows(features)[0].tolist()
+                if cache is not None:
+                    cache.set(key, prediction)
+            return self.build_eta_response(request, prediction)
             
         except Exception as e:
             logger.error(f"Error predicting ETA: {e}")
@@ -186,49 +1352,679 @@ class MLService:
     
     def predict_occupancy(self, request: OccupancyPredictionRequest) -> OccupancyPredictionResponse:
         """Predict occupancy for a bus"""
-        if self.occupancy_model is None or self.occupancy_scaler is None:
+        bundle = self.bundle
+        if not bundle.occupancy_ready:
             raise HTTPException(status_code=503, detail="Occupancy model not available")
         
         try:
-            # Encode categorical variables
-            weather_encoded, traffic_encoded, route_encoded = self.encode_categorical(
-                request.weather_condition, request.traffic_level, request.route_id
-            )
+            features = self.occupancy_features(request, bundle)
+            table = bundle.occupancy_table
+            prediction = self.lookup_occupancy(table, features)
+            if prediction is None:
+                with service_metrics.stage('occupancy', 'feature_build'):
+                    matrix = np.array([features], dtype=np.float64)
+                prediction = bundle.predict_occupancy_rows(matrix)[0].tolist()
+            return self.build_occupancy_response(prediction)
             
-            # Prepare features
-            features = [
-                request.hour, request.day_of_week, int(request.is_weekend),
-                weather_encoded, traffic_encoded, route_encoded,
-                request.hour + 0,  # time_of_day (simplified)
-                1 if request.hour in [7, 8, 9, 17, 18, 19] else 0  # is_rush_hour
-            ]
+        except Exception as e:
+            logger.error(f"Error predicting occupancy: {e}")
+            raise HTTPException(status_code=500, detail="Error making occupancy prediction")
+    
+    async def predict_eta_async(self, request: ETAPredictionRequest) -> ETAPredictionResponse:
+        """Predict ETA for a bus through the micro-batcher"""
+        # The bundle that encodes the row also keys the cache and predicts it
+        bundle = self.bundle
+        if not bundle.eta_ready:
+            raise HTTPException(status_code=503, detail="ETA model not available")
+        
+        try:
+            key = self.eta_cache_key(request, bundle)
+            cache = self.eta_cache if key is not None else None
+            prediction = None
+            if cache is not None:
+                prediction = await run_in_threadpool(cache.get, key) if cache.remote else cache.get(key)
+            if prediction is None:
+                prediction = await self.predict_row(
+                    self.eta_flights, self.eta_batcher, bundle, self.eta_features(request, bundle)
+                )
+                if cache is not None:
+                    await run_in_threadpool(cache.set, key, prediction) if cache.remote else cache.set(key, prediction)
+            return self.build_eta_response(request, prediction)
             
-            # Scale features
-            features_scaled = self.occupancy_scaler.transform([features])
+        except Exception as e:
+            logger.error(f"Error predicting ETA: {e}")
+            raise HTTPException(status_code=500, detail="Error making ETA prediction")
+    
+    async def predict_occupancy_async(self, request: OccupancyPredictionRequest) -> OccupancyPredictionResponse:
+        """Predict occupancy for a bus through the micro-batcher"""
+        bundle = self.bundle
+        if not bundle.occupancy_ready:
+            raise HTTPException(status_code=503, detail="Occupancy model not available")
+        
+        try:
+            features = self.occupancy_features(request, bundle)
+            prediction = self.lookup_occupancy(bundle.occupancy_table, features)
+            if prediction is None:
+                prediction = await self.predict_row(self.occupancy_flights, self.occupancy_batcher, bundle, features)
+            return self.build_occupancy_response(prediction)
             
-            # Make prediction
-            occupancy_percentage = self.occupancy_model.predict(features_scaled)[0]
-            occupancy_percentage = max(0, min(100, occupancy_percentage))  # Clamp between 0-100
+        except Exception as e:
+            logger.error(f"Error predicting occupancy: {e}")
+            raise HTTPException(status_code=500, detail="Error making occupancy prediction")
+    
+    def parse_batch(self, items: List[dict], request_model):
+        """Validate batch items individually, collecting per-item errors"""
+        if len(items) > MAX_BATCH_SIZE:
+            raise HTTPException(
+                status_code=413,
+                detail=f"Batch of {len(items)} items exceeds limit of {MAX_BATCH_SIZE}"
+            )
+        
+        parsed, errors = [], {}
+        for index, item in enumerate(items):
+            try:
+                parsed.append((index, request_model(**item)))
+            except ValidationError as e:
+                errors[index] = "; ".join(
+                    f"{'.'.join(str(part) for part in err['loc'])}: {err['msg']}"
+                    for err in e.errors()
+                )
+            except TypeError as e:
+                errors[index] = str(e)
+        return parsed, errors
+    
+    def predict_eta_batch(self, items: List[dict]) -> ETABatchPredictionResponse:
+        """Predict ETAs for many buses with one scaler/model call"""
+        bundle = self.bundle
+        if not bundle.eta_ready:
+            raise HTTPException(status_code=503, detail="ETA model not available")
+        
+        parsed, errors = self.parse_batch(items, ETAPredictionRequest)
+        results = {index: ETABatchPredictionItem(index=index, error=error) for index, error in errors.items()}
+        
+        # Answer what we can from the cache, predict the rest
+        cache = self.eta_cache
+        values, keys = {}, {}
+        if cache is not None:
+            # A request that cannot be keyed is predicted without the cache;
+            # one that fails to key fails alone, like a validation error
+            for index, request in list(parsed):
+                try:
+                    key = self.eta_cache_key(request, bundle)
+                except Exception as e:
+                    results[index] = ETABatchPredictionItem(index=index, error=str(e))
+                    parsed.remove((index, request))
+                    continue
+                if key is not None:
+                    keys[index] = key
+        if keys:
+            # One round trip for the batch (MGET on Redis)
+            for index, value in zip(keys, cache.get_many(list(keys.values()))):
+                if value is not None:
+                    values[index] = value
+        misses = [(index, request) for index, request in parsed if index not in values]
+        
+        if misses:
+            try:
+                # Build one feature matrix for the whole batch
+                with service_metrics.stage('eta', 'feature_build'):
+                    features = bundle.eta_pipeline.transform_records([request for _, request in misses])
+                
+                # Scale features and predict in one call each
+                rows = bundle.predict_eta_rows(features)
+                
+            except Exception as e:
+                logger.error(f"Error predicting ETA batch: {e}")
+                raise HTTPException(status_code=500, detail="Error making ETA batch prediction")
             
-            # Calculate confidence
-            confidence = 0.80  # In production, calculate based on model uncertainty
+            for (index, _), row in zip(misses, rows.tolist()):
+                values[index] = row
+            if keys:
+                cache.set_many({keys[index]: values[index] for index, _ in misses if index in keys and np.isfinite(values[index][0])})
+        
+        with service_metrics.stage('eta', 'response'):
+            for index, request in parsed:
+                row = values[index]
+                if not np.isfinite(row[0]):
+                    results[index] = ETABatchPredictionItem(index=index, error="Model returned a non-finite ETA")
+                    continue
+                interval = self.interval_fields(row)
+                results[index] = ETABatchPredictionItem(
+                    index=index,
+                    eta_minutes=row[0],
+                    confidence=interval['confidence'],
+                    eta_p10_minutes=interval['p10'],
+                    eta_p90_minutes=interval['p90'],
+                    factors=self.eta_factors(request)
+                )
+        
+        predictions = [results[index] for index in range(len(items))]
+        failed = sum(1 for item in predictions if item.error is not None)
+        return ETABatchPredictionResponse(
+            predictions=predictions,
+            succeeded=len(predictions) - failed,
+            failed=failed,
+            timestamp=datetime.now()
+        )
+    
+    def predict_occupancy_batch(self, items: List[dict]) -> OccupancyBatchPredictionResponse:
+        """Predict occupancy for many buses with one scaler/model call"""
+        bundle = self.bundle
+        if not bundle.occupancy_ready:
+            raise HTTPException(status_code=503, detail="Occupancy model not available")
+        
+        parsed, errors = self.parse_batch(items, OccupancyPredictionRequest)
+        results = {index: OccupancyBatchPredictionItem(index=index, error=error) for index, error in errors.items()}
+        
+        if parsed:
+            try:
+                # Build one feature matrix for the whole batch
+                with service_metrics.stage('occupancy', 'feature_build'):
+                    features = bundle.occupancy_pipeline.transform_records([request for _, request in parsed])
+                
+                # Serve grid rows from the table, predict the rest in one call
+                table = bundle.occupancy_table
+                if table is not None:
+                    with service_metrics.stage('occupancy', 'lookup'):
+                        occupancy, found = table.lookup(features)
+                else:
+                    occupancy, found = np.zeros((len(features), 4)), np.zeros(len(features), dtype=bool)
+                if not found.all():
+                    occupancy[~found] = bundle.predict_occupancy_rows(features[~found])
+                
+            except Exception as e:
+                logger.error(f"Error predicting occupancy batch: {e}")
+                raise HTTPException(status_code=500, detail="Error making occupancy batch prediction")
             
-            return OccupancyPredictionResponse(
-                occupancy_percentage=occupancy_percentage,
-                confidence=confidence,
-                timestamp=datetime.now()
+            with service_metrics.stage('occupancy', 'response'):
+                for (index, _), row in zip(parsed, occupancy.tolist()):
+                    if not np.isfinite(row[0]):
+                        results[index] = OccupancyBatchPredictionItem(index=index, error="Model returned a non-finite occupancy")
+                        continue
+                    interval = self.interval_fields(row)
+                    results[index] = OccupancyBatchPredictionItem(
+                        index=index,
+                        occupancy_percentage=row[0],
+                        confidence=interval['confidence'],
+                        occupancy_p10=interval['p10'],
+                        occupancy_p90=interval['p90']
+                    )
+        
+        predictions = [results[index] for index in range(len(items))]
+        failed = sum(1 for item in predictions if item.error is not None)
+        return OccupancyBatchPredictionResponse(
+            predictions=predictions,
+            succeeded=len(predictions) - failed,
+            failed=failed,
+            timestamp=datetime.now()
+        )
+
+    def demand_grid_or_503(self) -> DemandGrid:
+        """The loaded demand grid, or a 503 when there is none"""
+        grid = self.bundle.demand_grid
+        if grid is None:
+            raise HTTPException(status_code=503, detail="Demand model not available")
+        return grid
+    
+    @staticmethod
+    def demand_code(grid: DemandGrid, axis: str, value, status_code: int = 400) -> int:
+        """Grid position of a raw value, or an HTTP error naming the unknown value and the valid ones"""
+        code = grid.code(axis, value)
+        if code is None:
+            raise HTTPException(
+                status_code=status_code,
+                detail=f"Unknown {axis}: {value}; expected one of {', '.join(grid.labels[axis])}"
             )
-            
+        return code
+    
+    def predict_demand(self, request: DemandPredictionRequest) -> DemandPredictionResponse:
+        """Forecast boardings for one route, hour, day type and weather"""
+        grid = self.demand_grid_or_503()
+        if not 0 <= request.hour < 24:
+            raise HTTPException(status_code=400, detail="hour must be between 0 and 23")
+        if request.day_of_week is not None and not 0 <= request.day_of_week <= 6:
+            raise HTTPException(status_code=400, detail="day_of_week must be between 0 (Monday) and 6 (Sunday)")
+        if request.day_type is not None:
+            kind = request.day_type
+        elif request.day_of_week is not None:
+            kind = str(day_type(request.day_of_week))
+        else:
+            raise HTTPException(status_code=400, detail="Either day_type or day_of_week is required")
+        
+        with service_metrics.stage('demand', 'lookup'):
+            passengers = grid.values[
+                self.demand_code(grid, 'route_id', request.route_id),
+                request.hour,
+                self.demand_code(grid, 'day_type', kind),
+                self.demand_code(grid, 'weather_condition', request.weather_condition)
+            ]
+        return DemandPredictionResponse(
+            route_id=request.route_id,
+            hour=request.hour,
+            day_type=kind,
+            weather_condition=request.weather_condition,
+            passengers_per_hour=float(passengers),
+            model_version=grid.version,
+            timestamp=datetime.now()
+        )
+    
+    def demand_route_day(self, route_id: str, kind: str, weather_condition: str) -> DemandRouteDayResponse:
+        """Hourly demand forecast for one route over a whole day"""
+        grid = self.demand_grid_or_503()
+        route = self.demand_code(grid, 'route_id', route_id, status_code=404)
+        with service_metrics.stage('demand', 'lookup'):
+            hourly = grid.values[
+                route, :, self.demand_code(grid, 'day_type', kind),
+                self.demand_code(grid, 'weather_condition', weather_condition)
+            ].astype(np.float64)
+        return DemandRouteDayResponse(
+            route_id=route_id,
+            day_type=kind,
+            weather_condition=weather_condition,
+            hourly=hourly.tolist(),
+            total=float(hourly.sum()),
+            peak_hour=int(hourly.argmax()),
+            model_version=grid.version,
+            timestamp=datetime.now()
+        )
+    
+    def demand_forecast(self, hours: int, weather_condition: str, route_id: Optional[str] = None,
+                        start: Optional[datetime] = None) -> DemandForecastResponse:
+        """Demand for the next ``hours`` hours from the start of the current hour"""
+        grid = self.demand_grid_or_503()
+        if not 1 <= hours <= 168:
+            raise HTTPException(status_code=400, detail="hours must be between 1 and 168")
+        weather = self.demand_code(grid, 'weather_condition', weather_condition)
+        if route_id is None:
+            route_ids, routes = grid.labels['route_id'], slice(None)
+        else:
+            route = self.demand_code(grid, 'route_id', route_id, status_code=404)
+            route_ids, routes = [route_id], slice(route, route + 1)
+        
+        start = (start or datetime.now()).replace(minute=0, second=0, microsecond=0)
+        steps = [start + timedelta(hours=step) for step in range(hours)]
+        with service_metrics.stage('demand', 'lookup'):
+            step_hours = np.array([step.hour for step in steps])
+            step_days = np.array([grid.code('day_type', kind) for kind in day_type([step.weekday() for step in steps])])
+            values = grid.forecast(step_hours, step_days, weather, routes).astype(np.float64)
+        return DemandForecastResponse(
+            start=start,
+            hours=steps,
+            weather_condition=weather_condition,
+            routes=dict(zip(route_ids, values.tolist())),
+            model_version=grid.version,
+            timestamp=datetime.now()
+        )
+    
+    def route_distances(self, buses: List[BusPosition]) -> RouteDistanceResponse:
+        """Snap bus positions to their routes and measure along-route km to each downstream stop"""
+        index = self.bundle.route_index
+        if index is None:
+            raise HTTPException(status_code=503, detail="Route geometry not available")
+        if len(buses) > MAX_BATCH_SIZE:
+            raise HTTPException(
+                status_code=413,
+                detail=f"Batch of {len(buses)} buses exceeds limit of {MAX_BATCH_SIZE}"
+            )
+        
+        with service_metrics.stage('geo', 'snap'):
+            lat = np.array([bus.latitude for bus in buses], dtype=np.float64)
+            lon = np.array([bus.longitude for bus in buses], dtype=np.float64)
+            routes = np.array(
+                [-1 if bus.route_id is None else index.route_code(bus.route_id) for bus in buses], dtype=np.int64
+            )
+            valid_route = np.array([bus.route_id is None for bus in buses], dtype=bool) | (routes >= 0)
+            snap = index.snap(lat, lon, np.where(valid_route, routes, -1))
+            distances = index.downstream(snap)
+        
+        results = []
+        with service_metrics.stage('geo', 'response'):
+            for position, bus in enumerate(buses):
+                if not valid_route[position]:
+                    results.append(BusRouteDistances(index=position, bus_id=bus.bus_id, error=f"Unknown route: {bus.route_id}"))
+                    continue
+                route = int(snap.route[position])
+                if route < 0:
+                    results.append(BusRouteDistances(index=position, bus_id=bus.bus_id, error="No route found"))
+                    continue
+                row = distances[position]
+                downstream = np.flatnonzero(~np.isnan(row))
+                results.append(BusRouteDistances(
+                    index=position,
+                    bus_id=bus.bus_id,
+                    route_id=index.route_ids[route],
+                    along_km=float(snap.along_km[position]),
+                    off_route_km=float(snap.off_route_km[position]),
+                    stops=[
+                        StopDistance(stop_id=stop_id, distance_km=distance)
+                        for stop_id, distance in zip(index.stop_ids[route, downstream], row[downstream].tolist())
+                    ]
+                ))
+        return RouteDistanceResponse(buses=results, timestamp=datetime.now())
+    
+    def update_board(self, pings: List[BusPing]) -> BoardUpdateResponse:
+        """Recompute the ETA board rows of the pinged buses
+        
+        The batch is snapped once and every (bus, downstream stop) row goes
+        through one vectorized predict, so the cost follows the stops left on
+        the pinged buses' routes, not the size of the fleet.
+        """
+        bundle = self.bundle
+        index = bundle.route_index
+        if not bundle.eta_ready:
+            raise HTTPException(status_code=503, detail="ETA model not available")
+        if index is None:
+            raise HTTPException(status_code=503, detail="Route geometry not available")
+        if len(pings) > MAX_BATCH_SIZE:
+            raise HTTPException(
+                status_code=413,
+                detail=f"Batch of {len(pings)} pings exceeds limit of {MAX_BATCH_SIZE}"
+            )
+        
+        with service_metrics.stage('board', 'snap'):
+            lat = np.array([ping.latitude for ping in pings], dtype=np.float64)
+            lon = np.array([ping.longitude for ping in pings], dtype=np.float64)
+            routes = np.array(
+                [-1 if ping.route_id is None else index.route_code(ping.route_id) for ping in pings], dtype=np.int64
+            )
+            valid_route = np.array([ping.route_id is None for ping in pings], dtype=bool) | (routes >= 0)
+            snap = index.snap(lat, lon, np.where(valid_route, routes, -1))
+            distances = index.downstream(snap)
+        
+        items = [BoardUpdateItem(index=position, bus_id=ping.bus_id) for position, ping in enumerate(pings)]
+        pending = []  # (position, route, downstream stop columns)
+        for position, ping in enumerate(pings):
+            route = int(snap.route[position])
+            if not valid_route[position]:
+                items[position].error = f"Unknown route: {ping.route_id}"
+            elif route < 0:
+                items[position].error = "No route found"
+            else:
+                pending.append((position, route, np.flatnonzero(~np.isnan(distances[position]))))
+        
+        # One feature row per (bus, downstream stop): the bus's fields repeated per stop
+        now = datetime.now()
+        with service_metrics.stage('board', 'encode'):
+            counts = np.array([len(stops) for _, _, stops in pending], dtype=np.int64)
+            buses = [pings[position] for position, _, _ in pending]
+            times = [bus.timestamp or now for bus in buses]
+            per_bus = {
+                'latitude': lat[[position for position, _, _ in pending]],
+                'longitude': lon[[position for position, _, _ in pending]],
+                'hour': [when.hour for when in times],
+                'minute': [when.minute for when in times],
+                'day_of_week': [when.weekday() for when in times],
+                'is_weekend': [when.weekday() >= 5 for when in times],
+                'weather_condition': [bus.weather_condition for bus in buses],
+                'traffic_level': [bus.traffic_level for bus in buses],
+                'route_id': [index.route_ids[route] for _, route, _ in pending],
+                'avg_speed': [bus.avg_speed for bus in buses],
+                'occupancy_percentage': [bus.occupancy_percentage for bus in buses]
+            }
+            columns = {name: np.repeat(np.asarray(values), counts) for name, values in per_bus.items()}
+            columns['distance_km'] = np.concatenate(
+                [distances[position, stops] for position, _, stops in pending] or [np.empty(0)]
+            )
+            features = bundle.eta_pipeline.transform(columns)
+        
+        try:
+            predictions = bundle.predict_eta_rows(features) if len(features) else np.empty((0, 4))
         except Exception as e:
-            logger.error(f"Error predicting occupancy: {e}")
-            raise HTTPException(status_code=500, detail="Error making occupancy prediction")
+            logger.error(f"Error updating ETA board: {e}")
+            raise HTTPException(status_code=500, detail="Error making ETA prediction")
+        
+        with service_metrics.stage('board', 'update'):
+            entries = []
+            bus_rows = np.split(predictions, np.cumsum(counts)[:-1])
+            for (position, route, stops), rows, when in zip(pending, bus_rows, times):
+                ping = pings[position]
+                entries.append(BoardEntry(
+                    ping.bus_id, index.route_ids[route], float(snap.along_km[position]),
+                    index.stop_ids[route, stops].tolist(), distances[position, stops].tolist(), rows,
+                    when, bundle.version
+                ))
+                items[position].route_id = index.route_ids[route]
+                items[position].stops = len(stops)
+            self.eta_board.update(entries)
+        
+        return BoardUpdateResponse(
+            updated=items,
+            succeeded=len(entries),
+            failed=len(pings) - len(entries),
+            model_version=bundle.version,
+            timestamp=datetime.now()
+        )
+    
+    @staticmethod
+    def stop_etas(entry: BoardEntry, now: float) -> List[StopETA]:
+        """Response rows for a board entry's downstream stops, counted down to now"""
+        return [
+            StopETA(stop_id=stop_id, distance_km=distance, **entry.eta(column, now))
+            for column, (stop_id, distance) in enumerate(zip(entry.stop_ids, entry.distances_km))
+        ]
+    
+    def route_board(self, route_id: str) -> RouteBoardResponse:
+        """Every bus on a route with its ETAs to the stops ahead, in order along the route"""
+        index = self.bundle.route_index
+        if index is not None and index.route_code(route_id) < 0:
+            raise HTTPException(status_code=404, detail=f"Unknown route: {route_id}")
+        
+        entries = sorted(self.eta_board.routes([route_id]), key=lambda entry: entry.along_km)
+        now = time.time()
+        return RouteBoardResponse(
+            route_id=route_id,
+            buses=[
+                BusBoard(
+                    bus_id=entry.bus_id,
+                    along_km=entry.along_km,
+                    updated_at=entry.updated_at,
+                    model_version=entry.version,
+                    stops=self.stop_etas(entry, now)
+                )
+                for entry in entries
+            ],
+            timestamp=datetime.now()
+        )
+    
+    def stop_board(self, stop_id: str) -> StopBoardResponse:
+        """Arrivals at a stop from every route serving it, soonest first"""
+        index = self.bundle.route_index
+        if index is None:
+            raise HTTPException(status_code=503, detail="Route geometry not available")
+        if stop_id not in index.stops:
+            raise HTTPException(status_code=404, detail=f"Unknown stop: {stop_id}")
+        
+        serving = [index.route_ids[route] for route in np.flatnonzero((index.stop_ids == stop_id).any(axis=1))]
+        now = time.time()
+        arrivals = []
+        for entry in self.eta_board.routes(serving):
+            # A route can pass a stop twice; the first downstream visit is the next arrival
+            if stop_id not in entry.stop_ids:
+                continue
+            column = entry.stop_ids.index(stop_id)
+            arrivals.append((entry.arrivals[column][0], StopArrival(
+                bus_id=entry.bus_id,
+                route_id=entry.route_id,
+                distance_km=entry.distances_km[column],
+                updated_at=entry.updated_at,
+                **entry.eta(column, now)
+            )))
+        # Sorted on the predicted arrival time, so buses pinged at different times compare fairly
+        arrivals.sort(key=lambda arrival: arrival[0])
+        return StopBoardResponse(
+            stop_id=stop_id,
+            arrivals=[arrival for _, arrival in arrivals],
+            timestamp=datetime.now()
+        )
+    
+    def columnar_features(self, pipeline: FeaturePipeline, body: bytes) -> np.ndarray:
+        """Feature matrix for a columnar request body"""
+        try:
+            columns = wire_format.decode_columns(body)
+        except wire_format.WireFormatError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        
+        missing = pipeline.missing_inputs(columns)
+        if missing:
+            raise HTTPException(status_code=400, detail=f"Missing columns: {', '.join(missing)}")
+        rows = len(columns['hour'])
+        if rows > MAX_COLUMNAR_ROWS:
+            raise HTTPException(
+                status_code=413,
+                detail=f"Batch of {rows} rows exceeds limit of {MAX_COLUMNAR_ROWS}"
+            )
+        try:
+            return pipeline.transform(columns)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    
+    def columnar_schema(self) -> dict:
+        """Columns and vocabulary codes accepted by the columnar endpoints"""
+        bundle = self.bundle
+        models = {}
+        for name, pipeline in (('eta', bundle.eta_pipeline), ('occupancy', bundle.occupancy_pipeline)):
+            models[name] = {
+                "inputs": pipeline.inputs,
+                "optional": {column: value for column, value in OPTIONAL_INPUTS.items() if column in pipeline.inputs},
+                "categorical": {
+                    feature: {
+                        "source": spec['source'],
+                        "codes": {value: code for code, value in enumerate(spec['vocabulary'])},
+                        "default": spec['default']
+                    }
+                    for feature, spec in pipeline.categorical.items()
+                }
+            }
+        return {
+            "content_type": wire_format.CONTENT_TYPE,
+            "wire_version": wire_format.VERSION,
+            "type_codes": {code.decode(): dtype.str for code, dtype in wire_format.DTYPES.items()},
+            "model_version": bundle.version,
+            "models": models
+        }
+    
+    def predict_eta_columns(self, body: bytes):
+        """Predict ETAs for a columnar batch; returns (columnar result, model version)
+        
+        Result columns are eta_minutes, eta_p10_minutes, eta_p90_minutes and
+        confidence (bounds are NaN without a calibration). The result cache is
+        skipped: keying every row would bring back the per-row cost this
+        format avoids.
+        """
+        bundle = self.bundle
+        if not bundle.eta_ready:
+            raise HTTPException(status_code=503, detail="ETA model not available")
+        
+        with service_metrics.stage('eta', 'feature_build'):
+            features = self.columnar_features(bundle.eta_pipeline, body)
+        try:
+            rows = bundle.predict_eta_rows(features)
+        except Exception as e:
+            logger.error(f"Error predicting ETA columns: {e}")
+            raise HTTPException(status_code=500, detail="Error making ETA batch prediction")
+        
+        with service_metrics.stage('eta', 'response'):
+            names = ('eta_minutes', 'eta_p10_minutes', 'eta_p90_minutes', 'confidence')
+            return wire_format.encode_columns(dict(zip(names, rows.T))), bundle.version
+    
+    def predict_occupancy_columns(self, body: bytes):
+        """Predict occupancy for a columnar batch; returns (columnar result, model version)
+        
+        Result columns are occupancy_percentage, occupancy_p10, occupancy_p90
+        and confidence.
+        """
+        bundle = self.bundle
+        if not bundle.occupancy_ready:
+            raise HTTPException(status_code=503, detail="Occupancy model not available")
+        
+        with service_metrics.stage('occupancy', 'feature_build'):
+            features = self.columnar_features(bundle.occupancy_pipeline, body)
+        try:
+            table = bundle.occupancy_table
+            if table is not None:
+                with service_metrics.stage('occupancy', 'lookup'):
+                    occupancy, found = table.lookup(features)
+            else:
+                occupancy, found = np.zeros((len(features), 4)), np.zeros(len(features), dtype=bool)
+            if not found.all():
+                occupancy[~found] = bundle.predict_occupancy_rows(features[~found])
+        except Exception as e:
+            logger.error(f"Error predicting occupancy columns: {e}")
+            raise HTTPException(status_code=500, detail="Error making occupancy batch prediction")
+        
+        with service_metrics.stage('occupancy', 'response'):
+            names = ('occupancy_percentage', 'occupancy_p10', 'occupancy_p90', 'confidence')
+            return wire_format.encode_columns(dict(zip(names, occupancy.T))), bundle.version
+    
+    async def stream_eta(self, chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+        """Score NDJSON ETA requests in fixed-size chunks, yielding NDJSON results
+        
+        Each output line is an ETABatchPredictionItem whose index is the input
+        record's position in the stream (blank lines are not counted). Input is
+        only read once the previous chunk's results have been sent, so memory
+        stays bounded by the chunk size whatever the stream length.
+        """
+        offset = 0
+        items, bad_lines = [], {}
+        
+        async def predict(positions: List[int]) -> List[ETABatchPredictionItem]:
+            try:
+                response = await run_in_threadpool(self.predict_eta_batch, [items[position] for position in positions])
+                return response.predictions
+            except HTTPException as e:
+                return [ETABatchPredictionItem(index=i, error=e.detail) for i in range(len(positions))]
+            except Exception as e:
+                # The response is already under way, so errors become item lines;
+                # retry record by record to find the ones that fail
+                if len(positions) > 1:
+                    logger.warning(f"Error scoring ETA stream chunk, retrying record by record: {e}")
+                    return [item for position in positions for item in await predict([position])]
+                logger.error(f"Error scoring ETA stream record: {e}")
+                return [ETABatchPredictionItem(index=0, error="Error making ETA prediction")]
+        
+        async def score():
+            results = [None] * len(items)
+            for position, error in bad_lines.items():
+                results[position] = ETABatchPredictionItem(index=position, error=error)
+            good = [position for position in range(len(items)) if position not in bad_lines]
+            if good:
+                for position, item in zip(good, await predict(good)):
+                    item.index = position
+                    results[position] = item
+            for item in results:
+                item.index += offset
+            return "".join(item.model_dump_json() + "\n" for item in results).encode()
+        
+        async for line in iter_ndjson_lines(chunks, STREAM_MAX_LINE_BYTES):
+            if line is not None and not line.strip():
+                continue
+            if line is None:
+                bad_lines[len(items)] = f"Line exceeds {STREAM_MAX_LINE_BYTES} bytes"
+                items.append(None)
+            else:
+                try:
+                    item = json.loads(line)
+                    if not isinstance(item, dict):
+                        raise ValueError("expected a JSON object")
+                    items.append(item)
+                except ValueError as e:
+                    bad_lines[len(items)] = f"Invalid JSON: {e}"
+                    items.append(None)
+            
+            if len(items) >= STREAM_CHUNK_SIZE:
+                yield await score()
+                offset += len(items)
+                items, bad_lines = [], {}
+        
+        if items:
+            yield await score()
 
-# Initialize ML service
-ml_service = MLService()
+# Initialize ML service; models are loaded by the lifespan handler
+ml_service = MLService(load=False)
 
 @app.get("/health", response_model=HealthResponse)
 async def health_check():
-    """Health check endpoint"""
+    """Liveness check: the process is up and serving requests"""
     models_loaded = (
         ml_service.eta_model is not None and 
         ml_service.occupancy_model is not None
@@ -240,32 +2036,223 @@ async def health_check():
         timestamp=datetime.now()
     )
 
+@app.get("/ready", response_model=ReadinessResponse)
+async def readiness_check():
+    """Readiness check: models are loaded and warmed up"""
+    response = ReadinessResponse(
+        ready=ml_service.ready,
+        version=ml_service.bundle.version,
+        startup_phases=dict(ml_service.startup_phases, **ml_service.bundle.phases),
+        error=ml_service.load_error,
+        timestamp=datetime.now()
+    )
+    if not ml_service.ready:
+        return JSONResponse(status_code=503, content=jsonable_encoder(response))
+    return response
+
 @app.post("/predict/eta", response_model=ETAPredictionResponse)
 async def predict_eta(request: ETAPredictionRequest):
     """Predict ETA for a bus"""
-    return ml_service.predict_eta(request)
+    return await ml_service.predict_eta_async(request)
 
 @app.post("/predict/occupancy", response_model=OccupancyPredictionResponse)
 async def predict_occupancy(request: OccupancyPredictionRequest):
     """Predict occupancy for a bus"""
-    return ml_service.predict_occupancy(request)
+    return await ml_service.predict_occupancy_async(request)
+
+@app.post("/predict/eta/batch", response_model=ETABatchPredictionResponse)
+async def predict_eta_batch(request: ETABatchPredictionRequest):
+    """Predict ETAs for a batch of buses"""
+    return await run_in_threadpool(ml_service.predict_eta_batch, request.requests)
+
+@app.post("/predict/eta/stream")
+async def predict_eta_stream(request: Request):
+    """Predict ETAs for newline-delimited JSON requests, streaming NDJSON results"""
+    if not ml_service.bundle.eta_ready:
+        raise HTTPException(status_code=503, detail="ETA model not available")
+    return NDJSONStreamingResponse(ml_service.stream_eta(request.stream()))
+
+@app.get("/predict/columns/schema")
+async def columnar_schema():
+    """Columns, type codes and vocabulary codes for the columnar endpoints"""
+    return ml_service.columnar_schema()
+
+@app.post("/predict/eta/columns")
+async def predict_eta_columns(request: Request):
+    """Predict ETAs for a columnar binary batch"""
+    body, version = await run_in_threadpool(ml_service.predict_eta_columns, await request.body())
+    return Response(content=body, media_type=wire_format.CONTENT_TYPE, headers={"X-Model-Version": version or ""})
+
+@app.post("/predict/occupancy/columns")
+async def predict_occupancy_columns(request: Request):
+    """Predict occupancy for a columnar binary batch"""
+    body, version = await run_in_threadpool(ml_service.predict_occupancy_columns, await request.body())
+    return Response(content=body, media_type=wire_format.CONTENT_TYPE, headers={"X-Model-Version": version or ""})
+
+@app.post("/predict/occupancy/batch", response_model=OccupancyBatchPredictionResponse)
+async def predict_occupancy_batch(request: OccupancyBatchPredictionRequest):
+    """Predict occupancy for a batch of buses"""
+    return await run_in_threadpool(ml_service.predict_occupancy_batch, request.requests)
+
+@app.post("/predict/demand", response_model=DemandPredictionResponse)
+async def predict_demand(request: DemandPredictionRequest):
+    """Forecast boardings for one route, hour, day type and weather"""
+    return ml_service.predict_demand(request)
+
+@app.get("/predict/demand/grid")
+async def demand_grid(if_none_match: Optional[str] = Header(None)):
+    """Full route x hour x day type x weather demand grid
+    
+    The body only changes with the model version, which is sent as the ETag.
+    """
+    grid = ml_service.demand_grid_or_503()
+    etag = f'"{grid.version}"'
+    if if_none_match == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    return Response(content=grid.body(), media_type="application/json", headers={"ETag": etag})
+
+@app.get("/predict/demand/forecast", response_model=DemandForecastResponse)
+async def demand_forecast(hours: int = 24, weather_condition: str = 'SUNNY', route_id: Optional[str] = None):
+    """Demand for every route (or one) over the next hours"""
+    return ml_service.demand_forecast(hours, weather_condition, route_id)
+
+@app.get("/predict/demand/routes/{route_id}", response_model=DemandRouteDayResponse)
+async def demand_route_day(route_id: str, day_type: str = 'WEEKDAY', weather_condition: str = 'SUNNY'):
+    """Hourly demand for one route over a day"""
+    return ml_service.demand_route_day(route_id, day_type, weather_condition)
+
+@app.post("/routes/distances", response_model=RouteDistanceResponse)
+async def route_distances(request: RouteDistanceRequest):
+    """Remaining along-route distance from each bus to every downstream stop"""
+    return await run_in_threadpool(ml_service.route_distances, request.buses)
+
+@app.post("/board/pings", response_model=BoardUpdateResponse)
+async def board_pings(request: BoardUpdateRequest):
+    """Update the ETA board from bus position pings; only the pinged buses are recomputed"""
+    return await run_in_threadpool(ml_service.update_board, request.pings)
+
+@app.get("/board/routes/{route_id}", response_model=RouteBoardResponse)
+async def route_board(route_id: str):
+    """ETAs of every bus on a route to its downstream stops, from the board"""
+    return ml_service.route_board(route_id)
+
+@app.get("/board/stops/{stop_id}", response_model=StopBoardResponse)
+async def stop_board(stop_id: str):
+    """Upcoming arrivals at a stop, from the board"""
+    return ml_service.stop_board(stop_id)
+
+@app.delete("/board/buses/{bus_id}")
+async def remove_board_bus(bus_id: str):
+    """Take a bus off the board, e.g. when it goes out of service"""
+    if not ml_service.eta_board.remove(bus_id):
+        raise HTTPException(status_code=404, detail=f"Bus not on the board: {bus_id}")
+    return {"bus_id": bus_id, "removed": True}
 
 @app.get("/models/status")
 async def get_models_status():
     """Get status of loaded models"""
     return {
+        "model": ml_service.bundle.status(),
         "eta_model": ml_service.eta_model is not None,
         "occupancy_model": ml_service.occupancy_model is not None,
+        "demand_model": ml_service.demand_model is not None,
         "eta_scaler": ml_service.eta_scaler is not None,
-        "occupancy_scaler": ml_service.occupancy_scaler is not None
+        "occupancy_scaler": ml_service.occupancy_scaler is not None,
+        "compiled": {
+            "eta": ml_service.eta_engine is not None,
+            "occupancy": ml_service.occupancy_engine is not None
+        },
+        "eta_cache": ml_service.eta_cache.stats() if ml_service.eta_cache is not None else {"backend": "off"},
+        "occupancy_table": (
+            dict(enabled=True, **ml_service.occupancy_table.stats())
+            if ml_service.occupancy_table is not None else {"enabled": False}
+        ),
+        "route_index": (
+            ml_service.bundle.route_index.stats() if ml_service.bundle.route_index is not None else None
+        ),
+        "eta_board": ml_service.eta_board.stats(),
+        "demand_grid": (
+            dict(enabled=True, **ml_service.demand_grid.stats())
+            if ml_service.demand_grid is not None else {"enabled": False}
+        ),
+        "batching": {
+            "eta": ml_service.eta_batcher.stats(),
+            "occupancy": ml_service.occupancy_batcher.stats()
+        },
+        "single_flight": {
+            "eta": ml_service.eta_flights.stats() if ml_service.eta_flights is not None else {"enabled": False},
+            "occupancy": (
+                ml_service.occupancy_flights.stats() if ml_service.occupancy_flights is not None else {"enabled": False}
+            )
+        }
     }
 
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics"""
+    body, content_type = service_metrics.render()
+    return Response(content=body, media_type=content_type)
+
+@app.post("/debug/profile", response_class=PlainTextResponse)
+async def debug_profile(
+    seconds: float = 10.0,
+    fraction: Optional[float] = None,
+    max_requests: Optional[int] = None,
+    interval_ms: float = 5.0,
+    format: str = "collapsed",
+    idle: bool = False,
+    x_admin_token: Optional[str] = Header(None)
+):
+    """Sample the service's stacks and return collapsed stacks or a stats table
+
+    Without `fraction`, every thread is sampled for `seconds`. With it, only
+    that fraction of requests is profiled, until `max_requests` of them have
+    completed or `seconds` have passed.
+    """
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if x_admin_token is None or not hmac.compare_digest(x_admin_token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+    if not 0 < seconds <= PROFILE_MAX_SECONDS:
+        raise HTTPException(status_code=400, detail=f"seconds must be in (0, {PROFILE_MAX_SECONDS:g}]")
+    if fraction is not None and not 0 < fraction <= 1:
+        raise HTTPException(status_code=400, detail="fraction must be in (0, 1]")
+    if max_requests is not None and max_requests < 1:
+        raise HTTPException(status_code=400, detail="max_requests must be at least 1")
+    if not 0.5 <= interval_ms <= 1000:
+        raise HTTPException(status_code=400, detail="interval_ms must be in [0.5, 1000]")
+    if format not in ("collapsed", "stats"):
+        raise HTTPException(status_code=400, detail="format must be collapsed or stats")
+
+    try:
+        session = request_profiler.start(seconds, interval_ms / 1000.0, fraction, max_requests)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    try:
+        while not session.done.is_set():
+            await asyncio.sleep(0.05)
+    finally:
+        session.stop()
+
+    logger.info(f"Profiled for {session.elapsed:.1f}s, {session.ticks} sampling ticks")
+    if format == "stats":
+        return session.stats(idle=idle)
+    return session.collapsed(idle=idle)
+
 @app.post("/models/reload")
-async def reload_models():
-    """Reload ML models"""
+async def reload_models(force: bool = True):
+    """Reload ML models
+    
+    Always reloads by default: in the legacy layout the version only covers
+    the model files, so a swapped scaler or pipeline would look unchanged.
+    Pass force=false to skip the reload when the published version is
+    already being served.
+    """
     try:
-        ml_service.load_models()
-        return {"message": "Models reloaded successfully"}
+        reloaded = await run_in_threadpool(ml_service.load_models, force)
+        if not reloaded:
+            return {"message": "Models already up to date", "version": ml_service.bundle.version}
+        return {"message": "Models reloaded successfully", "version": ml_service.bundle.version}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error reloading models: {e}")
 
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+Urban Mobility Bus Agent - Parallel Model Selection
+
+Fits candidate models and their cross-validation folds in a process pool.
+Training arrays are written once as .npy files and memory-mapped by every
+worker, so only task descriptions and scores cross process boundaries.
+
+Selection runs in two rounds:
+1. Every candidate is fitted on the training split and scored on the holdout
+2. Candidates whose holdout R² trails the best by more than the elimination
+   margin are dropped; the rest run their CV folds
+
+Each candidate has a wall-clock budget covering both rounds, counted from
+when its first task is handed to a worker, so time spent waiting in the
+queue behind other candidates is not charged to it. Tasks of a
+candidate that runs out of budget are no longer scheduled, and the pool is
+terminated at the end so abandoned fits do not hold up training.
+"""
+
+from typing import Dict, Optional
+import multiprocessing
+import tempfile
+import time
+import os
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Seconds between checks on running tasks and candidate deadlines
+POLL_INTERVAL = 0.05
+
+def _load_arrays(data_dir: str) -> Dict[str, np.ndarray]:
+    return {
+        name: np.load(os.path.join(data_dir, f"{name}.npy"), mmap_mode='r')
+        for name in ('X_train', 'y_train', 'X_test', 'y_test')
+    }
+
+def _fit_holdout(data_dir: str, name: str, estimator, output_dir: str) -> dict:
+    """Worker: fit on the training split, score on the holdout, save the model"""
+    import joblib
+    from sklearn.base import clone
+    from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
+
+    data = _load_arrays(data_dir)
+    model = clone(estimator)
+
+    started = time.perf_counter()
+    model.fit(data['X_train'], data['y_train'])
+    fitted = time.perf_counter()
+    y_pred = model.predict(data['X_test'])
+    predicted = time.perf_counter()
+
+    model_path = os.path.join(output_dir, f"{name}.pkl")
+    joblib.dump(model, model_path)
+
+    return {
+        'mae': float(mean_absolute_error(data['y_test'], y_pred)),
+        'mse': float(mean_squared_error(data['y_test'], y_pred)),
+        'r2': float(r2_score(data['y_test'], y_pred)),
+        'fit_seconds': fitted - started,
+        'predict_seconds': predicted - fitted,
+        'model_path': model_path
+    }
+
+def _fit_fold(data_dir: str, estimator, n_splits: int, fold: int) -> dict:
+    """Worker: fit and score one CV fold of the training split"""
+    from sklearn.base import clone
+    from sklearn.metrics import r2_score
+    from sklearn.model_selection import KFold
+
+    data = _load_arrays(data_dir)
+    X, y = data['X_train'], data['y_train']
+    # Same unshuffled folds cross_val_score(cv=n_splits) uses for regressors
+    train_index, val_index = list(KFold(n_splits).split(np.arange(len(y))))[fold]
+
+    started = time.perf_counter()
+    model = clone(estimator).fit(X[train_index], y[train_index])
+    score = r2_score(y[val_index], model.predict(X[val_index]))
+    return {'fold': fold, 'r2': float(score), 'seconds': time.perf_counter() - started}
+
+class ParallelModelSelector:
+    """Pick the best of several regressors using a pool of worker processes"""
+
+    def __init__(self, n_jobs: Optional[int] = None, time_budget: Optional[float] = None,
+                 elimination_margin: float = 0.1, cv_folds: int = 5):
+        self.n_jobs = max(1, n_jobs or os.cpu_count() or 1)
+        self.time_budget = time_budget
+        self.elimination_margin = elimination_margin
+        self.cv_folds = cv_folds
+
+    def select(self, candidates: dict, X_train, y_train, X_test, y_test):
+        """Return (best model, best holdout R², timing report)"""
+        import joblib
+
+        started = time.perf_counter()
+        report = {
+            name: {'status': 'running', 'holdout': None, 'cv_folds': [], 'cv_r2_mean': None, 'cv_r2_std': None}
+            for name in candidates
+        }
+
+        with tempfile.TemporaryDirectory(prefix='model-selection-') as work_dir:
+            # Write the arrays once; workers memory-map them instead of unpickling copies
+            for array_name, array in (('X_train', X_train), ('y_train', y_train),
+                                      ('X_test', X_test), ('y_test', y_test)):
+                np.save(os.path.join(work_dir, f"{array_name}.npy"), np.ascontiguousarray(array, dtype=np.float64))
+
+            self._run(candidates, report, work_dir)
+
+            finished = [name for name, entry in report.items() if entry['holdout'] is not None]
+            if not finished:
+                raise RuntimeError("No ETA model candidate finished within its time budget")
+            best_name = max(finished, key=lambda name: report[name]['holdout']['r2'])
+            best_model = joblib.load(report[best_name]['holdout'].pop('model_path'))
+            for entry in report.values():
+                if entry['holdout'] is not None:
+                    entry['holdout'].pop('model_path', None)
+
+        timing = {
+            'n_jobs': self.n_jobs,
+            'time_budget_seconds': self.time_budget,
+            'elimination_margin': self.elimination_margin,
+            'cv_folds': self.cv_folds,
+            'wall_seconds': time.perf_counter() - started,
+            'best_model': best_name,
+            'candidates': report
+        }
+        return best_model, report[best_name]['holdout']['r2'], timing
+
+    def _run(self, candidates: dict, report: dict, work_dir: str):
+        """Schedule holdout fits, then CV folds for surviving candidates"""
+        queue = [('holdout', name, None) for name in candidates]
+        # Set when a candidate's first task is dispatched
+        deadlines = {name: None for name in candidates}
+        running = {}
+        abandoned = []
+        selection_done = False
+
+        processes = min(self.n_jobs, len(candidates) * (self.cv_folds + 1))
+        pool = multiprocessing.get_context().Pool(processes)
+        completed = False
+        try:
+            while queue or running or not selection_done:
+                now = time.perf_counter()
+                progressed = False
+
+                # Out-of-budget candidates lose their queued and running tasks
+                for name, deadline in deadlines.items():
+                    if deadline is not None and now > deadline and report[name]['status'] == 'running':
+                        report[name]['status'] = 'timed_out'
+                        logger.warning(f"{name} exceeded its {self.time_budget:.0f}s training budget")
+                queue = [task for task in queue if report[task[1]]['status'] == 'running']
+                for task in list(running):
+                    if report[task[1]]['status'] != 'running':
+                        abandoned.append(running.pop(task))
+
+                # Round 2 starts once every candidate has a holdout score or is out of budget
+                if not selection_done and all(
+                    entry['holdout'] is not None or entry['status'] != 'running' for entry in report.values()
+                ):
+                    queue.extend(self._eliminate(report))
+                    selection_done = True
+
+                # Keep every worker busy, counting abandoned fits that still occupy one
+                busy = len(running) + sum(1 for result in abandoned if not result.ready())
+                while queue and busy < processes:
+                    task = queue.pop(0)
+                    kind, name, fold = task
+                    if kind == 'holdout':
+                        args = (_fit_holdout, (work_dir, name, candidates[name], work_dir))
+                    else:
+                        args = (_fit_fold, (work_dir, candidates[name], self.cv_folds, fold))
+                    running[task] = pool.apply_async(*args)
+                    if self.time_budget and deadlines[name] is None:
+                        deadlines[name] = time.perf_counter() + self.time_budget
+                    busy += 1
+                    progressed = True
+
+                for task, result in list(running.items()):
+                    if not result.ready():
+                        continue
+                    del running[task]
+                    progressed = True
+                    kind, name, _ = task
+                    if kind == 'holdout':
+                        report[name]['holdout'] = result.get()
+                    else:
+                        report[name]['cv_folds'].append(result.get())
+                        self._finish_cv(name, report[name])
+
+                # Nothing to start or collect, e.g. abandoned fits holding every worker
+                if not progressed:
+                    time.sleep(POLL_INTERVAL)
+            completed = True
+        finally:
+            # After an error, or with abandoned fits still running, don't wait for in-flight fits
+            if not completed or any(not result.ready() for result in abandoned):
+                pool.terminate()
+            else:
+                pool.close()
+            pool.join()
+
+    def _eliminate(self, report: dict) -> list:
+        """Drop clearly losing candidates and return CV tasks for the rest"""
+        scored = {name: entry['holdout']['r2'] for name, entry in report.items()
+                  if entry['holdout'] is not None and entry['status'] == 'running'}
+        if not scored:
+            return []
+        best_r2 = max(scored.values())
+
+        tasks = []
+        for name, r2 in scored.items():
+            if r2 < best_r2 - self.elimination_margin:
+                report[name]['status'] = 'eliminated'
+                logger.info(f"{name} eliminated before CV (R² {r2:.3f} vs best {best_r2:.3f})")
+            else:
+                tasks.extend(('cv', name, fold) for fold in range(self.cv_folds))
+        return tasks
+
+    def _finish_cv(self, name: str, entry: dict):
+        if len(entry['cv_folds']) < self.cv_folds:
+            return
+        scores = np.array([fold['r2'] for fold in entry['cv_folds']])
+        entry['cv_folds'].sort(key=lambda fold: fold['fold'])
+        entry['cv_r2_mean'] = float(scores.mean())
+        entry['cv_r2_std'] = float(scores.std())
+        entry['status'] = 'completed'
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+Urban Mobility Bus Agent - Versioned Model Store
+
+Layout under the models directory:
+
+    models/
+    ├── CURRENT                     # name of the published version
+    └── versions/
+        └── 20240101-120000/
+            ├── manifest.json       # version, creation time, artifact sizes/hashes
+            ├── eta_model.pkl
+            ├── eta_scaler.pkl
+            ├── eta_engine/         # compiled tree arrays (.npy, memory-mappable)
+            ├── eta_compact.npz     # pruned float32 export (compressed)
+            └── ...
+
+Versions are immutable once published; CURRENT is replaced atomically, so
+readers always see a complete version. Directories without CURRENT are read
+in the original flat layout (models/eta_model.pkl, ...).
+"""
+
+from datetime import datetime
+import hashlib
+import json
+import os
+import shutil
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+MANIFEST = 'manifest.json'
+CURRENT = 'CURRENT'
+VERSIONS = 'versions'
+
+def create_version(models_dir: str) -> str:
+    """Create an empty directory for a new model version and return its path"""
+    base = datetime.now().strftime('%Y%m%d-%H%M%S')
+    versions_dir = os.path.join(models_dir, VERSIONS)
+    os.makedirs(versions_dir, exist_ok=True)
+
+    version, suffix = base, 1
+    while True:
+        path = os.path.join(versions_dir, version)
+        try:
+            os.makedirs(path)
+            return path
+        except FileExistsError:
+            suffix += 1
+            version = f"{base}-{suffix}"
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def write_json_atomic(path: str, payload: dict):
+    """Write JSON to a temp file and rename it over the target"""
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, 'w') as f:
+        json.dump(payload, f, indent=2)
+    os.replace(tmp_path, path)
+
+def write_manifest(version_dir: str) -> dict:
+    """Record every artifact in a version directory"""
+    artifacts = {}
+    for root, _, files in os.walk(version_dir):
+        for name in sorted(files):
+            if name == MANIFEST or '.tmp.' in name:
+                continue
+            path = os.path.join(root, name)
+            artifacts[os.path.relpath(path, version_dir)] = {
+                'bytes': os.path.getsize(path),
+                'sha256': file_sha256(path)
+            }
+
+    manifest = {
+        'version': os.path.basename(version_dir),
+        'created_at': datetime.now().isoformat(),
+        'artifacts': artifacts
+    }
+    write_json_atomic(os.path.join(version_dir, MANIFEST), manifest)
+    return manifest
+
+def read_manifest(version_dir: str) -> dict:
+    with open(os.path.join(version_dir, MANIFEST)) as f:
+        return json.load(f)
+
+def current_version(models_dir: str):
+    """Return (version, directory) of the published version, or (None, None)"""
+    try:
+        with open(os.path.join(models_dir, CURRENT)) as f:
+            version = f.read().strip()
+    except FileNotFoundError:
+        return None, None
+    return version, os.path.join(models_dir, VERSIONS, version)
+
+def publish(models_dir: str, version_dir: str, retrained=()) -> dict:
+    """Make a version current, carrying over artifacts it did not retrain
+
+    Artifacts missing from the new version are hard-linked (or copied) from
+    the previously published one, so retraining a single model keeps the
+    others available. Nothing is carried over for the models named in
+    ``retrained``, so an old model's engine, compact export or calibration
+    never ends up next to its replacement.
+    """
+    prefixes = tuple(f"{model}_" for model in retrained)
+    _, previous_dir = current_version(models_dir)
+    if previous_dir and os.path.isdir(previous_dir):
+        for name in os.listdir(previous_dir):
+            source = os.path.join(previous_dir, name)
+            target = os.path.join(version_dir, name)
+            if name == MANIFEST or os.path.exists(target) or (prefixes and name.startswith(prefixes)):
+                continue
+            if os.path.isdir(source):
+                shutil.copytree(source, target, copy_function=_link_or_copy)
+            else:
+                _link_or_copy(source, target)
+
+    manifest = write_manifest(version_dir)
+
+    # Swap the pointer in one rename so readers never see a partial version
+    tmp_path = os.path.join(models_dir, f"{CURRENT}.tmp.{os.getpid()}")
+    with open(tmp_path, 'w') as f:
+        f.write(manifest['version'])
+    os.replace(tmp_path, os.path.join(models_dir, CURRENT))
+
+    logger.info(f"Published model version {manifest['version']}")
+    return manifest
+
+def _link_or_copy(source: str, target: str):
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copy2(source, target)
+
+def resolve(models_dir: str):
+    """Return (version, directory) to load from, falling back to the flat layout"""
+    version, version_dir = current_version(models_dir)
+    if version_dir and os.path.isdir(version_dir):
+        return version, version_dir
+
+    # Flat layout: identify the version by the model files' mtimes
+    stamps = []
+    for name in ('eta_model.pkl', 'occupancy_model.pkl'):
+        path = os.path.join(models_dir, name)
+        if os.path.exists(path):
+            stat = os.stat(path)
+            stamps.append(f"{stat.st_mtime_ns:x}{stat.st_size:x}")
+    return ("legacy-" + hashlib.sha1("|".join(stamps).encode()).hexdigest()[:12]), models_dir
+
+def artifact_path(models_dir: str, name: str) -> str:
+    """Path of an artifact in the version currently being served"""
+    _, directory = resolve(models_dir)
+    return os.path.join(directory, name)
+
+def load_artifact(path: str, mmap: bool = True):
+    """joblib.load with numpy arrays memory-mapped read-only
+
+    Memory-mapped arrays are shared through the page cache by every process
+    that maps the same file, instead of being copied into each worker.
+    """
+    import joblib
+    return joblib.load(path, mmap_mode='r' if mmap else None)
+
+class ModelRegistry:
+    """In-memory cache of loaded artifacts, keyed by path
+
+    An entry is reused while the file's mtime and size are unchanged. When
+    they change, the file is re-hashed and only reloaded if its content
+    differs, so a touched or re-copied file keeps its loaded object.
+    """
+
+    def __init__(self, mmap: bool = False):
+        self.mmap = mmap
+        self.loads = 0
+        self.hits = 0
+        self._entries = {}  # path -> (stat key, sha256, object)
+        self._lock = threading.Lock()
+
+    def get(self, path: str):
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        stat_key = (stat.st_mtime_ns, stat.st_size)
+
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry[0] == stat_key:
+                self.hits += 1
+                return entry[2]
+
+            digest = file_sha256(path)
+            if entry is not None and entry[1] == digest:
+                self._entries[path] = (stat_key, digest, entry[2])
+                self.hits += 1
+                return entry[2]
+
+            obj = load_artifact(path, mmap=self.mmap)
+            self._entries[path] = (stat_key, digest, obj)
+            self.loads += 1
+            return obj
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+# Shared by the trainer's prediction helpers
+registry = ModelRegistry()
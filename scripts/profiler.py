@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Urban Mobility Bus Agent - Sampling Profiler
+
+Wall-clock stack sampler for the running ML service. A background thread
+reads every thread's stack with sys._current_frames() at a fixed interval,
+so request handling (pydantic validation on the event loop) and inference
+(scaling and tree traversal on the executor threads) show up in one profile.
+
+A session either samples everything for a number of seconds, or samples only
+while a randomly chosen fraction of requests is in flight (other requests
+running at the same time are included in those samples). Nothing runs when
+no session is active.
+
+Reports:
+- collapsed: "frame;frame;frame count" lines for flamegraph.pl / speedscope
+- stats: per-function self and cumulative sample counts, pstats style
+"""
+
+from collections import Counter
+from typing import Optional
+import os
+import random
+import sys
+import threading
+import time
+
+# Leaf frames of threads that are waiting for work rather than doing it
+IDLE_FRAMES = {
+    ('selectors.py', 'select'),
+    ('threading.py', 'wait'),
+    ('queue.py', 'get'),
+    ('thread.py', '_worker'),
+    ('base_events.py', '_run_once'),
+}
+
+def frame_label(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+class ProfileSession:
+    """One profiling run; sampling happens on its own daemon thread"""
+
+    def __init__(self, seconds: float, interval: float, fraction: Optional[float] = None,
+                 max_requests: Optional[int] = None):
+        self.seconds = seconds
+        self.interval = interval
+        self.fraction = fraction
+        self.max_requests = max_requests
+        self.stacks = Counter()  # (thread name, code objects root first) -> samples
+        self.ticks = 0
+        self.requests_profiled = 0
+        self.in_flight = 0
+        self.started = None
+        self.elapsed = 0.0
+        self.done = threading.Event()
+        self._requests_running = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    def start(self):
+        self.started = time.perf_counter()
+        self._thread.start()
+
+    def stop(self):
+        self.done.set()
+        self._requests_running.set()
+
+    # Request selection for fraction mode, called by ProfilingMiddleware
+    def select_request(self) -> bool:
+        if self.fraction is None or self.done.is_set() or random.random() >= self.fraction:
+            return False
+        with self._lock:
+            self.in_flight += 1
+            self._requests_running.set()
+        return True
+
+    def finish_request(self):
+        with self._lock:
+            self.in_flight -= 1
+            self.requests_profiled += 1
+            if self.in_flight == 0:
+                self._requests_running.clear()
+            if self.max_requests is not None and self.requests_profiled >= self.max_requests:
+                self.stop()
+
+    def _run(self):
+        deadline = self.started + self.seconds
+        own_id = threading.get_ident()
+        names = {}
+        while not self.done.is_set():
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            # In fraction mode, sleep until a chosen request starts
+            if self.fraction is not None and not self._requests_running.wait(remaining):
+                break
+            if self.done.is_set():
+                break
+            self._sample(own_id, names)
+            time.sleep(self.interval)
+        self.elapsed = time.perf_counter() - self.started
+        self.done.set()
+
+    def _sample(self, own_id: int, names: dict):
+        self.ticks += 1
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_id:
+                continue
+            if thread_id not in names:
+                names.update((thread.ident, thread.name) for thread in threading.enumerate())
+            stack = []
+            while frame is not None:
+                stack.append(frame.f_code)
+                frame = frame.f_back
+            stack.reverse()
+            self.stacks[names.get(thread_id, str(thread_id)), tuple(stack)] += 1
+
+    def _busy_stacks(self, idle: bool):
+        for (thread_name, stack), count in self.stacks.items():
+            if not stack:
+                continue
+            leaf = stack[-1]
+            if not idle and (os.path.basename(leaf.co_filename), leaf.co_name) in IDLE_FRAMES:
+                continue
+            yield thread_name, stack, count
+
+    def collapsed(self, idle: bool = False) -> str:
+        """Folded stacks, one line per unique stack, rooted at the thread name"""
+        lines = [
+            ";".join([thread_name] + [frame_label(code) for code in stack]) + f" {count}"
+            for thread_name, stack, count in self._busy_stacks(idle)
+        ]
+        return "\n".join(sorted(lines)) + "\n"
+
+    def stats(self, idle: bool = False, limit: int = 50) -> str:
+        """Functions by cumulative samples, with self samples alongside"""
+        own, cumulative = Counter(), Counter()
+        total = 0
+        for _, stack, count in self._busy_stacks(idle):
+            total += count
+            own[stack[-1]] += count
+            for code in set(stack):
+                cumulative[code] += count
+
+        mode = f"fraction {self.fraction}, {self.requests_profiled} requests" if self.fraction is not None else "all requests"
+        lines = [
+            f"{total} busy samples from {self.ticks} ticks over {self.elapsed:.1f} s "
+            f"every {self.interval * 1000:.1f} ms ({mode})",
+            "",
+            f"{'cum%':>7} {'self%':>7} {'cum':>8} {'self':>8}  function"
+        ]
+        for code, count in cumulative.most_common(limit):
+            lines.append(
+                f"{100.0 * count / total:7.2f} {100.0 * own[code] / total:7.2f} "
+                f"{count:8d} {own[code]:8d}  {frame_label(code)}"
+            )
+        return "\n".join(lines) + "\n"
+
+class Profiler:
+    """Holds the active session, if any; one session runs at a time"""
+
+    def __init__(self):
+        self.session = None
+        self._lock = threading.Lock()
+
+    def start(self, seconds: float, interval: float, fraction: Optional[float] = None,
+              max_requests: Optional[int] = None) -> ProfileSession:
+        with self._lock:
+            if self.session is not None and not self.session.done.is_set():
+                raise RuntimeError("A profiling session is already running")
+            session = ProfileSession(seconds, interval, fraction, max_requests)
+            self.session = session
+        session.start()
+        return session
+
+class ProfilingMiddleware:
+    """ASGI middleware marking requests chosen for a fraction-mode session"""
+
+    def __init__(self, app, profiler: Profiler, exclude_paths=()):
+        self.app = app
+        self.profiler = profiler
+        self.exclude_paths = set(exclude_paths)
+
+    async def __call__(self, scope, receive, send):
+        session = self.profiler.session
+        if (session is None or scope['type'] != 'http' or scope['path'] in self.exclude_paths
+                or not session.select_request()):
+            await self.app(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            session.finish_request()
@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+"""
+Urban Mobility Bus Agent - Prediction Result Cache
+
+Caches ETA prediction rows (ETA, p10, p90, confidence) keyed on quantized
+request features, so requests that differ only by a few metres or a few
+km/h share one model evaluation.
+Backends:
+- InProcessCache: LRU + TTL dictionary local to one worker
+- RedisResultCache: shared across uvicorn workers through Redis (or any
+  client exposing get/set, such as FakeRedis for local runs)
+"""
+
+from collections import OrderedDict
+from typing import Dict, List, Optional
+import json
+import math
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Default bucket widths: 5 minutes, ~100 m of lat/lon, 100 m of distance, 1 km/h, 5 % occupancy
+DEFAULT_BUCKETS = {
+    'minute': 5.0,
+    'latitude': 0.001,
+    'longitude': 0.001,
+    'distance_km': 0.1,
+    'avg_speed': 1.0,
+    'occupancy_percentage': 5.0
+}
+
+# Bumped whenever the cached value format changes, so workers of different
+# versions sharing one Redis during a rolling deploy never read each other's
+# values (v2: JSON prediction rows instead of a bare ETA float)
+KEY_PREFIX = "eta:v2"
+
+# Values are rows of ETA, p10, p90 and confidence
+ROW_LENGTH = 4
+
+def decode_row(value) -> Optional[List[float]]:
+    """Prediction row from a stored JSON value, or None if it is not one"""
+    try:
+        row = json.loads(value)
+    except (TypeError, ValueError):
+        return None
+    if not isinstance(row, list) or len(row) != ROW_LENGTH:
+        return None
+    if not all(isinstance(item, (int, float)) and not isinstance(item, bool) for item in row):
+        return None
+    return [float(item) for item in row]
+
+def parse_buckets(spec: str) -> Dict[str, float]:
+    """Parse "field=width,field=width" into bucket widths over the defaults"""
+    buckets = dict(DEFAULT_BUCKETS)
+    for part in filter(None, (piece.strip() for piece in spec.split(','))):
+        field, _, width = part.partition('=')
+        if field not in DEFAULT_BUCKETS:
+            raise ValueError(f"Unknown cache bucket field: {field}")
+        buckets[field] = float(width)
+    return buckets
+
+class ETACacheKeyer:
+    """Build cache keys from ETA requests by snapping numeric fields to buckets"""
+
+    EXACT_FIELDS = ('route_id', 'hour', 'day_of_week', 'is_weekend', 'weather_condition', 'traffic_level')
+
+    def __init__(self, buckets: Optional[Dict[str, float]] = None):
+        self.buckets = dict(buckets or DEFAULT_BUCKETS)
+
+    def key(self, request, model_version: str) -> Optional[str]:
+        """Cache key for a request, namespaced by the model that answers it
+
+        None when a bucketed field is NaN or infinite, which has no bucket.
+        """
+        parts = [str(getattr(request, field)) for field in self.EXACT_FIELDS]
+        for field, width in self.buckets.items():
+            value = getattr(request, field)
+            if not math.isfinite(value):
+                return None
+            parts.append(str(round(value / width)) if width > 0 else repr(value))
+        return f"{KEY_PREFIX}:{model_version}:" + "|".join(parts)
+
+class InProcessCache:
+    """Thread-safe LRU cache with per-entry TTL"""
+
+    remote = False
+
+    def __init__(self, max_entries: int = 100000, ttl_seconds: float = 30.0):
+        self.max_entries = max_entries
+        self.ttl = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[List[float]]:
+        with self._lock:
+            return self._get(key, time.monotonic())
+
+    def get_many(self, keys: List[str]) -> List[Optional[List[float]]]:
+        """Values for many keys under one lock, None for misses"""
+        with self._lock:
+            now = time.monotonic()
+            return [self._get(key, now) for key in keys]
+
+    def _get(self, key: str, now: float) -> Optional[List[float]]:
+        entry = self._entries.get(key)
+        if entry is None or entry[1] < now:
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def set(self, key: str, value: List[float]):
+        self.set_many({key: value})
+
+    def set_many(self, items: Dict[str, List[float]]):
+        """Store many values under one lock"""
+        with self._lock:
+            expires = time.monotonic() + self.ttl
+            for key, value in items.items():
+                self._entries[key] = (value, expires)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "backend": "memory",
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+
+class RedisResultCache:
+    """Cache shared by all workers through a Redis-compatible client
+
+    Keys carry the model version, so a reload makes old entries unreachable
+    and their TTL reclaims them. LRU eviction is left to the Redis server's
+    maxmemory policy; every entry has a TTL, so volatile-lru applies.
+    """
+
+    remote = True
+
+    def __init__(self, client, ttl_seconds: float = 30.0):
+        self.client = client
+        self.ttl = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def get(self, key: str) -> Optional[List[float]]:
+        try:
+            value = self.client.get(key)
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"ETA cache get failed: {e}")
+            return None
+        # A value in another format counts as a miss and is overwritten by the next set
+        row = None if value is None else decode_row(value)
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return row
+
+    def get_many(self, keys: List[str]) -> List[Optional[List[float]]]:
+        """Values for many keys in one MGET round trip, None for misses"""
+        if not keys:
+            return []
+        try:
+            values = self.client.mget(keys)
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"ETA cache get failed: {e}")
+            return [None] * len(keys)
+        rows = [None if value is None else decode_row(value) for value in values]
+        hits = sum(1 for row in rows if row is not None)
+        self.hits += hits
+        self.misses += len(keys) - hits
+        return rows
+
+    def set(self, key: str, value: List[float]):
+        try:
+            self.client.set(key, json.dumps(value), px=max(1, int(self.ttl * 1000)))
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"ETA cache set failed: {e}")
+
+    def set_many(self, items: Dict[str, List[float]]):
+        """Store many values with one pipelined round trip"""
+        if not items:
+            return
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            for key, value in items.items():
+                pipe.set(key, json.dumps(value), px=max(1, int(self.ttl * 1000)))
+            pipe.execute()
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"ETA cache set failed: {e}")
+
+    def clear(self):
+        # Entries are namespaced by model version; nothing to delete eagerly
+        pass
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "backend": "redis",
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+
+class FakeRedis:
+    """In-memory stand-in for the subset of redis-py used by RedisResultCache"""
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires is not None and expires < time.monotonic():
+                del self._data[key]
+                return None
+            return value.encode()
+
+    def mget(self, keys):
+        return [self.get(key) for key in keys]
+
+    def set(self, key, value, px=None):
+        with self._lock:
+            expires = time.monotonic() + px / 1000.0 if px else None
+            self._data[key] = (str(value), expires)
+        return True
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+class FakePipeline:
+    """Buffers set() calls until execute(), like a redis-py pipeline"""
+
+    def __init__(self, client: FakeRedis):
+        self.client = client
+        self._commands = []
+
+    def set(self, key, value, px=None):
+        self._commands.append((key, value, px))
+        return self
+
+    def execute(self):
+        return [self.client.set(key, value, px=px) for key, value, px in self._commands]
+
+def make_cache(backend: str, ttl_seconds: float, max_entries: int, redis_url: str):
+    """Create a cache backend by name: memory, redis, fakeredis or off"""
+    if backend == 'off':
+        return None
+    if backend == 'fakeredis':
+        return RedisResultCache(FakeRedis(), ttl_seconds)
+    if backend == 'redis':
+        try:
+            import redis
+            client = redis.Redis.from_url(redis_url, socket_timeout=0.05)
+            client.ping()
+            logger.info(f"ETA cache using Redis at {redis_url}")
+            return RedisResultCache(client, ttl_seconds)
+        except Exception as e:
+            logger.warning(f"Redis ETA cache unavailable ({e}), falling back to in-process cache")
+    elif backend != 'memory':
+        raise ValueError(f"Unknown ETA cache backend: {backend}")
+    return InProcessCache(max_entries, ttl_seconds)
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Urban Mobility Bus Agent - ML Service Metrics
+
+Prometheus metrics for the ML service:
+- per-route request counts, latency and errors (MetricsMiddleware)
+- per-stage inference timings: encode, feature_build, lookup, scale, predict, response
+- requests coalesced onto identical in-flight predictions
+- model load/reload durations, the served version and artifact sizes
+"""
+
+from contextlib import contextmanager
+import time
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+# Inference stages run in microseconds to milliseconds
+STAGE_BUCKETS = (
+    0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005,
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0
+)
+REQUEST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+LOAD_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+REQUESTS = Counter(
+    'ml_requests_total', 'HTTP requests handled', ['route', 'method', 'status']
+)
+REQUEST_LATENCY = Histogram(
+    'ml_request_duration_seconds', 'HTTP request latency', ['route', 'method'], buckets=REQUEST_BUCKETS
+)
+REQUEST_ERRORS = Counter(
+    'ml_request_errors_total', 'HTTP requests answered with a 4xx/5xx status', ['route', 'method', 'status']
+)
+STAGE_LATENCY = Histogram(
+    'ml_inference_stage_duration_seconds',
+    'Time spent per inference stage: encode (request to feature row), feature_build '
+    '(rows to matrix), lookup (occupancy table), scale, predict, response (response object build)',
+    ['model', 'stage'], buckets=STAGE_BUCKETS
+)
+COALESCED = Counter(
+    'ml_coalesced_requests_total',
+    'Predictions answered by joining an identical in-flight computation instead of running the model',
+    ['model']
+)
+MODEL_LOAD = Histogram(
+    'ml_model_load_duration_seconds', 'Model bundle load time, including warm-up', ['trigger'], buckets=LOAD_BUCKETS
+)
+MODEL_LOAD_PHASE = Gauge(
+    'ml_model_load_phase_seconds', 'Duration of each phase of the last model load', ['phase']
+)
+MODEL_INFO = Gauge(
+    'ml_model_info', 'Model version currently served (value is always 1)', ['version']
+)
+MODEL_BYTES = Gauge(
+    'ml_model_bytes', 'Size of each loaded model component', ['component']
+)
+
+# Label children cached per (model, stage) so timing a stage is one observe() call
+_stage_children = {}
+
+@contextmanager
+def stage(model: str, name: str):
+    """Time one inference stage"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        child = _stage_children.get((model, name))
+        if child is None:
+            child = _stage_children[model, name] = STAGE_LATENCY.labels(model, name)
+        child.observe(time.perf_counter() - started)
+
+def record_model_load(trigger: str, seconds: float, phases: dict, version: str, component_bytes: dict):
+    """Export the duration and shape of a completed model load"""
+    MODEL_LOAD.labels(trigger).observe(seconds)
+    # Only this load's phases; one it skipped must not keep an earlier value
+    MODEL_LOAD_PHASE.clear()
+    for phase, milliseconds in phases.items():
+        MODEL_LOAD_PHASE.labels(phase[:-3] if phase.endswith('_ms') else phase).set(milliseconds / 1000.0)
+    MODEL_INFO.clear()
+    MODEL_INFO.labels(version).set(1)
+    MODEL_BYTES.clear()
+    for component, size in component_bytes.items():
+        MODEL_BYTES.labels(component).set(size)
+
+def render():
+    """Body and content type for the /metrics endpoint"""
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+class MetricsMiddleware:
+    """ASGI middleware counting and timing every HTTP request by route template
+
+    Labels use the matched route's path (e.g. /predict/eta), never the raw
+    URL, so label cardinality stays bounded.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get('route')
+            path = getattr(route, 'path', 'unmatched')
+            method = scope['method']
+            REQUESTS.labels(path, method, str(status)).inc()
+            REQUEST_LATENCY.labels(path, method).observe(time.perf_counter() - started)
+            if status >= 400:
+                REQUEST_ERRORS.labels(path, method, str(status)).inc()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Urban Mobility Bus Agent - Streaming Training Helpers
+
+Building blocks for training on telemetry larger than memory:
+- iter_shard_chunks: read JSONL, CSV or Parquet shards a chunk at a time
+- Reservoir: fixed-size uniform sample of a stream, used as the holdout set
+- save_checkpoint / load_checkpoint: atomic snapshots of training progress
+"""
+
+import numpy as np
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+SHARD_FORMATS = {
+    '.jsonl': 'jsonl',
+    '.ndjson': 'jsonl',
+    '.json': 'jsonl',
+    '.csv': 'csv',
+    '.parquet': 'parquet',
+    '.pq': 'parquet'
+}
+
+def shard_format(path: str) -> str:
+    suffix = os.path.splitext(path)[1].lower()
+    if suffix not in SHARD_FORMATS:
+        raise ValueError(f"Unsupported shard format: {path}")
+    return SHARD_FORMATS[suffix]
+
+def iter_shard_chunks(path: str, chunk_rows: int = 100_000):
+    """Yield DataFrames of at most chunk_rows rows from one shard"""
+    import pandas as pd
+
+    fmt = shard_format(path)
+    if fmt == 'jsonl':
+        with pd.read_json(path, lines=True, chunksize=chunk_rows) as reader:
+            yield from reader
+    elif fmt == 'csv':
+        with pd.read_csv(path, chunksize=chunk_rows) as reader:
+            yield from reader
+    else:
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_rows):
+            yield batch.to_pandas()
+
+class Reservoir:
+    """Uniform random sample of at most ``capacity`` rows from a stream (algorithm R)"""
+
+    def __init__(self, capacity: int, n_features: int, seed: int = 0):
+        self.capacity = capacity
+        self.X = np.empty((capacity, n_features), dtype=np.float64)
+        self.y = np.empty(capacity, dtype=np.float64)
+        self.seen = 0
+        self.rng = np.random.default_rng(seed)
+
+    def __len__(self) -> int:
+        return min(self.seen, self.capacity)
+
+    def add(self, X: np.ndarray, y: np.ndarray):
+        n = len(y)
+        if n == 0:
+            return
+        # Position of each row in the stream, 1-based
+        positions = np.arange(self.seen + 1, self.seen + n + 1)
+        slots = np.where(positions <= self.capacity, positions - 1,
+                         np.floor(self.rng.random(n) * positions).astype(np.int64))
+        keep = slots < self.capacity
+        # Later rows win when two land in the same slot, as in the sequential algorithm
+        self.X[slots[keep]] = X[keep]
+        self.y[slots[keep]] = y[keep]
+        self.seen += n
+
+    def sample(self):
+        """(X, y) currently held"""
+        return self.X[:len(self)], self.y[:len(self)]
+
+def save_checkpoint(path: str, state: dict):
+    """Dump training state next to the target and rename it into place"""
+    import joblib
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    joblib.dump(state, tmp_path)
+    os.replace(tmp_path, path)
+
+def load_checkpoint(path: str):
+    """Training state saved by save_checkpoint, or None"""
+    import joblib
+
+    if not os.path.exists(path):
+        return None
+    return joblib.load(path)
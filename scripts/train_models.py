@@ -15,195 +15,525 @@ Requirements:
 - tensorflow (optional)
 """
 
-import pandas as pd
+# pandas, scikit-learn and joblib are imported where they are used, so
+# importing this module (e.g. for its helpers) stays cheap
 import numpy as np
-from sklearn.ensemble import RandomForestRegressor, GradientBoostingRegressor
-from sklearn.linear_model import LinearRegression
-from sklearn.model_selection import train_test_split, cross_val_score
-from sklearn.preprocessing import StandardScaler, LabelEncoder
-from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
-import joblib
 import json
 import os
+import time
 from datetime import datetime, timedelta
 import logging
 
+try:
+    from . import model_store
+    from .dataset_cache import DatasetCache, cache_key, source_digest
+    from .compiled_trees import CompiledTreeEnsemble, prune_to_tolerance
+    from .model_selection import ParallelModelSelector
+    from . import stream_training
+    from .uncertainty import IntervalCalibration, calibration_path
+    from .feature_pipeline import FeaturePipeline, schema_path
+    from . import feature_pipeline
+except ImportError:
+    import model_store
+    from dataset_cache import DatasetCache, cache_key, source_digest
+    from compiled_trees import CompiledTreeEnsemble, prune_to_tolerance
+    from model_selection import ParallelModelSelector
+    import stream_training
+    from uncertainty import IntervalCalibration, calibration_path
+    from feature_pipeline import FeaturePipeline, schema_path
+    import feature_pipeline
+
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Cache of generated datasets and feature matrices for main(): directory
+# ("off" disables it) and size limit before least recently used entries go
+DATA_CACHE_DIR = os.environ.get("ML_DATA_CACHE", os.path.join(".cache", "datasets"))
+DATA_CACHE_MAX_MB = float(os.environ.get("ML_DATA_CACHE_MAX_MB", "2048"))
+
+def save_npz_shard(path, df):
+    """Save a DataFrame as NPZ, storing categoricals as codes plus categories"""
+    arrays = {}
+    for column in df.columns:
+        values = df[column]
+        if hasattr(values, 'cat'):
+            arrays[column] = values.cat.codes.to_numpy()
+            arrays[f"{column}__categories"] = np.asarray(values.cat.categories, dtype=str)
+        else:
+            arrays[column] = values.to_numpy()
+    np.savez(path, **arrays)
+
+def load_npz_shard(path):
+    """Load a shard written by save_npz_shard back into a DataFrame"""
+    import pandas as pd
+    
+    with np.load(path) as shard:
+        columns = {}
+        for name in shard.files:
+            if name.endswith('__categories'):
+                continue
+            if f"{name}__categories" in shard.files:
+                columns[name] = pd.Categorical.from_codes(shard[name], shard[f"{name}__categories"])
+            else:
+                columns[name] = shard[name]
+    return pd.DataFrame(columns)
+
 class BusAgentMLTrainer:
-    def __init__(self, models_dir="models"):
+    def __init__(self, models_dir="models", cache=None):
+        from sklearn.preprocessing import StandardScaler
+        
         self.models_dir = models_dir
         self.scaler = StandardScaler()
-        self.label_encoder = LabelEncoder()
+        
+        # Optional DatasetCache: unchanged datasets and features are loaded, not rebuilt
+        self.cache = cache
+        
+        # Frozen feature definitions, saved next to each model
+        self.eta_pipeline = FeaturePipeline.for_model('eta')
+        self.occupancy_pipeline = FeaturePipeline.for_model('occupancy')
+        self.demand_pipeline = FeaturePipeline.for_model('demand')
         
         # Create models directory if it doesn't exist
         os.makedirs(models_dir, exist_ok=True)
         
-    def generate_synthetic_data(self, num_samples=10000):
-        """Generate synthetic training data for demonstration"""
-        logger.info("Generating synthetic training data...")
+        # Artifacts from this run go into a fresh version directory,
+        # served only once publish() is called
+        self._version_dir = None
         
-        np.random.seed(42)
+    @property
+    def version_dir(self):
+        """Directory for this run's model version, created on first use"""
+        if self._version_dir is None:
+            self._version_dir = model_store.create_version(self.models_dir)
+        return self._version_dir
+    
+    def save_artifacts(self, name, model, scaler, pipeline):
+        """Save a model, its scaler, feature schema and compiled arrays into the version directory"""
+        import joblib
         
-        # Generate synthetic bus data
-        data = []
-        for i in range(num_samples):
-            # Random bus and route IDs
-            bus_id = f"BUS_{np.random.randint(1, 100):03d}"
-            route_id = f"ROUTE_{np.random.randint(1, 10)}"
-            
-            # Random coordinates (simulating NYC area)
-            latitude = 40.7 + np.random.normal(0, 0.1)
-            longitude = -74.0 + np.random.normal(0, 0.1)
-            
-            # Time features
-            hour = np.random.randint(0, 24)
-            minute = np.random.randint(0, 60)
-            day_of_week = np.random.randint(0, 7)
-            is_weekend = 1 if day_of_week >= 5 else 0
-            
-            # Weather conditions (simplified)
-            weather_conditions = np.random.choice(['SUNNY', 'CLOUDY', 'RAINY', 'SNOWY'], p=[0.4, 0.3, 0.2, 0.1])
-            
-            # Traffic conditions
-            traffic_level = np.random.choice(['LOW', 'MEDIUM', 'HIGH'], p=[0.3, 0.5, 0.2])
-            
-            # Distance to destination
-            distance_km = np.random.uniform(0.5, 15.0)
-            
-            # Historical average speed for this route
-            avg_speed = np.random.normal(25, 5)  # km/h
-            
-            # Current occupancy
-            occupancy_percentage = np.random.uniform(0, 100)
-            
-            # Calculate ETA based on features (simplified model)
-            base_time = distance_km / avg_speed * 60  # minutes
-            
-            # Adjust for traffic
-            traffic_multiplier = {
-                'LOW': 1.0,
-                'MEDIUM': 1.3,
-                'HIGH': 1.8
-            }[traffic_level]
-            
-            # Adjust for weather
-            weather_multiplier = {
-                'SUNNY': 1.0,
-                'CLOUDY': 1.1,
-                'RAINY': 1.4,
-                'SNOWY': 1.8
-            }[weather_conditions]
-            
-            # Adjust for time of day
-            rush_hour_multiplier = 1.5 if hour in [7, 8, 9, 17, 18, 19] else 1.0
-            
-            # Calculate final ETA
-            eta_minutes = base_time * traffic_multiplier * weather_multiplier * rush_hour_multiplier
-            
-            # Add some noise
-            eta_minutes += np.random.normal(0, 2)
-            eta_minutes = max(1, eta_minutes)  # Minimum 1 minute
-            
-            data.append({
-                'bus_id': bus_id,
-                'route_id': route_id,
-                'latitude': latitude,
-                'longitude': longitude,
-                'hour': hour,
-                'minute': minute,
-                'day_of_week': day_of_week,
-                'is_weekend': is_weekend,
-                'weather_condition': weather_conditions,
-                'traffic_level': traffic_level,
-                'distance_km': distance_km,
-                'avg_speed': avg_speed,
-                'occupancy_percentage': occupancy_percentage,
-                'eta_minutes': eta_minutes
-            })
-        
-        return pd.DataFrame(data)
+        model_path = os.path.join(self.version_dir, f'{name}_model.pkl')
+        scaler_path = os.path.join(self.version_dir, f'{name}_scaler.pkl')
+        
+        # Uncompressed dumps so the service can memory-map the arrays
+        joblib.dump(model, model_path)
+        joblib.dump(scaler, scaler_path)
+        pipeline.save(schema_path(self.version_dir, name))
+        
+        try:
+            CompiledTreeEnsemble.from_model(model).save(os.path.join(self.version_dir, f'{name}_engine'))
+        except TypeError:
+            pass  # Not a tree ensemble; the service uses sklearn predict
+        
+        return model_path, scaler_path
+    
+    # Compact export may raise holdout MAE by at most this fraction
+    COMPACT_TOLERANCE = 0.01
+    
+    def export_compact(self, name, model, X_holdout, y_holdout, X_calibration=None, y_calibration=None,
+                       tolerance=None):
+        """Write a pruned float32 copy of a tree model as <name>_compact.npz
+        
+        Half of the holdout picks the tree count and depth, the other half
+        measures the result. Intervals are calibrated on the calibration rows,
+        when given. Returns the size/load/latency/accuracy report, or None for
+        models that are not tree ensembles.
+        """
+        import joblib
+        from sklearn.metrics import mean_absolute_error, r2_score
+        
+        try:
+            engine = CompiledTreeEnsemble.from_model(model)
+        except TypeError:
+            return None
+        
+        tolerance = self.COMPACT_TOLERANCE if tolerance is None else tolerance
+        X = np.asarray(X_holdout, dtype=np.float64)
+        y = np.asarray(y_holdout, dtype=np.float64)
+        half = len(y) // 2
+        compact, search = prune_to_tolerance(engine, X[:half], y[:half], tolerance)
+        
+        compact_path = os.path.join(self.version_dir, f'{name}_compact.npz')
+        compact.save_compressed(compact_path)
+        model_path = os.path.join(self.version_dir, f'{name}_model.pkl')
+        
+        # Load time of each artifact, from a warm page cache
+        started = time.perf_counter()
+        joblib.load(model_path)
+        model_load = time.perf_counter() - started
+        started = time.perf_counter()
+        CompiledTreeEnsemble.load_compressed(compact_path)
+        compact_load = time.perf_counter() - started
+        
+        X_eval, y_eval = X[half:], y[half:]
+        
+        def latency_ms(predict):
+            # Median single-row latency and the time for the whole evaluation half
+            singles = []
+            for row in X_eval[:200]:
+                started = time.perf_counter()
+                predict(row.reshape(1, -1))
+                singles.append(time.perf_counter() - started)
+            started = time.perf_counter()
+            predict(X_eval)
+            return float(np.median(singles)) * 1000.0, (time.perf_counter() - started) * 1000.0
+        
+        model_single, model_batch = latency_ms(model.predict)
+        compact_single, compact_batch = latency_ms(compact.predict)
+        model_pred, compact_pred = model.predict(X_eval), compact.predict(X_eval)
+        model_mae, compact_mae = mean_absolute_error(y_eval, model_pred), mean_absolute_error(y_eval, compact_pred)
+        
+        report = {
+            'path': compact_path,
+            'n_trees': compact.n_trees,
+            'max_depth': compact.max_depth,
+            'n_nodes': compact.n_nodes,
+            'original': {'n_trees': engine.n_trees, 'max_depth': engine.max_depth, 'n_nodes': engine.n_nodes},
+            'bytes': os.path.getsize(compact_path),
+            'original_bytes': os.path.getsize(model_path),
+            'load_seconds': compact_load,
+            'original_load_seconds': model_load,
+            'predict_single_ms': compact_single,
+            'original_predict_single_ms': model_single,
+            'predict_batch_ms': compact_batch,
+            'original_predict_batch_ms': model_batch,
+            'batch_rows': len(y_eval),
+            'mae': compact_mae,
+            'original_mae': model_mae,
+            'mae_delta': compact_mae - model_mae,
+            'r2': r2_score(y_eval, compact_pred),
+            'original_r2': r2_score(y_eval, model_pred),
+            'tolerance': tolerance,
+            'search': search,
+            'intervals': (
+                self.calibrate_intervals(name, compact, X_calibration, y_calibration, X_eval, y_eval, compact=True)
+                if X_calibration is not None else None
+            )
+        }
+        logger.info(
+            f"Compact {name} model: {compact.n_trees} trees, depth {compact.max_depth}, "
+            f"{report['bytes'] / 1e6:.2f} MB vs {report['original_bytes'] / 1e6:.2f} MB, "
+            f"load {compact_load * 1000:.0f} ms vs {model_load * 1000:.0f} ms, MAE delta {report['mae_delta']:+.3f}"
+        )
+        return report
+    
+    # Confidence is the chance the actual lands within max(absolute, relative x prediction)
+    CONFIDENCE_TOLERANCE = {'eta': (1.0, 0.1), 'occupancy': (10.0, 0.0)}
+    
+    # Share of the training split held back to calibrate intervals (10% of all rows)
+    CALIBRATION_FRACTION = 0.125
+    
+    def split_calibration(self, X_train, y_train):
+        """Split interval calibration rows off the training data, so the model never fits them"""
+        from sklearn.model_selection import train_test_split
+        
+        return train_test_split(X_train, y_train, test_size=self.CALIBRATION_FRACTION, random_state=42)
+    
+    def calibrate_intervals(self, name, model, X_calibration, y_calibration, X_holdout, y_holdout, compact=False):
+        """Calibrate p10/p90 bounds and confidence and save them next to the model
+        
+        The calibration rows fit the intervals and the holdout rows measure
+        them; neither may have been used to fit the model. Forests are
+        calibrated on their per-tree spread, other models on plain residuals.
+        Returns the holdout coverage report, or None for models the service
+        does not serve intervals for.
+        """
+        if name not in self.CONFIDENCE_TOLERANCE:
+            return None
+        
+        # Spread from the compiled arrays, as the service computes it
+        engine = model if isinstance(model, CompiledTreeEnsemble) else None
+        if engine is None:
+            try:
+                engine = CompiledTreeEnsemble.from_model(model)
+            except TypeError:
+                pass
+        
+        def predict(X):
+            X = np.asarray(X, dtype=np.float64)
+            if engine is not None and engine.averaging:
+                return engine.predict_spread(X)
+            return model.predict(X), None
+        
+        tolerance_abs, tolerance_rel = self.CONFIDENCE_TOLERANCE[name]
+        prediction, spread = predict(X_calibration)
+        calibration = IntervalCalibration.fit(prediction, y_calibration, spread, tolerance_abs, tolerance_rel)
+        prediction, spread = predict(X_holdout)
+        calibration.holdout = calibration.evaluate(prediction, y_holdout, spread)
+        calibration.save(calibration_path(self.version_dir, name, compact))
+        
+        holdout = calibration.holdout
+        logger.info(
+            f"{'Compact ' if compact else ''}{name} intervals ({calibration.kind}): "
+            f"p10-p90 covers {holdout['interval_coverage']:.1%} of {holdout['rows']} holdout rows, "
+            f"mean width {holdout['mean_interval_width']:.2f}, mean confidence {holdout['mean_confidence']:.2f}"
+        )
+        return dict(kind=calibration.kind, calibration_rows=int(len(y_calibration)), **holdout)
+    
+    def publish(self, retrained=()):
+        """Make this run's models the ones served by the ML service"""
+        return model_store.publish(self.models_dir, self.version_dir, retrained)
+    
+    # Synthetic data distributions, over the feature pipeline's vocabularies
+    WEATHER_CONDITIONS = feature_pipeline.WEATHER_CONDITIONS
+    WEATHER_PROBABILITIES = [0.4, 0.3, 0.2, 0.1]
+    WEATHER_MULTIPLIERS = [1.0, 1.1, 1.4, 1.8]
+    TRAFFIC_LEVELS = feature_pipeline.TRAFFIC_LEVELS
+    TRAFFIC_PROBABILITIES = [0.3, 0.5, 0.2]
+    TRAFFIC_MULTIPLIERS = [1.0, 1.3, 1.8]
+    RUSH_HOURS = feature_pipeline.RUSH_HOURS
+    ROUTE_IDS = feature_pipeline.ROUTE_IDS
+    
+    # Synthetic demand: boardings per route-hour = route base x hour profile x day type x weather
+    DAY_TYPES = feature_pipeline.DAY_TYPES
+    ROUTE_BASE_DEMAND = [120, 90, 150, 60, 80, 110, 45, 70, 100]
+    HOURLY_DEMAND = [
+        0.05, 0.03, 0.02, 0.02, 0.05, 0.2, 0.5, 0.95, 1.0, 0.7, 0.5, 0.5,
+        0.55, 0.5, 0.5, 0.6, 0.8, 0.95, 0.9, 0.6, 0.4, 0.3, 0.2, 0.1
+    ]
+    DAY_TYPE_DEMAND = [1.0, 0.7, 0.5]
+    WEATHER_DEMAND = [1.0, 0.95, 0.85, 0.7]
+    
+    # Class attributes each generator reads, part of its datasets' cache key
+    GENERATOR_PARAMETERS = {
+        'synthetic_columns': [
+            'ROUTE_IDS', 'WEATHER_CONDITIONS', 'WEATHER_PROBABILITIES', 'WEATHER_MULTIPLIERS',
+            'TRAFFIC_LEVELS', 'TRAFFIC_PROBABILITIES', 'TRAFFIC_MULTIPLIERS', 'RUSH_HOURS'
+        ],
+        'synthetic_demand_columns': [
+            'ROUTE_IDS', 'WEATHER_CONDITIONS', 'WEATHER_PROBABILITIES', 'DAY_TYPES',
+            'ROUTE_BASE_DEMAND', 'HOURLY_DEMAND', 'DAY_TYPE_DEMAND', 'WEATHER_DEMAND'
+        ]
+    }
+    
+    @classmethod
+    def synthetic_columns(cls, rng, num_samples):
+        """Generate one block of synthetic bus data as compact columns"""
+        import pandas as pd
+        
+        n = num_samples
+        
+        # Random bus and route IDs
+        bus_codes = rng.integers(1, 100, size=n, dtype=np.int8)
+        route_codes = rng.integers(1, len(cls.ROUTE_IDS) + 1, size=n, dtype=np.int8)
+        
+        # Random coordinates (simulating NYC area)
+        latitude = (40.7 + rng.normal(0, 0.1, size=n)).astype(np.float32)
+        longitude = (-74.0 + rng.normal(0, 0.1, size=n)).astype(np.float32)
+        
+        # Time features
+        hour = rng.integers(0, 24, size=n, dtype=np.int8)
+        minute = rng.integers(0, 60, size=n, dtype=np.int8)
+        day_of_week = rng.integers(0, 7, size=n, dtype=np.int8)
+        is_weekend = (day_of_week >= 5).astype(np.int8)
+        
+        # Weather and traffic conditions
+        weather_codes = rng.choice(len(cls.WEATHER_CONDITIONS), size=n, p=cls.WEATHER_PROBABILITIES).astype(np.int8)
+        traffic_codes = rng.choice(len(cls.TRAFFIC_LEVELS), size=n, p=cls.TRAFFIC_PROBABILITIES).astype(np.int8)
+        
+        # Distance to destination, historical average speed (km/h), current occupancy
+        distance_km = rng.uniform(0.5, 15.0, size=n)
+        avg_speed = rng.normal(25, 5, size=n)
+        occupancy_percentage = rng.uniform(0, 100, size=n)
+        
+        # Calculate ETA based on features (simplified model)
+        base_time = distance_km / avg_speed * 60  # minutes
+        traffic_multiplier = np.asarray(cls.TRAFFIC_MULTIPLIERS)[traffic_codes]
+        weather_multiplier = np.asarray(cls.WEATHER_MULTIPLIERS)[weather_codes]
+        rush_hour_multiplier = np.where(np.isin(hour, cls.RUSH_HOURS), 1.5, 1.0)
+        eta_minutes = base_time * traffic_multiplier * weather_multiplier * rush_hour_multiplier
+        
+        # Add some noise
+        eta_minutes += rng.normal(0, 2, size=n)
+        eta_minutes = np.maximum(1, eta_minutes)  # Minimum 1 minute
+        
+        return {
+            'bus_id': pd.Categorical.from_codes(bus_codes - 1, [f"BUS_{i:03d}" for i in range(1, 100)]),
+            'route_id': pd.Categorical.from_codes(route_codes - 1, cls.ROUTE_IDS),
+            'latitude': latitude,
+            'longitude': longitude,
+            'hour': hour,
+            'minute': minute,
+            'day_of_week': day_of_week,
+            'is_weekend': is_weekend,
+            'weather_condition': pd.Categorical.from_codes(weather_codes, cls.WEATHER_CONDITIONS),
+            'traffic_level': pd.Categorical.from_codes(traffic_codes, cls.TRAFFIC_LEVELS),
+            'distance_km': distance_km.astype(np.float32),
+            'avg_speed': avg_speed.astype(np.float32),
+            'occupancy_percentage': occupancy_percentage.astype(np.float32),
+            'eta_minutes': eta_minutes.astype(np.float32)
+        }
+    
+    @classmethod
+    def synthetic_demand_columns(cls, rng, num_samples):
+        """Generate synthetic hourly boardings per route as compact columns"""
+        import pandas as pd
+        
+        n = num_samples
+        route_codes = rng.integers(0, len(cls.ROUTE_IDS), size=n, dtype=np.int8)
+        hour = rng.integers(0, 24, size=n, dtype=np.int8)
+        day_of_week = rng.integers(0, 7, size=n, dtype=np.int8)
+        weather_codes = rng.choice(len(cls.WEATHER_CONDITIONS), size=n, p=cls.WEATHER_PROBABILITIES).astype(np.int8)
+        day_type_codes = np.where(day_of_week == 5, 1, np.where(day_of_week == 6, 2, 0)).astype(np.int8)
+        
+        expected = (
+            np.asarray(cls.ROUTE_BASE_DEMAND, dtype=np.float64)[route_codes]
+            * np.asarray(cls.HOURLY_DEMAND)[hour]
+            * np.asarray(cls.DAY_TYPE_DEMAND)[day_type_codes]
+            * np.asarray(cls.WEATHER_DEMAND)[weather_codes]
+        )
+        
+        return {
+            'route_id': pd.Categorical.from_codes(route_codes, cls.ROUTE_IDS),
+            'hour': hour,
+            'day_of_week': day_of_week,
+            'day_type': pd.Categorical.from_codes(day_type_codes, cls.DAY_TYPES),
+            'weather_condition': pd.Categorical.from_codes(weather_codes, cls.WEATHER_CONDITIONS),
+            'passengers': rng.poisson(expected).astype(np.float32)
+        }
+    
+    def generate_demand_data(self, num_samples=50000, seed=42):
+        """Generate synthetic demand training data"""
+        return self._generate('synthetic_demand_columns', num_samples, seed, "demand data")
+    
+    def generate_synthetic_data(self, num_samples=10000, seed=42):
+        """Generate synthetic training data for demonstration"""
+        return self._generate('synthetic_columns', num_samples, seed, "training data")
+    
+    def _generate(self, generator, num_samples, seed, description):
+        """DataFrame from a synthetic generator, loaded from the cache when its inputs are unchanged
+        
+        The cache key is kept in ``df.attrs['cache_key']`` so features derived
+        from the frame can be cached too.
+        """
+        import pandas as pd
+        
+        key = None
+        if self.cache is not None:
+            key = cache_key(
+                generator=generator,
+                source=source_digest(getattr(type(self), generator)),
+                parameters={name: getattr(self, name) for name in self.GENERATOR_PARAMETERS[generator]},
+                num_samples=num_samples,
+                seed=seed,
+                numpy=np.__version__
+            )
+            df = self.cache.get_frame(key)
+            if df is not None:
+                df.attrs['cache_key'] = key
+                return df
+        
+        logger.info(f"Generating synthetic {description}...")
+        
+        rng = np.random.default_rng(seed)
+        df = pd.DataFrame(getattr(self, generator)(rng, num_samples))
+        if key is not None:
+            self.cache.put_frame(key, df)
+            df.attrs['cache_key'] = key
+        return df
+    
+    def iter_synthetic_chunks(self, num_samples, chunk_size=1_000_000, seed=42):
+        """Yield synthetic data as DataFrames of at most chunk_size rows
+        
+        Each chunk draws from its own child seed, so the output is
+        reproducible and independent of how far a consumer gets.
+        """
+        import pandas as pd
+        
+        num_chunks = max(1, -(-num_samples // chunk_size))
+        for index, child_seed in enumerate(np.random.SeedSequence(seed).spawn(num_chunks)):
+            rows = min(chunk_size, num_samples - index * chunk_size)
+            yield pd.DataFrame(self.synthetic_columns(np.random.default_rng(child_seed), rows))
+    
+    def write_synthetic_shards(self, output_dir, num_samples, chunk_size=1_000_000, fmt='parquet', seed=42):
+        """Stream synthetic data to Parquet or NPZ shards with bounded memory"""
+        if fmt not in ('parquet', 'npz'):
+            raise ValueError(f"Unsupported shard format: {fmt}")
+        
+        os.makedirs(output_dir, exist_ok=True)
+        paths = []
+        for index, chunk in enumerate(self.iter_synthetic_chunks(num_samples, chunk_size, seed)):
+            path = os.path.join(output_dir, f"synthetic-{index:05d}.{fmt}")
+            if fmt == 'parquet':
+                chunk.to_parquet(path, index=False)
+            else:
+                save_npz_shard(path, chunk)
+            paths.append(path)
+            logger.info(f"Wrote {len(chunk)} rows to {path}")
+        return paths
     
     def prepare_eta_features(self, df):
         """Prepare features for ETA prediction"""
         logger.info("Preparing features for ETA prediction...")
-        
-        # Encode categorical variables
-        df['weather_encoded'] = self.label_encoder.fit_transform(df['weather_condition'])
-        df['traffic_encoded'] = self.label_encoder.fit_transform(df['traffic_level'])
-        df['route_encoded'] = self.label_encoder.fit_transform(df['route_id'])
-        
-        # Create time-based features
-        df['time_of_day'] = df['hour'] + df['minute'] / 60
-        df['is_rush_hour'] = ((df['hour'] >= 7) & (df['hour'] <= 9)) | ((df['hour'] >= 17) & (df['hour'] <= 19))
-        df['is_rush_hour'] = df['is_rush_hour'].astype(int)
-        
-        # Select features for ETA prediction
-        feature_columns = [
-            'latitude', 'longitude', 'hour', 'day_of_week', 'is_weekend',
-            'weather_encoded', 'traffic_encoded', 'route_encoded',
-            'distance_km', 'avg_speed', 'occupancy_percentage',
-            'time_of_day', 'is_rush_hour'
-        ]
-        
-        X = df[feature_columns]
-        y = df['eta_minutes']
-        
+        return self.prepare_features(self.eta_pipeline, df, 'eta_minutes')
+    
+    def prepare_features(self, pipeline, df, target):
+        """Feature matrix and target for a pipeline, cached for frames that came from the cache"""
+        import pandas as pd
+        
+        key = df.attrs.get('cache_key') if self.cache is not None else None
+        if key is not None:
+            key = cache_key(dataset=key, schema=pipeline.to_dict(), target=target)
+            arrays = self.cache.get(key)
+            if arrays is not None:
+                X = pd.DataFrame(arrays['X'], columns=pipeline.features, index=df.index, copy=False)
+                return X, pd.Series(arrays['y'], index=df.index, name=target, copy=False)
+        
+        # Encode and derive features exactly as the ML service does
+        X = pd.DataFrame(pipeline.transform(df), columns=pipeline.features, index=df.index)
+        y = df[target]
+        
+        if key is not None:
+            self.cache.put(key, {'X': X.to_numpy(), 'y': y.to_numpy()})
         return X, y
     
-    def train_eta_model(self, X, y):
-        """Train ETA prediction model"""
+    def train_eta_model(self, X, y, n_jobs=None, time_budget=None, elimination_margin=0.1):
+        """Train ETA prediction model
+        
+        Candidates and their CV folds are fitted in parallel worker processes.
+        ``time_budget`` caps each candidate's wall-clock seconds; candidates whose
+        holdout R² trails the best by more than ``elimination_margin`` skip CV.
+        """
+        from sklearn.ensemble import RandomForestRegressor, GradientBoostingRegressor
+        from sklearn.linear_model import LinearRegression
+        from sklearn.model_selection import train_test_split
+        
         logger.info("Training ETA prediction model...")
         
         # Split data
         X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+        X_train, X_calibration, y_train, y_calibration = self.split_calibration(X_train, y_train)
         
         # Scale features
         X_train_scaled = self.scaler.fit_transform(X_train)
         X_test_scaled = self.scaler.transform(X_test)
+        X_calibration_scaled = self.scaler.transform(X_calibration)
         
-        # Train multiple models
+        # Candidate models
         models = {
             'random_forest': RandomForestRegressor(n_estimators=100, random_state=42),
             'gradient_boosting': GradientBoostingRegressor(n_estimators=100, random_state=42),
             'linear_regression': LinearRegression()
         }
         
-        best_model = None
-        best_score = -np.inf
+        selector = ParallelModelSelector(n_jobs=n_jobs, time_budget=time_budget, elimination_margin=elimination_margin)
+        best_model, best_score, timing = selector.select(models, X_train_scaled, y_train, X_test_scaled, y_test)
         
-        for name, model in models.items():
-            logger.info(f"Training {name}...")
-            
-            # Train model
-            model.fit(X_train_scaled, y_train)
-            
-            # Make predictions
-            y_pred = model.predict(X_test_scaled)
-            
-            # Calculate metrics
-            mae = mean_absolute_error(y_test, y_pred)
-            mse = mean_squared_error(y_test, y_pred)
-            r2 = r2_score(y_test, y_pred)
-            
-            logger.info(f"{name} - MAE: {mae:.2f}, MSE: {mse:.2f}, R²: {r2:.3f}")
-            
-            # Cross-validation
-            cv_scores = cross_val_score(model, X_train_scaled, y_train, cv=5, scoring='r2')
-            logger.info(f"{name} - CV R²: {cv_scores.mean():.3f} (+/- {cv_scores.std() * 2:.3f})")
-            
-            if r2 > best_score:
-                best_score = r2
-                best_model = model
+        for name, entry in timing['candidates'].items():
+            holdout = entry['holdout']
+            if holdout is None:
+                logger.info(f"{name} - {entry['status']} before finishing")
+                continue
+            logger.info(f"{name} - MAE: {holdout['mae']:.2f}, MSE: {holdout['mse']:.2f}, R²: {holdout['r2']:.3f} "
+                        f"(fit {holdout['fit_seconds']:.1f}s)")
+            if entry['cv_r2_mean'] is not None:
+                logger.info(f"{name} - CV R²: {entry['cv_r2_mean']:.3f} (+/- {entry['cv_r2_std'] * 2:.3f})")
+        logger.info(f"Model selection took {timing['wall_seconds']:.1f}s on {selector.n_jobs} workers")
         
         # Save best model
-        model_path = os.path.join(self.models_dir, 'eta_model.pkl')
-        scaler_path = os.path.join(self.models_dir, 'eta_scaler.pkl')
-        
-        joblib.dump(best_model, model_path)
-        joblib.dump(self.scaler, scaler_path)
+        model_path, scaler_path = self.save_artifacts('eta', best_model, self.scaler, self.eta_pipeline)
+        compact = self.export_compact('eta', best_model, X_test_scaled, y_test, X_calibration_scaled, y_calibration)
+        intervals = self.calibrate_intervals('eta', best_model, X_calibration_scaled, y_calibration, X_test_scaled, y_test)
         
         # Save model metadata
         metadata = {
@@ -212,35 +542,42 @@ class BusAgentMLTrainer:
             'best_score': best_score,
             'training_date': datetime.now().isoformat(),
             'model_path': model_path,
-            'scaler_path': scaler_path
+            'scaler_path': scaler_path,
+            'compact': compact,
+            'intervals': intervals
         }
         
-        metadata_path = os.path.join(self.models_dir, 'eta_model_metadata.json')
+        metadata_path = os.path.join(self.version_dir, 'eta_model_metadata.json')
         with open(metadata_path, 'w') as f:
             json.dump(metadata, f, indent=2)
         
+        timing_path = os.path.join(self.version_dir, 'eta_model_timing.json')
+        with open(timing_path, 'w') as f:
+            json.dump(timing, f, indent=2)
+        
         logger.info(f"Best ETA model saved with R² score: {best_score:.3f}")
         return best_model
     
     def train_occupancy_model(self, df):
         """Train occupancy estimation model"""
+        from sklearn.ensemble import RandomForestRegressor
+        from sklearn.model_selection import train_test_split
+        from sklearn.metrics import mean_absolute_error, r2_score
+        
         logger.info("Training occupancy estimation model...")
         
         # Prepare features for occupancy prediction
-        feature_columns = [
-            'hour', 'day_of_week', 'is_weekend', 'weather_encoded',
-            'traffic_encoded', 'route_encoded', 'time_of_day', 'is_rush_hour'
-        ]
-        
-        X = df[feature_columns]
-        y = df['occupancy_percentage']
+        pipeline = self.occupancy_pipeline
+        X, y = self.prepare_features(pipeline, df, 'occupancy_percentage')
         
         # Split data
         X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+        X_train, X_calibration, y_train, y_calibration = self.split_calibration(X_train, y_train)
         
         # Scale features
         X_train_scaled = self.scaler.fit_transform(X_train)
         X_test_scaled = self.scaler.transform(X_test)
+        X_calibration_scaled = self.scaler.transform(X_calibration)
         
         # Train model
         model = RandomForestRegressor(n_estimators=100, random_state=42)
@@ -254,11 +591,11 @@ class BusAgentMLTrainer:
         logger.info(f"Occupancy model - MAE: {mae:.2f}, R²: {r2:.3f}")
         
         # Save model
-        model_path = os.path.join(self.models_dir, 'occupancy_model.pkl')
-        scaler_path = os.path.join(self.models_dir, 'occupancy_scaler.pkl')
-        
-        joblib.dump(model, model_path)
-        joblib.dump(self.scaler, scaler_path)
+        model_path, scaler_path = self.save_artifacts('occupancy', model, self.scaler, pipeline)
+        compact = self.export_compact('occupancy', model, X_test_scaled, y_test, X_calibration_scaled, y_calibration)
+        intervals = self.calibrate_intervals(
+            'occupancy', model, X_calibration_scaled, y_calibration, X_test_scaled, y_test
+        )
         
         # Save metadata
         metadata = {
@@ -268,73 +605,306 @@ class BusAgentMLTrainer:
             'r2_score': r2,
             'training_date': datetime.now().isoformat(),
             'model_path': model_path,
-            'scaler_path': scaler_path
+            'scaler_path': scaler_path,
+            'compact': compact,
+            'intervals': intervals
         }
         
-        metadata_path = os.path.join(self.models_dir, 'occupancy_model_metadata.json')
+        metadata_path = os.path.join(self.version_dir, 'occupancy_model_metadata.json')
         with open(metadata_path, 'w') as f:
             json.dump(metadata, f, indent=2)
         
         logger.info(f"Occupancy model saved with R² score: {r2:.3f}")
         return model
     
-    def predict_eta(self, features):
-        """Predict ETA using trained model"""
-        model_path = os.path.join(self.models_dir, 'eta_model.pkl')
-        scaler_path = os.path.join(self.models_dir, 'eta_scaler.pkl')
+    def train_demand_model(self, df):
+        """Train route-hour demand forecasting model"""
+        from sklearn.ensemble import RandomForestRegressor
+        from sklearn.model_selection import train_test_split
+        from sklearn.metrics import mean_absolute_error, r2_score
+        
+        logger.info("Training demand forecasting model...")
+        
+        # Prepare features for demand prediction
+        pipeline = self.demand_pipeline
+        X, y = self.prepare_features(pipeline, df, 'passengers')
+        
+        # Split data
+        X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+        
+        # Scale features
+        X_train_scaled = self.scaler.fit_transform(X_train)
+        X_test_scaled = self.scaler.transform(X_test)
+        
+        # Train model; leaves average several rows since counts are noisy
+        model = RandomForestRegressor(n_estimators=100, min_samples_leaf=5, random_state=42)
+        model.fit(X_train_scaled, y_train)
+        
+        # Evaluate
+        y_pred = model.predict(X_test_scaled)
+        mae = mean_absolute_error(y_test, y_pred)
+        r2 = r2_score(y_test, y_pred)
+        
+        logger.info(f"Demand model - MAE: {mae:.2f}, R²: {r2:.3f}")
+        
+        # Save model
+        model_path, scaler_path = self.save_artifacts('demand', model, self.scaler, pipeline)
+        compact = self.export_compact('demand', model, X_test_scaled, y_test)
+        
+        # Save metadata
+        metadata = {
+            'model_type': 'DEMAND_FORECASTING',
+            'features': X.columns.tolist(),
+            'mae': mae,
+            'r2_score': r2,
+            'training_date': datetime.now().isoformat(),
+            'model_path': model_path,
+            'scaler_path': scaler_path,
+            'compact': compact
+        }
+        
+        metadata_path = os.path.join(self.version_dir, 'demand_model_metadata.json')
+        with open(metadata_path, 'w') as f:
+            json.dump(metadata, f, indent=2)
+        
+        logger.info(f"Demand model saved with R² score: {r2:.3f}")
+        return model
+    
+    def train_streaming(self, shards, target='eta', estimator=None, chunk_rows=100_000,
+                        holdout_fraction=0.02, holdout_size=50_000, checkpoint_every=10,
+                        checkpoint_path=None, seed=42, publish=True):
+        """Train incrementally over JSONL/CSV/Parquet shards with bounded memory
+        
+        Each chunk updates a StandardScaler and an estimator with partial_fit
+        (SGDRegressor by default). A random ``holdout_fraction`` of rows never
+        reaches the estimator; a reservoir keeps up to ``holdout_size`` of them
+        for evaluation. Progress is checkpointed every ``checkpoint_every``
+        chunks and after each shard; rerunning with the same checkpoint skips
+        shards already consumed and resumes a partly read one.
+        
+        The model is published at the end, with the other models carried over
+        from the current version. With ``publish=False`` it is left in
+        ``self.version_dir`` until ``publish([target])`` is called.
+        """
+        from sklearn.linear_model import SGDRegressor
+        from sklearn.metrics import mean_absolute_error, r2_score
+        from sklearn.preprocessing import StandardScaler
+        
+        if target == 'eta':
+            pipeline, target_column = self.eta_pipeline, 'eta_minutes'
+        elif target == 'occupancy':
+            pipeline, target_column = self.occupancy_pipeline, 'occupancy_percentage'
+        else:
+            raise ValueError(f"Unknown streaming target: {target}")
+        
+        checkpoint_path = checkpoint_path or os.path.join(self.models_dir, 'checkpoints', f'{target}_stream.pkl')
+        state = stream_training.load_checkpoint(checkpoint_path)
+        if state is not None:
+            logger.info(f"Resuming {target} training from {checkpoint_path} "
+                        f"({state['rows_trained']} rows, {len(state['completed_shards'])} shards done)")
+        else:
+            state = {
+                'target': target,
+                'model': estimator if estimator is not None else SGDRegressor(random_state=seed),
+                'scaler': StandardScaler(),
+                'holdout': stream_training.Reservoir(holdout_size, pipeline.n_features, seed),
+                'rng': np.random.default_rng(seed),
+                'completed_shards': [],
+                'current_shard': None,
+                'chunks_in_shard': 0,
+                'rows_trained': 0
+            }
+        if state['target'] != target:
+            raise ValueError(f"Checkpoint {checkpoint_path} is for the {state['target']} model")
+        
+        model, scaler, holdout, rng = state['model'], state['scaler'], state['holdout'], state['rng']
+        chunks_since_checkpoint = 0
+        
+        for shard in shards:
+            shard_key = os.path.abspath(shard)
+            if shard_key in state['completed_shards']:
+                logger.info(f"Skipping already trained shard {shard}")
+                continue
+            skip = state['chunks_in_shard'] if state['current_shard'] == shard_key else 0
+            state['current_shard'], state['chunks_in_shard'] = shard_key, skip
+            
+            for index, chunk in enumerate(stream_training.iter_shard_chunks(shard, chunk_rows)):
+                if index < skip:
+                    continue
+                
+                X = pipeline.transform(chunk)
+                y = chunk[target_column].to_numpy(dtype=np.float64)
+                
+                # Hold out a random slice of every chunk; it is never trained on
+                is_holdout = rng.random(len(y)) < holdout_fraction
+                holdout.add(X[is_holdout], y[is_holdout])
+                X, y = X[~is_holdout], y[~is_holdout]
+                
+                if len(y):
+                    scaler.partial_fit(X)
+                    model.partial_fit(scaler.transform(X), y)
+                    state['rows_trained'] += len(y)
+                
+                state['chunks_in_shard'] = index + 1
+                chunks_since_checkpoint += 1
+                if chunks_since_checkpoint >= checkpoint_every:
+                    stream_training.save_checkpoint(checkpoint_path, state)
+                    chunks_since_checkpoint = 0
+            
+            state['completed_shards'].append(shard_key)
+            state['current_shard'], state['chunks_in_shard'] = None, 0
+            stream_training.save_checkpoint(checkpoint_path, state)
+            chunks_since_checkpoint = 0
+            logger.info(f"Trained on {shard} ({state['rows_trained']} rows so far)")
+        
+        if state['rows_trained'] == 0:
+            raise ValueError("No training rows were read from the given shards")
+        
+        # Evaluate on the reservoir holdout
+        metrics = {}
+        X_holdout, y_holdout = holdout.sample()
+        if len(y_holdout):
+            y_pred = model.predict(scaler.transform(X_holdout))
+            metrics = {'mae': float(mean_absolute_error(y_holdout, y_pred)),
+                       'r2': float(r2_score(y_holdout, y_pred))}
+            logger.info(f"Streaming {target} model - MAE: {metrics['mae']:.2f}, R²: {metrics['r2']:.3f} "
+                        f"on {len(y_holdout)} holdout rows")
+        
+        model_path, scaler_path = self.save_artifacts(target, model, scaler, pipeline)
+        intervals = None
+        if len(y_holdout) >= 2:
+            # Calibrate on one half of the reservoir, measure coverage on the other
+            half = len(y_holdout) // 2
+            X_holdout_scaled = scaler.transform(X_holdout)
+            intervals = self.calibrate_intervals(
+                target, model, X_holdout_scaled[:half], y_holdout[:half], X_holdout_scaled[half:], y_holdout[half:]
+            )
+        
+        metadata = {
+            'model_type': 'ETA_PREDICTION' if target == 'eta' else 'OCCUPANCY_ESTIMATION',
+            'training_mode': 'streaming',
+            'estimator': type(model).__name__,
+            'features': pipeline.features,
+            'rows_trained': state['rows_trained'],
+            'holdout_rows': len(y_holdout),
+            'metrics': metrics,
+            'intervals': intervals,
+            'shards': state['completed_shards'],
+            'training_date': datetime.now().isoformat(),
+            'model_path': model_path,
+            'scaler_path': scaler_path
+        }
+        
+        metadata_path = os.path.join(self.version_dir, f'{target}_model_metadata.json')
+        with open(metadata_path, 'w') as f:
+            json.dump(metadata, f, indent=2)
+        
+        if publish:
+            self.publish([target])
+        else:
+            logger.info(f"Streaming {target} model written to {self.version_dir}; "
+                        f"call publish(['{target}']) to serve it")
+        return model
+    
+    def load_predictor(self, name):
+        """Return the cached (model, scaler) pair for 'eta' or 'occupancy'"""
+        model_path = model_store.artifact_path(self.models_dir, f'{name}_model.pkl')
+        scaler_path = model_store.artifact_path(self.models_dir, f'{name}_scaler.pkl')
         
         if not os.path.exists(model_path):
-            raise FileNotFoundError("ETA model not found. Please train the model first.")
+            raise FileNotFoundError(f"{name.capitalize()} model not found. Please train the model first.")
         
-        # Load model and scaler
-        model = joblib.load(model_path)
-        scaler = joblib.load(scaler_path)
+        return model_store.registry.get(model_path), model_store.registry.get(scaler_path)
+    
+    @staticmethod
+    def _feature_matrix(features, scaler):
+        """2-D feature matrix in the column order the scaler was fitted on"""
+        columns = getattr(scaler, 'feature_names_in_', None)
+        if hasattr(features, 'columns') and columns is not None:
+            return features[list(columns)]
+        features = np.asarray(features, dtype=float)
+        return features.reshape(1, -1) if features.ndim == 1 else features
+    
+    def predict_eta(self, features):
+        """Predict ETA using trained model"""
+        return float(self.predict_eta_batch([features])[0])
+    
+    def predict_eta_batch(self, features):
+        """Predict ETA for a 2-D array or DataFrame of feature rows"""
+        model, scaler = self.load_predictor('eta')
         
         # Scale features
-        features_scaled = scaler.transform([features])
+        features_scaled = scaler.transform(self._feature_matrix(features, scaler))
         
         # Make prediction
-        eta_minutes = model.predict(features_scaled)[0]
+        eta_minutes = model.predict(features_scaled)
         
-        return max(1, eta_minutes)  # Minimum 1 minute
+        return np.maximum(1, eta_minutes)  # Minimum 1 minute
     
     def predict_occupancy(self, features):
         """Predict occupancy using trained model"""
-        model_path = os.path.join(self.models_dir, 'occupancy_model.pkl')
-        scaler_path = os.path.join(self.models_dir, 'occupancy_scaler.pkl')
-        
-        if not os.path.exists(model_path):
-            raise FileNotFoundError("Occupancy model not found. Please train the model first.")
-        
-        # Load model and scaler
-        model = joblib.load(model_path)
-        scaler = joblib.load(scaler_path)
+        return float(self.predict_occupancy_batch([features])[0])
+    
+    def predict_occupancy_batch(self, features):
+        """Predict occupancy for a 2-D array or DataFrame of feature rows"""
+        model, scaler = self.load_predictor('occupancy')
         
         # Scale features
-        features_scaled = scaler.transform([features])
+        features_scaled = scaler.transform(self._feature_matrix(features, scaler))
         
         # Make prediction
-        occupancy_percentage = model.predict(features_scaled)[0]
+        occupancy_percentage = model.predict(features_scaled)
         
-        return max(0, min(100, occupancy_percentage))  # Clamp between 0-100
+        return np.clip(occupancy_percentage, 0, 100)  # Clamp between 0-100
 
-def main():
-    """Main training function"""
-    logger.info("Starting Urban Mobility Bus Agent ML model training...")
+def train_all(trainer, num_samples=50000, timings=None):
+    """Generate data, train the ETA, occupancy and demand models and publish them
     
-    # Initialize trainer
-    trainer = BusAgentMLTrainer()
+    Wall-clock seconds per stage are recorded into ``timings`` when given.
+    """
+    timings = {} if timings is None else timings
+    
+    def timed(stage, fn, *args):
+        started = time.perf_counter()
+        result = fn(*args)
+        timings[stage] = time.perf_counter() - started
+        return result
     
     # Generate synthetic data
-    df = trainer.generate_synthetic_data(num_samples=50000)
+    df = timed('generate_data', trainer.generate_synthetic_data, num_samples)
     logger.info(f"Generated {len(df)} training samples")
     
     # Train ETA model
-    X_eta, y_eta = trainer.prepare_eta_features(df)
-    eta_model = trainer.train_eta_model(X_eta, y_eta)
+    X_eta, y_eta = timed('prepare_eta_features', trainer.prepare_eta_features, df)
+    eta_model = timed('train_eta_model', trainer.train_eta_model, X_eta, y_eta)
     
     # Train occupancy model
-    occupancy_model = trainer.train_occupancy_model(df)
+    occupancy_model = timed('train_occupancy_model', trainer.train_occupancy_model, df)
+    
+    # Train demand model
+    demand_df = timed('generate_demand_data', trainer.generate_demand_data, num_samples)
+    demand_model = timed('train_demand_model', trainer.train_demand_model, demand_df)
+    
+    # Publish all models as one version
+    timed('publish', trainer.publish)
+    
+    return eta_model, occupancy_model, demand_model
+
+def main():
+    """Main training function"""
+    logger.info("Starting Urban Mobility Bus Agent ML model training...")
+    
+    # Initialize trainer, reusing cached datasets and features across runs
+    cache = None
+    if DATA_CACHE_DIR != "off":
+        cache = DatasetCache(DATA_CACHE_DIR, DATA_CACHE_MAX_MB * 1e6)
+    trainer = BusAgentMLTrainer(cache=cache)
+    
+    # Generate data, train and publish both models
+    train_all(trainer)
+    
+    if cache is not None:
+        logger.info(f"Data cache: {cache.stats()}")
     
     # Test predictions
     logger.info("Testing model predictions...")
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Urban Mobility Bus Agent - Prediction Intervals
+
+Turns the spread of a forest's per-tree predictions into p10/p90 bounds and
+a confidence, calibrated at training time on rows the model was not fitted
+on, and evaluated on another set of unseen rows. The spread comes
+from the same traversal that produces the prediction
+(CompiledTreeEnsemble.predict_spread), so intervals cost one pass.
+
+- Bounds: holdout residuals are divided by each row's spread; the 10th and
+  90th percentiles of those normalized residuals, times a new row's spread,
+  are added to its prediction.
+- Confidence: the holdout rate of predictions landing within tolerance of
+  the actual value (max of an absolute and a relative tolerance), by bins of
+  spread / tolerance, interpolated between bins.
+
+Models without per-tree predictions (gradient boosting) are calibrated with
+a constant spread, which gives plain residual quantiles.
+
+Calibrations are saved as <name>_calibration.json next to the model, and
+<name>_compact_calibration.json for the compact export.
+"""
+
+from typing import Optional
+import json
+import os
+import numpy as np
+
+QUANTILES = (0.1, 0.9)
+CONFIDENCE_BINS = 10
+
+# Columns of the rows returned by IntervalCalibration.apply
+COLUMNS = ('value', 'p10', 'p90', 'confidence')
+
+def calibration_path(directory: str, name: str, compact: bool = False) -> str:
+    return os.path.join(directory, f"{name}_compact_calibration.json" if compact else f"{name}_calibration.json")
+
+class IntervalCalibration:
+    """Maps (prediction, per-tree spread) to p10, p90 and confidence"""
+
+    def __init__(self, kind: str, spread_floor: float, lower: float, upper: float, tolerance_abs: float,
+                 tolerance_rel: float, ratio_points, hit_rates, holdout: Optional[dict] = None):
+        self.kind = kind  # 'tree_spread' or 'residual'
+        self.spread_floor = float(spread_floor)
+        self.lower = float(lower)
+        self.upper = float(upper)
+        self.tolerance_abs = float(tolerance_abs)
+        self.tolerance_rel = float(tolerance_rel)
+        self.ratio_points = np.asarray(ratio_points, dtype=np.float64)
+        self.hit_rates = np.asarray(hit_rates, dtype=np.float64)
+        self.holdout = holdout or {}
+
+    @property
+    def uses_spread(self) -> bool:
+        return self.kind == 'tree_spread'
+
+    def _effective_spread(self, prediction: np.ndarray, spread: Optional[np.ndarray]) -> np.ndarray:
+        # The floor keeps rows where every tree agrees from getting zero-width intervals
+        spread = np.ones_like(prediction) if spread is None or not self.uses_spread else spread
+        return np.hypot(spread, self.spread_floor)
+
+    def _tolerance(self, prediction: np.ndarray) -> np.ndarray:
+        return np.maximum(self.tolerance_abs, self.tolerance_rel * np.abs(prediction))
+
+    @classmethod
+    def fit(cls, prediction, y, spread=None, tolerance_abs: float = 1.0, tolerance_rel: float = 0.0,
+            bins: int = CONFIDENCE_BINS) -> "IntervalCalibration":
+        """Calibrate on holdout predictions, targets and (for forests) per-tree spreads"""
+        prediction = np.asarray(prediction, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        kind = 'residual' if spread is None else 'tree_spread'
+        spread = np.ones_like(prediction) if spread is None else np.asarray(spread, dtype=np.float64)
+        floor = max(float(np.percentile(spread, 5)), 1e-6)
+
+        calibration = cls(kind, floor, 0.0, 0.0, tolerance_abs, tolerance_rel, [0.0], [0.0])
+        effective = calibration._effective_spread(prediction, spread)
+        residual = y - prediction
+        calibration.lower, calibration.upper = np.percentile(residual / effective, [100 * q for q in QUANTILES])
+
+        # Hit rate within tolerance by quantile bins of spread relative to tolerance
+        tolerance = calibration._tolerance(prediction)
+        ratio = effective / tolerance
+        hit = np.abs(residual) <= tolerance
+        edges = np.unique(np.quantile(ratio, np.linspace(0, 1, bins + 1)))
+        points, rates = [], []
+        if len(edges) < 2:
+            points, rates = [float(ratio.mean())], [float(hit.mean())]
+        else:
+            bin_index = np.clip(np.searchsorted(edges, ratio, side='right') - 1, 0, len(edges) - 2)
+            for index in range(len(edges) - 1):
+                members = bin_index == index
+                if members.any():
+                    points.append(float(np.median(ratio[members])))
+                    rates.append(float(hit[members].mean()))
+        # A wider spread relative to the tolerance never raises confidence
+        calibration.ratio_points = np.asarray(points)
+        calibration.hit_rates = np.minimum.accumulate(rates)
+        return calibration
+
+    def evaluate(self, prediction, y, spread=None) -> dict:
+        """Coverage, width and confidence of the intervals on rows they were not calibrated on"""
+        prediction = np.asarray(prediction, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        rows = self.apply(prediction, spread)
+        return {
+            'rows': int(len(y)),
+            'interval_coverage': float(np.mean((y >= rows[:, 1]) & (y <= rows[:, 2]))),
+            'mean_interval_width': float(np.mean(rows[:, 2] - rows[:, 1])),
+            'within_tolerance': float(np.mean(np.abs(y - prediction) <= self._tolerance(prediction))),
+            'mean_confidence': float(rows[:, 3].mean())
+        }
+
+    def apply(self, prediction, spread=None) -> np.ndarray:
+        """(n, 4) rows of prediction, p10, p90 and confidence"""
+        prediction = np.asarray(prediction, dtype=np.float64)
+        effective = self._effective_spread(prediction, spread)
+        confidence = np.interp(effective / self._tolerance(prediction), self.ratio_points, self.hit_rates)
+        return np.column_stack([
+            prediction,
+            prediction + self.lower * effective,
+            prediction + self.upper * effective,
+            confidence
+        ])
+
+    def to_dict(self) -> dict:
+        return {
+            'kind': self.kind,
+            'quantiles': list(QUANTILES),
+            'spread_floor': self.spread_floor,
+            'lower': self.lower,
+            'upper': self.upper,
+            'tolerance_abs': self.tolerance_abs,
+            'tolerance_rel': self.tolerance_rel,
+            'ratio_points': self.ratio_points.tolist(),
+            'hit_rates': self.hit_rates.tolist(),
+            'holdout': self.holdout
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "IntervalCalibration":
+        if tuple(data.get('quantiles', QUANTILES)) != QUANTILES:
+            raise ValueError(f"Calibration is for quantiles {data['quantiles']}, expected {list(QUANTILES)}")
+        return cls(
+            data['kind'], data['spread_floor'], data['lower'], data['upper'], data['tolerance_abs'],
+            data['tolerance_rel'], data['ratio_points'], data['hit_rates'], data.get('holdout')
+        )
+
+    def save(self, path: str):
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    @classmethod
+    def load(cls, path: str) -> "IntervalCalibration":
+        with open(path) as f:
+            return cls.from_dict(json.load(f))
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Urban Mobility Bus Agent - Columnar Wire Format
+
+Binary batch encoding for the ML service (content type
+application/x-bus-columns). A body is a header followed by one raw
+little-endian array per column, so decoding is a set of np.frombuffer views
+over the request bytes.
+
+Layout (all integers little-endian):
+- header: magic b"BUSC", uint8 version (1), uint8 reserved, uint16 column
+  count, uint32 row count
+- directory, per column: uint8 name length, ASCII name, 1-byte type code
+  (see DTYPES)
+- zero padding to an 8-byte boundary, then each column's rows back to back,
+  every column padded to the next 8-byte boundary
+
+Categorical inputs are sent as vocabulary codes under the encoded feature
+name (e.g. route_encoded), using the codes published by the service's
+schema endpoint.
+"""
+
+from typing import Dict
+import numpy as np
+import struct
+
+MAGIC = b"BUSC"
+VERSION = 1
+CONTENT_TYPE = "application/x-bus-columns"
+
+HEADER = struct.Struct('<4sBBHI')
+ALIGNMENT = 8
+
+# Type code -> NumPy dtype
+DTYPES = {
+    b'd': np.dtype('<f8'),
+    b'f': np.dtype('<f4'),
+    b'q': np.dtype('<i8'),
+    b'i': np.dtype('<i4'),
+    b'h': np.dtype('<i2'),
+    b'b': np.dtype('i1'),
+    b'B': np.dtype('u1'),
+    b'?': np.dtype('?')
+}
+TYPE_CODES = {dtype: code for code, dtype in DTYPES.items()}
+
+class WireFormatError(ValueError):
+    """Body does not follow the columnar layout"""
+
+def _padded(offset: int) -> int:
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+def encode_columns(columns: Dict[str, np.ndarray]) -> bytes:
+    """Encode equal-length 1-D arrays; dtypes are converted to little-endian"""
+    arrays = {}
+    for name, values in columns.items():
+        array = np.asarray(values)
+        if array.ndim != 1:
+            raise WireFormatError(f"Column {name} is not one-dimensional")
+        dtype = array.dtype.newbyteorder('<') if array.dtype.byteorder == '>' else array.dtype
+        if dtype not in TYPE_CODES:
+            raise WireFormatError(f"Column {name} has unsupported dtype {array.dtype}")
+        arrays[name] = array.astype(dtype, copy=False)
+
+    lengths = {len(array) for array in arrays.values()}
+    if len(lengths) > 1:
+        raise WireFormatError("Columns have different lengths")
+    rows = lengths.pop() if lengths else 0
+
+    parts = [HEADER.pack(MAGIC, VERSION, 0, len(arrays), rows)]
+    for name, array in arrays.items():
+        encoded_name = name.encode('ascii')
+        parts.append(struct.pack('<B', len(encoded_name)) + encoded_name + TYPE_CODES[array.dtype])
+    size = sum(len(part) for part in parts)
+    parts.append(b"\0" * (_padded(size) - size))
+    for array in arrays.values():
+        data = array.tobytes()
+        parts.append(data + b"\0" * (_padded(len(data)) - len(data)))
+    return b"".join(parts)
+
+def decode_columns(body) -> Dict[str, np.ndarray]:
+    """Read-only array views over a columnar body"""
+    buffer = memoryview(body)
+    if len(buffer) < HEADER.size:
+        raise WireFormatError("Body is shorter than the header")
+    magic, version, _, ncols, rows = HEADER.unpack_from(buffer)
+    if magic != MAGIC:
+        raise WireFormatError("Bad magic; expected BUSC")
+    if version != VERSION:
+        raise WireFormatError(f"Unsupported wire format version: {version}")
+
+    offset = HEADER.size
+    directory = []
+    for _ in range(ncols):
+        if offset >= len(buffer):
+            raise WireFormatError("Truncated column directory")
+        name_length = buffer[offset]
+        end = offset + 1 + name_length
+        if end + 1 > len(buffer):
+            raise WireFormatError("Truncated column directory")
+        name = bytes(buffer[offset + 1:end]).decode('ascii', errors='replace')
+        code = bytes(buffer[end:end + 1])
+        if code not in DTYPES:
+            raise WireFormatError(f"Column {name} has unknown type code {code!r}")
+        directory.append((name, DTYPES[code]))
+        offset = end + 1
+
+    columns = {}
+    offset = _padded(offset)
+    for name, dtype in directory:
+        size = rows * dtype.itemsize
+        if offset + size > len(buffer):
+            raise WireFormatError(f"Column {name} is truncated")
+        columns[name] = np.frombuffer(buffer, dtype=dtype, count=rows, offset=offset)
+        offset = _padded(offset + size)
+    return columns
@@ -0,0 +1,140 @@
+import json
+import math
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.preprocessing import StandardScaler
+
+import ml_service
+import train_models
+from result_cache import FakeRedis, RedisResultCache
+
+REQUEST = dict(
+    latitude=40.7128, longitude=-74.0060, hour=8, day_of_week=1, is_weekend=False,
+    weather_condition='RAINY', traffic_level='HIGH', route_id='ROUTE_1',
+    distance_km=5.0, avg_speed=25.0, occupancy_percentage=60.0
+)
+
+@pytest.fixture(scope='module')
+def models_dir(tmp_path_factory):
+    """A published version with small ETA and occupancy forests"""
+    directory = str(tmp_path_factory.mktemp('models'))
+    trainer = train_models.BusAgentMLTrainer(models_dir=directory)
+    df = trainer.generate_synthetic_data(3000)
+    for name, pipeline, target in (('eta', trainer.eta_pipeline, 'eta_minutes'),
+                                   ('occupancy', trainer.occupancy_pipeline, 'occupancy_percentage')):
+        X, y = trainer.prepare_features(pipeline, df, target)
+        scaler = StandardScaler().fit(X)
+        model = RandomForestRegressor(n_estimators=10, max_depth=8, random_state=0).fit(scaler.transform(X), y)
+        trainer.save_artifacts(name, model, scaler, pipeline)
+    trainer.publish()
+    return directory
+
+@pytest.fixture
+def service(models_dir):
+    service = ml_service.MLService(models_dir=models_dir)
+    assert service.bundle.eta_ready and service.bundle.occupancy_ready
+    yield service
+    service.executor.shutdown(wait=False)
+
+def batch_items():
+    return [
+        REQUEST,
+        dict(REQUEST, distance_km=12.0),
+        {'latitude': 40.7},
+        dict(REQUEST, latitude=float('nan')),
+        dict(REQUEST, avg_speed=float('inf')),
+        dict(REQUEST, route_id='ROUTE_99')
+    ]
+
+def test_batch_reports_errors_per_item(service):
+    response = service.predict_eta_batch(batch_items())
+
+    assert (response.succeeded, response.failed) == (3, 3)
+    assert [item.index for item in response.predictions] == list(range(6))
+    for index in (0, 1, 5):
+        assert response.predictions[index].error is None
+        assert response.predictions[index].eta_minutes > 0
+    assert 'longitude: Field required' in response.predictions[2].error
+    assert response.predictions[3].error == 'latitude: Input should be a finite number'
+    assert response.predictions[4].error == 'avg_speed: Input should be a finite number'
+
+def test_batch_matches_single_predictions(service):
+    response = service.predict_eta_batch([REQUEST, dict(REQUEST, distance_km=12.0)])
+    single = service.predict_eta(ml_service.ETAPredictionRequest(**REQUEST))
+    assert response.predictions[0].eta_minutes == pytest.approx(single.eta_minutes)
+
+@pytest.mark.parametrize('backend', ['memory', 'redis'])
+def test_batch_is_answered_from_the_cache(service, backend):
+    if backend == 'redis':
+        service.eta_cache = RedisResultCache(FakeRedis(), ttl_seconds=30)
+    first = service.predict_eta_batch(batch_items())
+    second = service.predict_eta_batch(batch_items())
+
+    assert [item.eta_minutes for item in second.predictions] == [item.eta_minutes for item in first.predictions]
+    stats = service.eta_cache.stats()
+    # The three valid items miss once each, then hit
+    assert (stats['hits'], stats['misses']) == (3, 3)
+
+def test_batch_without_cache(service):
+    service.eta_cache = None
+    response = service.predict_eta_batch(batch_items())
+    assert (response.succeeded, response.failed) == (3, 3)
+
+def test_batch_size_limit(service, monkeypatch):
+    monkeypatch.setattr(ml_service, 'MAX_BATCH_SIZE', 2)
+    with pytest.raises(ml_service.HTTPException) as error:
+        service.predict_eta_batch(batch_items())
+    assert error.value.status_code == 413
+
+def test_occupancy_batch_reports_errors_per_item(service):
+    items = [REQUEST, {'hour': 8}, dict(REQUEST, hour=18, weather_condition='SNOWY')]
+    response = service.predict_occupancy_batch(items)
+
+    assert (response.succeeded, response.failed) == (2, 1)
+    assert response.predictions[1].error is not None
+    assert 0 <= response.predictions[0].occupancy_percentage <= 100
+
+@pytest.fixture
+def client(service, monkeypatch):
+    monkeypatch.setattr(ml_service, 'ml_service', service)
+    with TestClient(ml_service.app) as client:
+        deadline = time.monotonic() + 30
+        while not service.ready and time.monotonic() < deadline:
+            time.sleep(0.05)
+        yield client
+
+@pytest.mark.parametrize('value', ['NaN', 'Infinity', '1e400'])
+def test_single_prediction_rejects_non_finite_numbers(client, value):
+    body = json.dumps(REQUEST).replace('40.7128', value)
+    response = client.post('/predict/eta', content=body, headers={'content-type': 'application/json'})
+
+    assert response.status_code == 422
+    assert response.json()['detail'][0]['loc'] == ['body', 'latitude']
+
+def test_batch_endpoint_keeps_non_finite_items_per_item(client):
+    body = json.dumps({'requests': batch_items()})  # NaN/Infinity literals, as JavaScript clients can send
+    response = client.post('/predict/eta/batch', content=body, headers={'content-type': 'application/json'})
+
+    assert response.status_code == 200
+    assert (response.json()['succeeded'], response.json()['failed']) == (3, 3)
+
+def test_stream_reports_failing_records_in_place(client, service, monkeypatch):
+    predict_batch = service.predict_eta_batch
+
+    def fail_on_long_trips(items):
+        if any(item.get('distance_km', 0) > 10 for item in items):
+            raise RuntimeError("model error")
+        return predict_batch(items)
+
+    monkeypatch.setattr(service, 'predict_eta_batch', fail_on_long_trips)
+    lines = [json.dumps(REQUEST), json.dumps(dict(REQUEST, distance_km=12.0)), 'not json', json.dumps(REQUEST)]
+    response = client.post('/predict/eta/stream', content='\n'.join(lines) + '\n')
+
+    assert response.status_code == 200
+    results = [json.loads(line) for line in response.text.splitlines()]
+    assert [result['index'] for result in results] == [0, 1, 2, 3]
+    assert [result['error'] is None for result in results] == [True, False, False, True]
+    assert all(math.isfinite(result['eta_minutes']) for result in results if result['error'] is None)
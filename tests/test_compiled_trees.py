@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+from sklearn.ensemble import ExtraTreesRegressor, GradientBoostingRegressor, RandomForestRegressor
+from sklearn.linear_model import LinearRegression
+from sklearn.tree import DecisionTreeRegressor
+
+from compiled_trees import CompiledTreeEnsemble, compile_model
+
+@pytest.fixture(scope='module')
+def data():
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(600, 6))
+    y = 3 * X[:, 0] - 2 * X[:, 1] * X[:, 2] + rng.normal(scale=0.5, size=600)
+    return X[:400], y[:400], X[400:]
+
+MODELS = {
+    'random_forest': lambda: RandomForestRegressor(n_estimators=15, max_depth=8, random_state=0),
+    'extra_trees': lambda: ExtraTreesRegressor(n_estimators=15, max_depth=8, random_state=0),
+    'gradient_boosting': lambda: GradientBoostingRegressor(n_estimators=30, max_depth=3, random_state=0),
+    'decision_tree': lambda: DecisionTreeRegressor(max_depth=10, random_state=0)
+}
+
+@pytest.mark.parametrize('name', MODELS)
+def test_compiled_predictions_match_sklearn(name, data):
+    X_train, y_train, X_test = data
+    model = MODELS[name]().fit(X_train, y_train)
+    engine = CompiledTreeEnsemble.from_model(model)
+
+    np.testing.assert_allclose(engine.predict(X_test), model.predict(X_test), atol=1e-3)
+    for row in X_test[:20]:
+        assert engine.predict_one(row) == pytest.approx(model.predict(row.reshape(1, -1))[0], abs=1e-3)
+    assert engine.check_parity(model, X_test) <= 1e-3
+
+@pytest.mark.parametrize('name', ['random_forest', 'extra_trees'])
+def test_spread_is_the_per_tree_deviation(name, data):
+    X_train, y_train, X_test = data
+    model = MODELS[name]().fit(X_train, y_train)
+    engine = CompiledTreeEnsemble.from_model(model)
+
+    mean, spread = engine.predict_spread(X_test)
+    per_tree = np.stack([tree.predict(X_test) for tree in model.estimators_], axis=1)
+    np.testing.assert_allclose(mean, model.predict(X_test), atol=1e-3)
+    np.testing.assert_allclose(spread, per_tree.std(axis=1), atol=1e-3)
+
+    # The single-row path gathers the same leaves
+    one_mean, one_spread = engine.predict_spread(X_test[:1])
+    assert one_mean[0] == pytest.approx(mean[0], abs=1e-6)
+    assert one_spread[0] == pytest.approx(spread[0], abs=1e-6)
+
+def test_boosting_has_no_spread(data):
+    X_train, y_train, X_test = data
+    engine = CompiledTreeEnsemble.from_model(MODELS['gradient_boosting']().fit(X_train, y_train))
+    with pytest.raises(ValueError):
+        engine.predict_spread(X_test)
+
+def test_saved_arrays_round_trip(data, tmp_path):
+    X_train, y_train, X_test = data
+    model = MODELS['random_forest']().fit(X_train, y_train)
+    engine = CompiledTreeEnsemble.from_model(model)
+
+    engine.save(str(tmp_path / 'engine'))
+    engine.save_compressed(str(tmp_path / 'compact.npz'))
+    for loaded in (CompiledTreeEnsemble.load(str(tmp_path / 'engine')),
+                   CompiledTreeEnsemble.load_compressed(str(tmp_path / 'compact.npz'))):
+        np.testing.assert_array_equal(loaded.predict(X_test), engine.predict(X_test))
+
+def test_unpruned_copy_predicts_the_same(data):
+    X_train, y_train, X_test = data
+    engine = CompiledTreeEnsemble.from_model(MODELS['random_forest']().fit(X_train, y_train))
+    np.testing.assert_allclose(engine.prune().predict(X_test), engine.predict(X_test), atol=1e-5)
+    assert engine.prune(n_trees=5, max_depth=3).n_trees == 5
+
+def test_unsupported_models_fall_back_to_sklearn(data):
+    X_train, y_train, _ = data
+    model = LinearRegression().fit(X_train, y_train)
+    with pytest.raises(TypeError):
+        CompiledTreeEnsemble.from_model(model)
+    assert compile_model(model) is None
+    assert compile_model(None) is None
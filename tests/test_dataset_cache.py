@@ -0,0 +1,84 @@
+import errno
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import dataset_cache
+from dataset_cache import DatasetCache, cache_key, source_digest
+
+def test_cache_key_depends_on_every_parameter():
+    key = cache_key(rows=100, seed=1)
+    assert key == cache_key(seed=1, rows=100)
+    assert key != cache_key(rows=100, seed=2)
+
+def test_source_digest_changes_with_the_source():
+    def first():
+        return 1
+
+    def second():
+        return 2
+
+    assert source_digest(first) != source_digest(second)
+
+def test_put_and_get(tmp_path):
+    cache = DatasetCache(str(tmp_path), max_bytes=1e6)
+    X = np.arange(12, dtype=np.float64).reshape(4, 3)
+
+    assert cache.get('a' * 64) is None
+    assert cache.put('a' * 64, {'X': X, 'y': X[:, 0]})
+    arrays = cache.get('a' * 64)
+
+    np.testing.assert_array_equal(arrays['X'], X)
+    assert isinstance(arrays['X'], np.memmap) and not arrays['X'].flags.writeable
+    assert (cache.hits, cache.misses) == (1, 1)
+
+def test_frame_round_trip_keeps_categoricals(tmp_path):
+    cache = DatasetCache(str(tmp_path), max_bytes=1e6)
+    df = pd.DataFrame({
+        'route_id': pd.Categorical(['ROUTE_2', 'ROUTE_1', 'ROUTE_2']),
+        'hour': np.array([7, 8, 9], dtype=np.int8)
+    })
+
+    assert cache.put_frame('f' * 64, df)
+    loaded = cache.get_frame('f' * 64)
+    assert loaded['route_id'].tolist() == ['ROUTE_2', 'ROUTE_1', 'ROUTE_2']
+    assert loaded['hour'].tolist() == [7, 8, 9]
+    assert cache.get_frame('0' * 64) is None
+
+def test_entries_over_the_limit_are_not_stored(tmp_path):
+    cache = DatasetCache(str(tmp_path), max_bytes=100)
+    assert not cache.put('a' * 64, {'X': np.zeros(100)})
+    assert cache.entries() == []
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = DatasetCache(str(tmp_path), max_bytes=2000)
+    for index, key in enumerate(('a' * 64, 'b' * 64)):
+        cache.put(key, {'X': np.zeros(100)})
+        # Distinct last-use times, oldest first
+        os.utime(os.path.join(str(tmp_path), key, dataset_cache.ENTRY), (1000 + index, 1000 + index))
+
+    cache.put('c' * 64, {'X': np.zeros(100)})
+    assert [key for _, _, key in cache.entries()] == ['b' * 64, 'c' * 64]
+    assert cache.evictions == 1
+    assert cache.stats()['bytes'] == 1600
+
+def test_write_failures_are_reported(tmp_path, monkeypatch):
+    cache = DatasetCache(str(tmp_path), max_bytes=1e6)
+
+    def disk_full(*args, **kwargs):
+        raise OSError(errno.ENOSPC, "No space left on device")
+
+    monkeypatch.setattr(dataset_cache.np, 'save', disk_full)
+    assert not cache.put('a' * 64, {'X': np.zeros(10)})
+    assert os.listdir(str(tmp_path)) == []
+
+def test_losing_a_write_race_keeps_the_existing_entry(tmp_path):
+    cache = DatasetCache(str(tmp_path), max_bytes=1e6)
+    assert cache.put('a' * 64, {'X': np.ones(10)})
+    # Same key written again, as a concurrent process would
+    assert cache.put('a' * 64, {'X': np.ones(10)})
+    np.testing.assert_array_equal(cache.get('a' * 64)['X'], np.ones(10))
+    assert len(cache.entries()) == 1
+    assert not any('.tmp.' in name for name in os.listdir(str(tmp_path)))
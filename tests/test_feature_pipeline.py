@@ -0,0 +1,82 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from feature_pipeline import FeaturePipeline, MODEL_FEATURES, day_type
+
+def raw_frame(n=200, seed=0):
+    """Raw inputs for every model, with some categories outside the vocabularies"""
+    rng = np.random.default_rng(seed)
+    day_of_week = rng.integers(0, 7, n)
+    return pd.DataFrame({
+        'latitude': rng.uniform(40.6, 40.8, n),
+        'longitude': rng.uniform(-74.1, -73.9, n),
+        'hour': rng.integers(0, 24, n),
+        'minute': rng.integers(0, 60, n),
+        'day_of_week': day_of_week,
+        'is_weekend': day_of_week >= 5,
+        'weather_condition': rng.choice(['SUNNY', 'CLOUDY', 'RAINY', 'SNOWY', 'FOGGY'], n),
+        'traffic_level': rng.choice(['LOW', 'MEDIUM', 'HIGH', 'GRIDLOCK'], n),
+        'route_id': rng.choice([f"ROUTE_{i}" for i in range(1, 12)], n),
+        'day_type': day_type(day_of_week),
+        'distance_km': rng.uniform(0.1, 20, n),
+        'avg_speed': rng.uniform(5, 60, n),
+        'occupancy_percentage': rng.uniform(0, 100, n)
+    })
+
+def records(df):
+    return [SimpleNamespace(**row) for row in df.to_dict('records')]
+
+@pytest.mark.parametrize('model', sorted(MODEL_FEATURES))
+def test_transform_matches_transform_record(model):
+    pipeline = FeaturePipeline.for_model(model)
+    df = raw_frame()
+    matrix = pipeline.transform(df)
+
+    assert matrix.shape == (len(df), pipeline.n_features)
+    np.testing.assert_allclose(matrix, np.array([pipeline.transform_record(record) for record in records(df)]))
+    np.testing.assert_allclose(pipeline.transform_records(records(df)), matrix)
+
+def test_unknown_categories_get_the_default_code():
+    pipeline = FeaturePipeline.for_model('eta')
+    column = pipeline.features.index('weather_encoded')
+    df = raw_frame(5).assign(weather_condition=['FOGGY', 'SUNNY', 'CLOUDY', 'RAINY', 'SNOWY'])
+
+    assert pipeline.transform(df)[:, column].tolist() == [0, 0, 1, 2, 3]
+    assert pipeline.transform_record(records(df)[0])[column] == 0
+
+def test_minute_is_optional():
+    pipeline = FeaturePipeline.for_model('occupancy')
+    df = raw_frame(20).drop(columns='minute')
+    column = pipeline.features.index('time_of_day')
+
+    matrix = pipeline.transform(df)
+    np.testing.assert_array_equal(matrix[:, column], df['hour'])
+    np.testing.assert_allclose(matrix, [pipeline.transform_record(record) for record in records(df)])
+
+def test_codes_stand_in_for_raw_categories():
+    pipeline = FeaturePipeline.for_model('eta')
+    df = raw_frame(50)
+    coded = df.drop(columns='route_id').assign(route_encoded=pipeline.encode('route_encoded', df['route_id']))
+
+    assert pipeline.missing_inputs(coded) == []
+    np.testing.assert_array_equal(pipeline.transform(coded), pipeline.transform(df))
+    with pytest.raises(ValueError):
+        pipeline.transform(df.assign(route_encoded=1.5))
+
+def test_schema_round_trip(tmp_path):
+    pipeline = FeaturePipeline.for_model('eta')
+    path = str(tmp_path / 'eta_schema.json')
+    pipeline.save(path)
+    loaded = FeaturePipeline.load(path)
+
+    assert loaded.to_dict() == pipeline.to_dict()
+    df = raw_frame(30)
+    np.testing.assert_array_equal(loaded.transform(df), pipeline.transform(df))
+
+def test_legacy_schema_numbers_categories_in_sorted_order():
+    pipeline = FeaturePipeline.legacy('eta')
+    assert pipeline.vocabulary('weather_encoded') == ['CLOUDY', 'RAINY', 'SNOWY', 'SUNNY']
+    assert pipeline.encode('weather_encoded', ['SUNNY', 'CLOUDY']).tolist() == [3, 0]
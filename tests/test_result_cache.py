@@ -0,0 +1,97 @@
+import time
+from types import SimpleNamespace
+
+from result_cache import ETACacheKeyer, FakeRedis, InProcessCache, KEY_PREFIX, RedisResultCache, parse_buckets
+
+import pytest
+
+ROW = [12.5, 10.0, 15.0, 0.8]
+
+def eta_request(**overrides):
+    fields = dict(
+        latitude=40.7128, longitude=-74.0060, hour=8, minute=10, day_of_week=1, is_weekend=False,
+        weather_condition='RAINY', traffic_level='HIGH', route_id='ROUTE_1',
+        distance_km=5.0, avg_speed=25.0, occupancy_percentage=60.0
+    )
+    fields.update(overrides)
+    return SimpleNamespace(**fields)
+
+def test_keyer_shares_keys_within_a_bucket():
+    keyer = ETACacheKeyer()
+    key = keyer.key(eta_request(), 'v1')
+    assert key.startswith(f"{KEY_PREFIX}:v1:")
+    assert keyer.key(eta_request(latitude=40.71282, avg_speed=25.2), 'v1') == key
+    assert keyer.key(eta_request(distance_km=7.0), 'v1') != key
+    assert keyer.key(eta_request(route_id='ROUTE_2'), 'v1') != key
+    assert keyer.key(eta_request(), 'v2') != key
+
+@pytest.mark.parametrize('value', [float('nan'), float('inf'), float('-inf')])
+def test_keyer_has_no_key_for_non_finite_fields(value):
+    assert ETACacheKeyer().key(eta_request(latitude=value), 'v1') is None
+
+def test_parse_buckets_rejects_unknown_fields():
+    assert parse_buckets('avg_speed=2')['avg_speed'] == 2.0
+    with pytest.raises(ValueError):
+        parse_buckets('speed=2')
+
+def test_redis_cache_round_trip():
+    cache = RedisResultCache(FakeRedis(), ttl_seconds=30)
+    assert cache.get('a') is None
+    cache.set('a', ROW)
+    assert cache.get('a') == ROW
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['misses'] == 1
+
+def test_redis_cache_bulk_round_trip():
+    client = FakeRedis()
+    cache = RedisResultCache(client, ttl_seconds=30)
+    cache.set_many({'a': ROW, 'b': [1.0, 0.5, 1.5, 0.9]})
+    assert cache.get_many(['a', 'missing', 'b']) == [ROW, None, [1.0, 0.5, 1.5, 0.9]]
+    assert cache.get_many([]) == []
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['errors']) == (2, 1, 0)
+
+@pytest.mark.parametrize('stored', ['12.5', '[1, 2, 3]', '[1, 2, 3, "x"]', '[true, 1, 2, 3]', 'not json'])
+def test_redis_cache_treats_foreign_values_as_misses(stored):
+    client = FakeRedis()
+    client.set('a', stored)
+    cache = RedisResultCache(client)
+    assert cache.get('a') is None
+    assert cache.get_many(['a']) == [None]
+    assert cache.stats()['misses'] == 2
+
+def test_redis_cache_entries_expire():
+    cache = RedisResultCache(FakeRedis(), ttl_seconds=0.01)
+    cache.set_many({'a': ROW})
+    time.sleep(0.05)
+    assert cache.get('a') is None
+
+def test_redis_cache_errors_are_misses():
+    class BrokenClient:
+        def get(self, key):
+            raise ConnectionError("down")
+        mget = get
+
+        def set(self, *args, **kwargs):
+            raise ConnectionError("down")
+
+    cache = RedisResultCache(BrokenClient())
+    assert cache.get('a') is None
+    assert cache.get_many(['a', 'b']) == [None, None]
+    cache.set('a', ROW)
+    assert cache.stats()['errors'] == 3
+
+def test_in_process_cache_evicts_least_recently_used():
+    cache = InProcessCache(max_entries=2, ttl_seconds=30)
+    cache.set_many({'a': ROW, 'b': ROW})
+    assert cache.get('a') == ROW
+    cache.set('c', ROW)
+    assert cache.get_many(['a', 'b', 'c']) == [ROW, None, ROW]
+    assert cache.stats()['evictions'] == 1
+
+def test_in_process_cache_entries_expire():
+    cache = InProcessCache(ttl_seconds=0.01)
+    cache.set('a', ROW)
+    time.sleep(0.05)
+    assert cache.get('a') is None
+    assert cache.stats()['entries'] == 0